@@ -1,150 +1,235 @@
 import json
 import os
-from datetime import datetime, timedelta
+import re
+import time
 import streamlit as st
 from dotenv import load_dotenv
 
-# ────────────────────────────────────────────────
-# Import required functions from mail_service.py
-# ────────────────────────────────────────────────
-from mail_service import list_emails, get_email_detail
-
 # ────────────────────────────────────────────────
 # Load environment variables
 # ────────────────────────────────────────────────
 load_dotenv()
 
-GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-if not GEMINI_API_KEY:
-    raise ValueError("GEMINI_API_KEY not found in .env file. Please add it.")
-
 # ────────────────────────────────────────────────
-# Google Generative AI
+# Model backend (Gemini by default, MODEL_BACKEND=fake offline)
 # ────────────────────────────────────────────────
-import google.generativeai as genai
+import metrics
+from local_parser import parse_locally
+from model_backend import MODEL_UNAVAILABLE_ERRORS, get_model, with_thinking_cap
+from model_guard import CircuitOpenError, ModelGuard
+from partial_json import StreamingCommand
+from tracing import span, traced
+
+model = get_model()
+guard = ModelGuard(model)
+
 
-genai.configure(api_key=GEMINI_API_KEY)
+def _record_model_metrics(elapsed, prompt_tokens, output_tokens):
+    metrics.MODEL_LATENCY.observe(elapsed, backend=type(model).__name__)
+    metrics.MODEL_TOKENS.inc(prompt_tokens, kind='prompt')
+    metrics.MODEL_TOKENS.inc(output_tokens, kind='output')
 
-# Use a model that exists in your list
-model = genai.GenerativeModel("gemini-2.5-flash")
 
 # ────────────────────────────────────────────────
 # Parse user command into structured action
 # ────────────────────────────────────────────────
-def parse_command(user_input, current_view, current_email_id=None):
-    """
-    Parse natural language command into structured action using Gemini.
-    Returns dict with 'action' and 'params'.
-    """
-    prompt = f"""
+ACTIONS = ["compose", "filter_inbox", "open_email", "reply", "mark_read", "mark_unread",
+           "archive", "trash", "label", "count", "summarize", "unknown"]
+
+# Structured output: the model can only emit this object, so no fences or prose
+RESPONSE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "action": {"type": "string", "enum": ACTIONS},
+        "params": {
+            "type": "object",
+            "properties": {
+                "to": {"type": "string"},
+                "subject": {"type": "string"},
+                "body": {"type": "string"},
+                "unread": {"type": "boolean"},
+                "sender": {"type": "string"},
+                "keyword": {"type": "string"},
+                "date_range": {"type": "string"},
+                "label": {"type": "string"},
+            },
+        },
+    },
+    "required": ["action", "params"],
+}
+
+FULL_PROMPT = """
 You are an AI assistant that parses user commands for an email app.
 Extract the intent and parameters strictly as JSON.
 
 User command: "{user_input}"
 
 Current view: {current_view}
-Current open email ID (if in detail view): {current_email_id or 'None'}
+Current open email ID (if in detail view): {current_email_id}
 
 Possible actions:
 - "compose": Open compose view and fill to, subject, body
 - "filter_inbox": Apply filters to inbox (params: unread (bool), sender (str), keyword (str), date_range (str like "last 10 days" or "this week"))
 - "open_email": Open a specific email (params: sender or keyword to find latest match)
 - "reply": Reply to current open email (no extra params needed)
+- "mark_read" / "mark_unread": Mark every email currently shown as read / unread
+- "archive": Archive every email currently shown
+- "trash": Move every email currently shown to trash
+- "label": Apply a label to every email currently shown (params: label (str))
+- "count": Say how many (unread) emails a label holds, e.g. "how many unread do I have" (params: label (str, default inbox), unread (bool))
+- "summarize": Summarize the thread of the current open email (no extra params needed)
 - "unknown": If command doesn't match
 
 Respond **only** with valid JSON, no extra text, no markdown, no explanations:
 {{
-  "action": "compose" | "filter_inbox" | "open_email" | "reply" | "unknown",
+  "action": "compose" | "filter_inbox" | "open_email" | "reply" | "mark_read" | "mark_unread" | "archive" | "trash" | "label" | "count" | "summarize" | "unknown",
   "params": {{ ... relevant key-value pairs ... }}
 }}
 """
 
+# Schema carries the output format, so the prompt only needs the semantics
+COMPACT_PROMPT = """Parse an email app command into action + params.
+compose: to,subject,body | filter_inbox: unread,sender,keyword,date_range ("last 10 days"/"this week") | open_email: sender or keyword | reply | mark_read, mark_unread, archive, trash: emails shown | label: label | count: label,unread ("how many unread") | summarize: open email's thread | unknown
+View: {current_view}; open email: {current_email_id}
+Command: "{user_input}"
+"""
+
+PROMPT_VARIANTS = {
+    "full": (FULL_PROMPT, with_thinking_cap({
+        "temperature": 0.2,
+        "top_p": 0.95,
+        "max_output_tokens": 1024,
+        "response_mime_type": "application/json",
+    })),
+    "compact": (COMPACT_PROMPT, with_thinking_cap({
+        "temperature": 0.2,
+        "top_p": 0.95,
+        # Visible answer only: the largest (compose with a dictated body) is
+        # well under this. Thinking tokens count against it too, hence the cap.
+        "max_output_tokens": 256,
+        "response_mime_type": "application/json",
+        "response_schema": RESPONSE_SCHEMA,
+    })),
+}
+PROMPT_VARIANT = os.getenv("PROMPT_VARIANT", "compact")
+
+
+def build_prompt(user_input, current_view, current_email_id=None, variant=None):
+    """Prompt text and generation config for the given (or configured) variant"""
+    template, generation_config = PROMPT_VARIANTS[variant or PROMPT_VARIANT]
+    prompt = template.format(user_input=user_input, current_view=current_view,
+                             current_email_id=current_email_id or 'None')
+    return prompt, generation_config
+
+
+def usage_of(response):
+    """(prompt tokens, output tokens) reported by the model, 0 when absent"""
+    usage = getattr(response, 'usage_metadata', None)
+    return (getattr(usage, 'prompt_token_count', 0) or 0,
+            getattr(usage, 'candidates_token_count', 0) or 0)
+
+
+class ModelOutputError(ValueError):
+    """The model answered, but not with a command object"""
+
+
+# ```json ... ``` or ``` ... ```; the closing fence may be cut off
+_FENCE = re.compile(r'```(?:json)?\s*(.*?)\s*(?:```|$)', re.S)
+
+
+def parse_model_json(text):
+    """
+    The command object in a model reply. Free-form JSON mode (the "full"
+    variant) may wrap it in markdown fences or prose; raises
+    ModelOutputError if no {'action', 'params'} object is found.
+    """
+    text = text.strip()
+    if match := _FENCE.search(text):
+        text = match.group(1)
+    start, end = text.find('{'), text.rfind('}')
     try:
-        response = model.generate_content(
-            prompt,
-            generation_config=genai.GenerationConfig(
-                temperature=0.2,
-                top_p=0.95,
-                max_output_tokens=1024,
-                response_mime_type="application/json"
-            )
-        )
-
-        raw_text = response.text.strip()
-
-        # Clean up potential markdown/code blocks
-        if raw_text.startswith("```json"):
-            raw_text = raw_text.split("```json")[1].split("```")[0].strip()
-        elif raw_text.startswith("```"):
-            raw_text = raw_text.split("```")[1].strip()
-
-        parsed = json.loads(raw_text)
-        return parsed
+        parsed = json.loads(text[start:end + 1]) if 0 <= start < end else None
+    except json.JSONDecodeError as e:
+        raise ModelOutputError(f"model reply is not valid JSON ({e})") from e
+    if not isinstance(parsed, dict) or parsed.get('action') not in ACTIONS \
+            or not isinstance(parsed.get('params', {}), dict):
+        raise ModelOutputError(f"model reply is not a command: {text[:80]!r}")
+    parsed.setdefault('params', {})
+    return parsed
 
-    except Exception as e:
-        st.error(f"Gemini API error: {str(e)}")
-        return {"action": "unknown", "params": {}}
 
+def local_fallback(user_input):
+    """
+    parse_locally() for when the model is unavailable. Marked with
+    source='local' so the executor asks before running a bulk action on it.
+    """
+    guard.record_fallback()
+    return dict(parse_locally(user_input), source='local')
 
-# ────────────────────────────────────────────────
-# Execute the parsed action
-# ────────────────────────────────────────────────
-def execute_action(action_data, service):
+
+# Stream the model output when the caller wants early progress callbacks
+STREAM_PARSE = os.getenv("STREAM_PARSE", "1") == "1"
+
+
+def _chunk_text(chunk):
+    # Gemini raises on .text for chunks without parts (e.g. the final one)
+    try:
+        return chunk.text
+    except ValueError:
+        return ''
+
+
+@traced('parse_command')
+def parse_command(user_input, current_view, current_email_id=None, variant=None,
+                  on_action=None, on_params=None):
     """
-    Execute the parsed action by updating Streamlit session state.
-    action_data: dict containing 'action' and 'params'
-    service: Gmail API service instance
+    Parse natural language command into structured action using Gemini.
+    Returns dict with 'action' and 'params'.
+    With on_action/on_params (and STREAM_PARSE on), the response is streamed
+    and on_action fires as soon as the action is known, before the params.
     """
-    action = action_data.get("action", "unknown")
-    params = action_data.get("params", {})
-
-    if action == "compose":
-        st.session_state['view'] = 'compose'
-        st.session_state['to'] = params.get('to', '')
-        st.session_state['subject'] = params.get('subject', '')
-        st.session_state['body'] = params.get('body', '')
-        st.rerun()
-
-    elif action == "filter_inbox":
-        query = ''
-        if params.get('unread', False):
-            query += 'is:unread '
-        if sender := params.get('sender'):
-            query += f'from:{sender} '
-        if keyword := params.get('keyword'):
-            query += f'{keyword} '
-        if date_range := params.get('date_range', '').lower():
-            if 'week' in date_range or 'this week' in date_range:
-                date_str = (datetime.now() - timedelta(days=7)).strftime('%Y/%m/%d')
-                query += f'after:{date_str} '
-            elif '10 days' in date_range or 'last 10 days' in date_range:
-                date_str = (datetime.now() - timedelta(days=10)).strftime('%Y/%m/%d')
-                query += f'after:{date_str} '
-        st.session_state['emails'] = list_emails(service, query=query.strip())
-        st.session_state['view'] = 'inbox'
-        st.rerun()
-
-    elif action == "open_email":
-        sender = params.get('sender', '')
-        if sender:
-            emails = list_emails(service, query=f'from:{sender}')
-            if emails:
-                st.session_state['current_email_id'] = emails[0]['id']
-                st.session_state['view'] = 'detail'
-                st.rerun()
-        else:
-            st.info("Could not identify which email to open.")
-
-    elif action == "reply":
-        if current_id := st.session_state.get('current_email_id'):
-            detail = get_email_detail(service, current_id)
-            if detail:
-                st.session_state['view'] = 'compose'
-                st.session_state['to'] = detail['sender']
-                st.session_state['subject'] = f"Re: {detail['subject']}"
-                st.session_state['body'] = f"\n\n> {detail['body'].replace('\n', '\n> ')}"
-                st.rerun()
-
-    else:
-        st.info("Sorry, I didn't understand that command.")
-        
\ No newline at end of file
+    prompt, generation_config = build_prompt(user_input, current_view, current_email_id, variant)
+    streaming = STREAM_PARSE and (on_action or on_params)
+
+    try:
+        started = time.perf_counter()
+        with span('model.generate_content', prompt_chars=len(prompt), stream=bool(streaming)) as s:
+            if streaming:
+                # The schema lists "action" before "params", so it arrives first
+                command = StreamingCommand(on_action, on_params)
+
+                def on_chunk(chunk):
+                    command.feed(_chunk_text(chunk))
+                    if command.action and s and 'action_ms' not in s.attributes:
+                        s.set(action_ms=round((time.perf_counter() - started) * 1000, 1))
+
+                response, parsed = guard.generate(prompt, generation_config, stream=True, on_chunk=on_chunk,
+                                                  parse=lambda r: parse_model_json(command.buffer))
+            else:
+                response, parsed = guard.generate(prompt, generation_config,
+                                                  parse=lambda r: parse_model_json(r.text))
+            prompt_tokens, output_tokens = usage_of(response)
+            if s:
+                s.set(prompt_tokens=prompt_tokens, output_tokens=output_tokens)
+        _record_model_metrics(time.perf_counter() - started, prompt_tokens, output_tokens)
+
+        return parsed
+
+    except CircuitOpenError:
+        # Gemini is degraded; don't wait on it, answer locally
+        return local_fallback(user_input)
+
+    except ModelOutputError as e:
+        # Gemini answered; guessing with the regex parser could pick a different action
+        st.warning(f"Couldn't read Gemini's answer ({e})")
+        return {'action': 'unknown', 'params': {}}
+
+    except MODEL_UNAVAILABLE_ERRORS as e:
+        st.warning(f"Gemini unavailable ({type(e).__name__}: {e}) — used the local parser")
+        return local_fallback(user_input)
+
+    except Exception as e:
+        # Anything else from the SDK, e.g. .text raising ValueError on a
+        # blocked or safety-filtered response: still answer the command
+        st.warning(f"Gemini call failed ({type(e).__name__}: {e}) — used the local parser")
+        return local_fallback(user_input)
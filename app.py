@@ -1,11 +1,30 @@
 import streamlit as st
-from mail_service import get_gmail_service, list_emails, get_email_detail, send_email
-from ai_assistant import parse_command
+from streamlit.errors import StreamlitAPIException
+from mail_service import get_gmail_service, list_emails, get_email_detail, apply_bulk_action, filter_query, BULK_ACTIONS
+from mail_service import badge_stats, get_label_id, label_stats
+from mail_cache import CACHE, canonical_query
+import outbox
+import sync_daemon
+from voice_input import voice_input
+import speech
+import speculation
+import contacts
+import summarizer
+import execution_log
+from execution_log import ExecutionLog
+from mail_store import STORE
+import tracing
+import metrics
+from scheduler import SCHEDULER
+from ai_assistant import guard
+from async_core import parse_and_prefetch
+from model_guard import CLOSED
 from dotenv import load_dotenv
 import os
-from datetime import datetime, timedelta
 import time
 
+run_started = time.perf_counter()
+
 load_dotenv()
 
 st.set_page_config(page_title="Gmail AI Assistant", page_icon="📧", layout="wide")
@@ -20,7 +39,159 @@ if 'emails' not in st.session_state:
 if 'current_email_id' not in st.session_state:
     st.session_state['current_email_id'] = None
 if 'execution_log' not in st.session_state:
-    st.session_state['execution_log'] = []
+    st.session_state['execution_log'] = ExecutionLog()
+if 'speculator' not in st.session_state:
+    st.session_state['speculator'] = speculation.Speculator()
+if 'outbox_pending' not in st.session_state:
+    # outbox id -> last status shown in the execution log
+    st.session_state['outbox_pending'] = {}
+
+outbox.start_worker(get_gmail_service)
+# Keeps the local mail store current between reruns (SYNC_DAEMON)
+sync_daemon.start()
+
+
+def collect_metrics():
+    """Refresh gauges that need a query (run on the metrics thread)"""
+    snapshot = SCHEDULER.snapshot()
+    metrics.SCHEDULER_IN_FLIGHT.set(snapshot['in_flight'])
+    metrics.SCHEDULER_LIMIT.set(snapshot['concurrency_limit'])
+    metrics.OUTBOX_DEPTH.set(outbox.queue_depth())
+    for cache in ('listing', 'message', 'store', 'contacts', 'labels', 'summaries'):
+        metrics.CACHE_HIT_RATIO.set(metrics.cache_hit_ratio(cache), cache=cache)
+    metrics.MODEL_CIRCUIT_OPEN.set(int(guard.breaker.state != CLOSED))
+
+
+# One exporter per process, shared by every session (METRICS_PORT / METRICS_FILE)
+try:
+    metrics.start_exporter([collect_metrics])
+except OSError as e:
+    # Tried again on the next run
+    st.sidebar.warning(f"Metrics endpoint not started ({e})")
+
+# Report outbox deliveries that finished since the last rerun
+if st.session_state['outbox_pending']:
+    for outbox_id, row in outbox.statuses(list(st.session_state['outbox_pending'])).items():
+        if row['status'] == st.session_state['outbox_pending'][outbox_id]:
+            continue
+        if row['status'] == outbox.SENT:
+            st.session_state['execution_log'].record(f"✅ Outbox #{outbox_id} sent to: {row['to_addr']}",
+                                                     'send', {'outbox_id': outbox_id})
+            # A Sent list rebuilt since the send already has it (record_sent)
+            if ('sent' in st.session_state and (summary := CACHE.get_message(row['message_id']))
+                    and not any(e.id == summary.id for e in st.session_state['sent'])):
+                st.session_state['sent'].insert(0, summary)
+        elif row['status'] == outbox.FAILED:
+            st.session_state['execution_log'].record(f"❌ Outbox #{outbox_id} failed: {row['error']}",
+                                                     'send', {'outbox_id': outbox_id}, outcome=execution_log.FAILED)
+        elif row['status'] == outbox.REVIEW:
+            st.session_state['execution_log'].record(f"⚠️ Outbox #{outbox_id} may not have been sent: {row['error']}",
+                                                     'send', {'outbox_id': outbox_id}, outcome=execution_log.FAILED)
+        elif row['status'] == outbox.QUEUED and row['attempts']:
+            st.session_state['execution_log'].record(f"🔁 Outbox #{outbox_id} retrying (attempt {row['attempts'] + 1})",
+                                                     'send', {'outbox_id': outbox_id}, outcome=execution_log.PENDING)
+
+        if row['status'] in (outbox.SENT, outbox.FAILED, outbox.REVIEW):
+            del st.session_state['outbox_pending'][outbox_id]
+        else:
+            st.session_state['outbox_pending'][outbox_id] = row['status']
+
+# Sidebar command panel and main pane rerun on their own (st.fragment), so
+# a click in one doesn't rebuild the other; PARTIAL_RERUNS=0 restores
+# whole-script reruns.
+PARTIAL_RERUNS = os.getenv('PARTIAL_RERUNS', '1') == '1'
+pane = st.fragment if PARTIAL_RERUNS else (lambda func: func)
+
+
+def rerun_pane():
+    """Rerun just the pane the clicked widget lives in (everything during a full run)"""
+    if PARTIAL_RERUNS:
+        try:
+            st.rerun(scope='fragment')
+        except StreamlitAPIException:
+            pass    # only allowed while the fragment itself is rerunning
+    st.rerun()
+
+
+def finish_command_trace():
+    """End the pending command trace (if any) and keep it for the trace panel"""
+    if command_trace := st.session_state.pop('active_trace', None):
+        command_trace.finish()
+        st.session_state['last_trace'] = command_trace
+
+
+def show_trace(placeholder):
+    if last_trace := st.session_state.get('last_trace'):
+        with placeholder.container():
+            with st.expander("⏱️ Last Command Trace"):
+                st.caption(f"\"{last_trace.root.attributes.get('text', '')}\" — {last_trace.root.duration_ms:.0f} ms total")
+                st.code(tracing.format_waterfall(last_trace), language=None)
+
+
+def log_action(message, action=None, params=None, outcome=execution_log.OK):
+    """Record what a command did, with the time since it was issued"""
+    started = st.session_state.get('command_started')
+    latency_ms = (time.perf_counter() - started) * 1000 if started else None
+    return st.session_state['execution_log'].record(message, action, params, latency_ms, outcome)
+
+
+def speculated_list(service, query):
+    """list_emails for an inbox query, or the listing prefetched from the partial transcript"""
+    hit, emails = st.session_state['speculator'].take(('list', canonical_query(query)))
+    return emails if hit else list_emails(service, query=query)
+
+
+def speculated_detail(service, msg_id):
+    hit, detail = st.session_state['speculator'].take(('detail', msg_id))
+    return detail if hit else get_email_detail(service, msg_id)
+
+
+LABEL_ICONS = {'INBOX': '📥', 'STARRED': '⭐', 'SENT': '📤'}
+
+
+def label_title(label_id, stats):
+    """'Inbox' for system labels (Gmail names them 'INBOX'), the name for user labels"""
+    return stats['name'].capitalize() if stats['name'] == label_id else stats['name']
+
+
+def summarize_open_email(service, msg_id):
+    """Summarize the thread of `msg_id` for the detail view; returns the Summary (None if not found)"""
+    summary = summarizer.summarize_email(service, msg_id)
+    if summary is not None:
+        st.session_state['summary'] = (msg_id, summary)
+    return summary
+
+
+def summary_caption(summary):
+    if summary.path == summarizer.CACHED:
+        return f"{summary.messages} messages · cached"
+    calls = f"{summary.model_calls} model call{'s' if summary.model_calls != 1 else ''}"
+    reused = f" · {summary.reused} chunks reused" if summary.reused else ""
+    return (f"{summary.messages} messages · {summary.path.replace('_', '-')} · {calls} · "
+            f"{summary.prompt_tokens + summary.output_tokens} tokens · {summary.elapsed:.1f}s{reused}")
+
+
+def bulk_what(action, label_name=None):
+    return f"label '{label_name}'" if action == 'label' else action.replace('_', ' ')
+
+
+# Bulk actions from these sources wait for a Confirm click
+CONFIRM_REASONS = {
+    'local': "Gemini unavailable, read by the local parser",
+    'voice': "heard by voice",
+}
+
+
+def ask_confirmation(action_data, targets, reason):
+    """
+    Hold a bulk action until it is confirmed in the command panel. It
+    keeps the emails it was asked about: the view may change meanwhile.
+    """
+    action, params = action_data.get('action'), action_data.get('params', {})
+    question = f"⚠️ Apply {bulk_what(action, params.get('label'))} to {len(targets)} emails? ({reason})"
+    st.session_state['pending_confirmation'] = dict(action_data, question=question, targets=list(targets))
+    log_action(question, action, params, outcome=execution_log.PENDING)
+
 
 # Custom execute_action with detailed feedback
 def execute_action_with_feedback(action_data, service):
@@ -30,7 +201,9 @@ def execute_action_with_feedback(action_data, service):
     
     if action == "compose":
         st.session_state['view'] = 'compose'
-        st.session_state['to'] = params.get('to', '')
+        # "email alice" → "Alice Jones <alice.jones@...>" from the contact index
+        params['to'] = contacts.expand_recipients(params.get('to', ''))
+        st.session_state['to'] = params['to']
         st.session_state['subject'] = params.get('subject', '')
         st.session_state['body'] = params.get('body', '')
         
@@ -39,62 +212,50 @@ def execute_action_with_feedback(action_data, service):
         else:
             feedback_msg = "📝 Opening compose window"
         
-        st.session_state['execution_log'].append(feedback_msg)
+        log_action(feedback_msg, action, params)
         st.rerun()
 
     elif action == "filter_inbox":
-        query = ''
-        filter_desc = []
-        
-        if params.get('unread', False):
-            query += 'is:unread '
-            filter_desc.append("unread")
-            
-        if sender := params.get('sender'):
-            query += f'from:{sender} '
-            filter_desc.append(f"from {sender}")
-            
-        if keyword := params.get('keyword'):
-            query += f'{keyword} '
-            filter_desc.append(f"containing '{keyword}'")
-            
-        if date_range := params.get('date_range', '').lower():
-            if 'week' in date_range or 'this week' in date_range:
-                date_str = (datetime.now() - timedelta(days=7)).strftime('%Y/%m/%d')
-                query += f'after:{date_str} '
-                filter_desc.append("from last week")
-            elif '10 days' in date_range or 'last 10 days' in date_range:
-                date_str = (datetime.now() - timedelta(days=10)).strftime('%Y/%m/%d')
-                query += f'after:{date_str} '
-                filter_desc.append("from last 10 days")
-        
-        st.session_state['emails'] = list_emails(service, query=query.strip())
+        query, filter_desc = filter_query(params)
+        st.session_state['emails'] = speculated_list(service, query)
         st.session_state['view'] = 'inbox'
         
         filter_text = ", ".join(filter_desc) if filter_desc else "all emails"
         email_count = len(st.session_state['emails'])
         feedback_msg = f"🔍 Showing {email_count} emails - Filtered by: {filter_text}"
         
-        st.session_state['execution_log'].append(feedback_msg)
+        log_action(feedback_msg, action, params)
         st.rerun()
 
     elif action == "open_email":
         sender = params.get('sender', '')
         if sender:
-            emails = list_emails(service, query=f'from:{sender}')
-            if emails:
-                st.session_state['current_email_id'] = emails[0]['id']
+            # The contact index knows the newest inbox message per sender
+            guessed = False
+            if contact := contacts.latest_from(sender):
+                msg_id, params = contact.latest_id, dict(params, address=contact.address)
+            else:
+                emails = speculated_list(service, f'from:{sender}')
+                msg_id = emails[0].id if emails else None
+                # Nobody by that name: maybe a typo of someone we know
+                if msg_id is None and (contact := contacts.latest_from(sender, fuzzy=True)):
+                    msg_id, params, guessed = contact.latest_id, dict(params, address=contact.address), True
+            if msg_id:
+                st.session_state['current_email_id'] = msg_id
                 st.session_state['view'] = 'detail'
-                feedback_msg = f"📧 Opening latest email from {sender}"
-                st.session_state['execution_log'].append(feedback_msg)
+                if guessed:
+                    feedback_msg = f"📧 No emails from {sender}; opening latest email from {contact}"
+                else:
+                    feedback_msg = f"📧 Opening latest email from {contact or sender}"
+                log_action(feedback_msg, action, params)
                 st.rerun()
             else:
                 feedback_msg = f"❌ No emails found from {sender}"
-                st.session_state['execution_log'].append(feedback_msg)
+                log_action(feedback_msg, action, params, outcome=execution_log.FAILED)
 
     elif action == "reply":
         if current_id := st.session_state.get('current_email_id'):
-            detail = get_email_detail(service, current_id)
+            detail = speculated_detail(service, current_id)
             if detail:
                 st.session_state['view'] = 'compose'
                 st.session_state['to'] = detail['sender']
@@ -102,147 +263,224 @@ def execute_action_with_feedback(action_data, service):
                 st.session_state['body'] = f"\n\n> {detail['body'].replace('\n', '\n> ')}"
                 
                 feedback_msg = f"↩️ Replying to: {detail['sender']}"
-                st.session_state['execution_log'].append(feedback_msg)
+                log_action(feedback_msg, action, {'msg_id': current_id})
                 st.rerun()
 
+    elif action == "summarize":
+        current_id = st.session_state.get('current_email_id')
+        if not current_id:
+            log_action("❓ Open an email to summarize its thread", action, params, outcome=execution_log.FAILED)
+            return
+        try:
+            summary = summarize_open_email(service, current_id)
+        except Exception as e:
+            log_action(f"❌ Couldn't summarize ({type(e).__name__}: {e})", action, params,
+                       outcome=execution_log.FAILED)
+            return
+        if summary is None:
+            log_action("❌ Error loading email", action, params, outcome=execution_log.FAILED)
+            return
+        st.session_state['view'] = 'detail'
+        log_action(f"🧾 Summarized: {summary_caption(summary)}", action,
+                   dict(params, msg_id=current_id, path=summary.path, model_calls=summary.model_calls,
+                        tokens=summary.prompt_tokens + summary.output_tokens))
+        st.rerun()
+
+    elif action == "count":
+        # Answered from label counts; no message is listed or fetched
+        label_name = params.get('label') or 'INBOX'
+        label_id = get_label_id(service, label_name, create=False)
+        if label_id is None:
+            log_action(f"❓ No label named '{label_name}'", action, params, outcome=execution_log.FAILED)
+            return
+        # Fresh counts; the inbox prefetch while parsing usually did the history check
+        stats = label_stats(service, [label_id], max_age=1.0)[label_id]
+        title = label_title(label_id, stats)
+        if params.get('unread'):
+            feedback_msg = f"📊 {stats['unread']} unread in {title}"
+        else:
+            feedback_msg = f"📊 {stats['total']} emails in {title} ({stats['unread']} unread)"
+        log_action(feedback_msg, action, dict(params, total=stats['total'], unread=stats['unread']))
+
+    elif action in BULK_ACTIONS:
+        label_name = params.get('label')
+        if action == 'label' and not label_name:
+            log_action("❓ No label given", action, params, outcome=execution_log.FAILED)
+            return
+
+        shown = st.session_state['emails']
+        targets = action_data.get('targets', shown)
+        reason = CONFIRM_REASONS.get(action_data.get('source'))
+        if reason and not action_data.get('confirmed'):
+            ask_confirmation(action_data, targets, reason)
+            return
+        emails, modified, elapsed = apply_bulk_action(service, action, targets, label_name)
+        # A confirmed action may be about emails no longer shown
+        if [email.id for email in shown] == [email.id for email in targets]:
+            st.session_state['emails'] = emails
+        sync_daemon.wake()
+
+        what = bulk_what(action, label_name)
+        rate = modified / elapsed if elapsed > 0 else 0
+        feedback_msg = f"🏷️ Applied {what} to {modified}/{len(targets)} emails in {elapsed:.2f}s ({rate:.0f} msg/s)"
+        log_action(feedback_msg, action, dict(params, modified=modified, targets=len(targets)))
+        st.rerun()
+
     else:
         feedback_msg = f"❓ Command not recognized: {action}"
-        st.session_state['execution_log'].append(feedback_msg)
+        log_action(feedback_msg, action, params, outcome=execution_log.UNKNOWN)
 
-# Process voice command from URL - NO SPINNER, IMMEDIATE EXECUTION
-voice_cmd = st.query_params.get('voice_cmd', None)
+# Early preview while the model is still streaming the command
+PREVIEW_TITLES = {
+    'compose': "📝 Opening compose window…",
+    'filter_inbox': "🔍 Filtering inbox…",
+    'open_email': "📧 Opening email…",
+    'reply': "↩️ Preparing reply…",
+    'mark_read': "🏷️ Marking shown emails as read…",
+    'mark_unread': "🏷️ Marking shown emails as unread…",
+    'archive': "🏷️ Archiving shown emails…",
+    'trash': "🗑️ Moving shown emails to trash…",
+    'label': "🏷️ Labelling shown emails…",
+    'count': "📊 Counting…",
+    'summarize': "🧾 Summarizing thread…",
+}
 
-if voice_cmd:
-    # Clear the query parameter
-    st.query_params.clear()
-    
+
+def stream_preview(placeholder):
+    """on_action/on_params callbacks that render into `placeholder`"""
+    state = {'action': None}
+
+    def on_action(action):
+        state['action'] = action
+        if title := PREVIEW_TITLES.get(action):
+            placeholder.info(title)
+
+    def on_params(params):
+        title = PREVIEW_TITLES.get(state['action'])
+        if not title:
+            return
+        fields = '  \n'.join(f"**{key.replace('_', ' ').title()}:** {value}"
+                             for key, value in params.items() if value not in ('', None))
+        placeholder.info(f"{title}  \n{fields}" if fields else title)
+
+    return {'on_action': on_action, 'on_params': on_params}
+
+
+# Main-area slot for the preview; the rerun after execution clears it
+command_preview = st.empty()
+
+
+def run_command(cmd, source, heard_at=None, parsed=None, **attributes):
+    """
+    Parse and execute one command from the voice widget or the text box.
+    `parsed` skips parsing (the speech fast path already matched it).
+    """
+    voice = source == 'voice'
+    # A new command replaces any bulk action still waiting for confirmation
+    st.session_state.pop('pending_confirmation', None)
+    st.session_state['command_started'] = time.perf_counter()
     try:
-        # Parse immediately
-        parsed = parse_command(
-            voice_cmd,
-            st.session_state['view'],
-            st.session_state.get('current_email_id')
-        )
-        
-        # Log what we're doing
-        st.session_state['execution_log'].append(f"🎤 Voice: '{voice_cmd}' → Action: {parsed.get('action')}")
-        
-        # Execute immediately - this will call st.rerun()
-        execute_action_with_feedback(parsed, st.session_state['service'])
-        
+        with tracing.trace('command', source=source, text=cmd, **attributes) as command_trace:
+            st.session_state['active_trace'] = command_trace
+
+            if parsed is None:
+                # Parse immediately; the inbox is refreshed concurrently
+                parsed = parse_and_prefetch(
+                    cmd,
+                    st.session_state['view'],
+                    st.session_state.get('current_email_id'),
+                    **stream_preview(command_preview)
+                )
+
+            if voice:
+                # A misheard word shouldn't archive or trash anything unasked
+                parsed = dict(parsed, source=parsed.get('source', 'voice'))
+                log_action(f"🎤 Voice: '{cmd}' → Action: {parsed.get('action')}", parsed.get('action'),
+                           {'text': cmd}, outcome=execution_log.HEARD)
+                if heard_at:
+                    # Browser clock; only meaningful when it runs on the same machine
+                    metrics.VOICE_TO_ACTION_SECONDS.observe(max(0.0, time.time() - heard_at / 1000))
+            else:
+                st.write(f"🧠 Action: **{parsed.get('action')}**")
+
+            # Most actions end with st.rerun()
+            execute_action_with_feedback(parsed, st.session_state['service'])
+            command_preview.empty()
+
+        # Still here, so the command didn't rerun the app and the
+        # main pane won't render for it
+        if PARTIAL_RERUNS:
+            finish_command_trace()
+
     except Exception as e:
-        st.session_state['execution_log'].append(f"❌ Voice error: {str(e)}")
+        if voice:
+            log_action(f"❌ Voice error: {str(e)}", outcome=execution_log.FAILED)
+        else:
+            st.error(f"❌ Error: {str(e)}")
+    finally:
+        st.session_state['speculator'].settle()
+        st.session_state.pop('command_started', None)
+
+
+# Entries shown in the command history (the log keeps more)
+HISTORY_SHOWN = 10
 
-# Sidebar
-with st.sidebar:
-    st.title("🤖 AI Email Assistant")
-    st.markdown("---")
+
+@pane
+def command_panel():
+    """Voice and typed command input, execution and history (sidebar)"""
+    pane_started = time.perf_counter()
 
     st.subheader("🎤 Voice Commands")
     st.caption("Speak → Auto-executes instantly!")
 
-    # Voice button
-    voice_html = """
-    <!DOCTYPE html>
-    <html>
-    <head>
-        <style>
-            body { padding: 5px; margin: 0; font-family: sans-serif; }
-            #voiceBtn {
-                width: 100%;
-                padding: 14px;
-                background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-                color: white;
-                border: none;
-                border-radius: 8px;
-                cursor: pointer;
-                font-size: 16px;
-                font-weight: 600;
-                margin-bottom: 10px;
-            }
-            #voiceBtn:hover { opacity: 0.9; }
-            #voiceBtn.listening {
-                background: linear-gradient(135deg, #f093fb 0%, #f5576c 100%);
-                animation: pulse 1s infinite;
-            }
-            @keyframes pulse {
-                0%, 100% { opacity: 1; }
-                50% { opacity: 0.7; }
-            }
-            #status {
-                padding: 10px;
-                background: #f0f2f6;
-                border-radius: 5px;
-                font-size: 13px;
-                text-align: center;
-            }
-            .success { background: #d4edda; color: #155724; }
-            .error { background: #f8d7da; color: #721c24; }
-        </style>
-    </head>
-    <body>
-        <button id="voiceBtn">🎤 Click & Speak</button>
-        <div id="status">Ready</div>
-
-        <script>
-            const btn = document.getElementById('voiceBtn');
-            const status = document.getElementById('status');
-            
-            const SpeechRecognition = window.SpeechRecognition || window.webkitSpeechRecognition;
-            
-            if (!SpeechRecognition) {
-                status.textContent = '❌ Not supported';
-                status.className = 'error';
-                btn.disabled = true;
-            } else {
-                btn.onclick = () => {
-                    const recognition = new SpeechRecognition();
-                    recognition.lang = 'en-US';
-
-                    recognition.onstart = () => {
-                        btn.textContent = '🎙️ Listening...';
-                        btn.classList.add('listening');
-                        status.textContent = 'Speak now';
-                    };
-
-                    recognition.onresult = (e) => {
-                        const text = e.results[0][0].transcript;
-                        
-                        btn.textContent = '✅ Executing...';
-                        btn.classList.remove('listening');
-                        status.innerHTML = `Heard: "${text}"`;
-                        status.className = 'success';
-                        
-                        // Reload with voice command
-                        const url = new URL(window.parent.location);
-                        url.searchParams.set('voice_cmd', text);
-                        window.parent.location.href = url.toString();
-                    };
-
-                    recognition.onerror = (e) => {
-                        let msg = '❌ ';
-                        if (e.error === 'not-allowed') msg += 'Mic blocked';
-                        else if (e.error === 'no-speech') msg += 'No speech';
-                        else msg += e.error;
-                        
-                        status.textContent = msg;
-                        status.className = 'error';
-                        btn.textContent = '🎤 Click & Speak';
-                        btn.classList.remove('listening');
-                    };
-
-                    recognition.start();
-                };
-            }
-        </script>
-    </body>
-    </html>
-    """
-    
-    st.components.v1.html(voice_html, height=100)
+    # The transcript arrives as the component value: no page reload
+    latest = st.session_state['execution_log'].latest()
+    try:
+        recognizer = speech.get_recognizer()
+    except (ImportError, ValueError) as e:
+        recognizer = None
+        st.caption(f"⚠️ Server speech recognition unavailable ({e}); using the browser's")
+
+    # Server STT: feed the chunks before rendering so the ack goes out with them
+    speculator = st.session_state['speculator']
+    ack = None
+    value = st.session_state.get('voice')
+    if recognizer and value and 'chunks' in value:
+        current = st.session_state.get('utterance')
+        if current is None or current.id != value['id']:
+            current = st.session_state['utterance'] = speech.Utterance(value['id'], recognizer)
+        acked = current.acked
+        finished = not current.done and current.feed(value['chunks'], value.get('stopped'))
+        if not current.done and current.acked != acked:
+            # Start fetching what the command is likely to need
+            speculator.update(current.partial, st.session_state.get('current_email_id'))
+        ack = {'id': current.id, 'seq': current.acked, 'done': current.done, 'partial': current.partial}
+
+    utterance = voice_input(status=latest and latest.message, handled=st.session_state.get('voice_handled'),
+                            mode='server' if recognizer else 'browser', ack=ack,
+                            interim=speculator.enabled, key='voice')
+
+    if ack and finished:
+        st.session_state['voice_handled'] = current.id
+        metrics.STT_WAIT_SECONDS.observe(current.wait_ms / 1000, path=current.path)
+        if current.text:
+            run_command(current.text, 'voice', parsed=current.command, stt=current.path)
+        else:
+            log_action("❌ Voice error: no speech recognized", outcome=execution_log.FAILED)
+        rerun_pane()
+    elif utterance and 'text' in utterance and utterance.get('id') != st.session_state.get('voice_handled'):
+        st.session_state['voice_handled'] = utterance['id']
+        run_command(utterance['text'], 'voice', heard_at=utterance.get('heard_at'))
+        # The command didn't rerun anything; rerun so the widget shows the outcome
+        rerun_pane()
+    elif utterance and 'partial' in utterance and utterance != st.session_state.get('speculated'):
+        # Browser interim result: the value stays until the final one, guess once per change
+        st.session_state['speculated'] = utterance
+        speculator.update(utterance['partial'], st.session_state.get('current_email_id'))
 
     st.markdown("---")
-    
+
     # Manual command input
     user_input = st.text_input(
         "💬 Or type command:", 
@@ -255,33 +493,65 @@ with st.sidebar:
         cmd = user_input.strip()
         
         if cmd:
-            try:
-                # Parse command
-                parsed = parse_command(
-                    cmd, 
-                    st.session_state['view'], 
-                    st.session_state.get('current_email_id')
-                )
-                
-                st.write(f"🧠 Action: **{parsed.get('action')}**")
-                
-                # Execute with feedback
-                execute_action_with_feedback(parsed, st.session_state['service'])
-                
-            except Exception as e:
-                st.error(f"❌ Error: {str(e)}")
+            run_command(cmd, 'text')
         else:
             st.warning("⚠️ Enter a command")
 
+    # Bulk action held for confirmation
+    if pending := st.session_state.get('pending_confirmation'):
+        st.warning(pending['question'])
+        confirm_col, cancel_col = st.columns(2)
+        if confirm_col.button("✅ Confirm", use_container_width=True):
+            del st.session_state['pending_confirmation']
+            execute_action_with_feedback(dict(pending, confirmed=True), st.session_state['service'])
+        if cancel_col.button("✖️ Cancel", use_container_width=True):
+            del st.session_state['pending_confirmation']
+            log_action(f"✖️ Cancelled {bulk_what(pending['action'], pending['params'].get('label'))}",
+                       pending['action'], pending['params'])
+            rerun_pane()
+
     # Execution history
-    if st.session_state.get('execution_log'):
+    if st.session_state['execution_log']:
         st.markdown("---")
         with st.expander("📜 Command History", expanded=True):
-            for log in reversed(st.session_state['execution_log'][-10:]):
-                st.text(log)
+            for entry in st.session_state['execution_log'].last(HISTORY_SHOWN):
+                st.text(entry.message)
             if st.button("Clear History"):
-                st.session_state['execution_log'] = []
-                st.rerun()
+                st.session_state['execution_log'].clear()
+                rerun_pane()
+
+    # Span waterfall for the last command; filled again once the main pane has rendered
+    global trace_panel
+    trace_panel = st.empty()
+    show_trace(trace_panel)
+    metrics.PANE_SECONDS.observe(time.perf_counter() - pane_started, pane='command')
+
+
+# Sidebar
+with st.sidebar:
+    st.title("🤖 AI Email Assistant")
+    st.markdown("---")
+
+    command_panel()
+
+    # Model health: latency, hedging and whether the local parser has taken over
+    model_stats = guard.stats()
+    if model_stats['circuit'] != CLOSED:
+        st.warning("⚠️ Gemini is degraded — commands are parsed locally")
+    if model_stats['calls']:
+        st.caption(f"🧠 Gemini p50 {model_stats['p50_ms'] or 0:.0f} ms · p95 {model_stats['p95_ms'] or 0:.0f} ms · "
+                   f"{model_stats['hedged']} hedged · {model_stats['errors'] + model_stats['timeouts']} failed · "
+                   f"{model_stats['fallbacks']} local")
+
+    if (hit_rate := speculation.hit_rate()) is not None:
+        st.caption(f"🔮 Speculative prefetch: {hit_rate:.0%} of guesses used")
+
+    # Local store freshness (listings and open emails are served from it)
+    sync_status = STORE.status()
+    if sync_status.get('error'):
+        st.caption(f"⚠️ Sync error: {sync_status['error']}")
+    elif (age := STORE.synced_age()) is not None:
+        st.caption(f"🔄 Synced {age:.0f}s ago · {sync_status['messages']} messages stored")
 
     st.markdown("---")
     
@@ -293,10 +563,24 @@ with st.sidebar:
         - "compose email to john@example.com"
         - "open inbox"
         - "show sent emails"
+        - "mark these as read"
+        - "archive all of these"
+        - "label these as newsletters"
+        - "how many unread do I have"
+        - "summarize this thread"
         """)
 
     st.markdown("---")
     st.subheader("📂 Navigation")
+
+    # Label badges from cached labels.get counts (a getProfile now and then)
+    try:
+        badges = [f"{LABEL_ICONS.get(label_id, '🏷️')} {label_title(label_id, stats)} "
+                  f"{str(stats['unread']) + ' unread' if stats['unread'] else stats['total']}"
+                  for label_id, stats in badge_stats(st.session_state['service']).items()]
+        st.caption(' · '.join(badges))
+    except Exception as e:
+        st.caption(f"⚠️ Label counts unavailable: {e}")
     
     col1, col2 = st.columns(2)
     with col1:
@@ -306,6 +590,7 @@ with st.sidebar:
             st.rerun()
         if st.button("📤 Sent", use_container_width=True):
             st.session_state['view'] = 'sent'
+            st.session_state['sent'] = list_emails(st.session_state['service'], label='SENT')
             st.rerun()
     with col2:
         if st.button("✉️ Compose", use_container_width=True):
@@ -316,7 +601,8 @@ with st.sidebar:
             st.rerun()
 
 # Main content
-if st.session_state['view'] == 'inbox':
+def render_inbox():
+    """Inbox listing"""
     st.title("📥 Inbox")
     
     if not st.session_state['emails']:
@@ -324,22 +610,34 @@ if st.session_state['view'] == 'inbox':
     else:
         st.caption(f"📊 {len(st.session_state['emails'])} emails")
         for email in st.session_state['emails']:
-            icon = '🔴' if email['unread'] else '✅'
-            with st.expander(f"{icon} {email['sender']} - {email['subject']} ({email['date']})"):
-                st.write(email['preview'])
-                if st.button("📖 Open", key=f"open_{email['id']}"):
-                    st.session_state['current_email_id'] = email['id']
+            icon = '🔴' if email.unread else '✅'
+            with st.expander(f"{icon} {email.sender} - {email.subject} ({email.date})"):
+                st.write(email.preview)
+                if st.button("📖 Open", key=f"open_{email.id}"):
+                    st.session_state['current_email_id'] = email.id
                     st.session_state['view'] = 'detail'
-                    st.rerun()
+                    rerun_pane()
+
 
-elif st.session_state['view'] == 'compose':
+def fill_to(value):
+    """Suggestion button callback; runs before the To field is drawn again"""
+    st.session_state['to'] = value
+
+
+def render_compose():
+    """Compose form"""
     st.title("✉️ Compose Email")
     
-    # Show success message if we got here via voice
-    if st.session_state.get('execution_log') and 'compose' in st.session_state['execution_log'][-1]:
-        st.success(st.session_state['execution_log'][-1])
+    # Show success message if a command opened compose
+    latest = st.session_state['execution_log'].latest()
+    if latest and latest.action == 'compose' and latest.outcome == execution_log.OK:
+        st.success(latest.message)
     
     to = st.text_input("To", st.session_state.get('to', ''), key="to")
+    if suggestions := contacts.complete(to):
+        for col, (contact, value) in zip(st.columns(len(suggestions)), suggestions):
+            col.button(f"👤 {contact.name or contact.address}", key=f"to_{contact.address}", help=contact.address,
+                       on_click=fill_to, args=(value,), use_container_width=True)
     subject = st.text_input("Subject", st.session_state.get('subject', ''), key="subj")
     body = st.text_area("Body", st.session_state.get('body', ''), height=300, key="body")
 
@@ -347,15 +645,14 @@ elif st.session_state['view'] == 'compose':
     with col1:
         if st.button("📤 Send", type="primary", use_container_width=True):
             if to and subject:
-                send_email(st.session_state['service'], to, subject, body)
-                
-                feedback_msg = f"📧 Email sent to: {to} | Subject: {subject}"
-                st.session_state['execution_log'].append(feedback_msg)
-                
-                st.success(f"✅ Email sent to **{to}**")
-                st.info(f"📝 Subject: {subject}")
+                # Queue and return at once; the outbox worker delivers it
+                outbox_id = outbox.enqueue(to, subject, body)
+                st.session_state['outbox_pending'][outbox_id] = outbox.QUEUED
+                sync_daemon.wake()
                 
-                time.sleep(2)
+                feedback_msg = f"📤 Outbox #{outbox_id} queued to: {to} | Subject: {subject}"
+                st.session_state['execution_log'].record(feedback_msg, 'send', {'outbox_id': outbox_id, 'to': to},
+                                                         outcome=execution_log.PENDING)
                 
                 for k in ['to', 'subject', 'body']:
                     if k in st.session_state:
@@ -371,47 +668,99 @@ elif st.session_state['view'] == 'compose':
                 if k in st.session_state:
                     del st.session_state[k]
             st.session_state['view'] = 'inbox'
-            st.rerun()
+            rerun_pane()
+
 
-elif st.session_state['view'] == 'detail':
+def render_detail():
+    """Full view of the selected email"""
     st.title("📧 Email Detail")
     if st.session_state.get('current_email_id'):
         detail = get_email_detail(st.session_state['service'], st.session_state['current_email_id'])
         if detail:
             st.markdown(f"**From:** {detail['sender']}")
             st.markdown(f"**Subject:** {detail['subject']}")
+            summarized_id, summary = st.session_state.get('summary') or (None, None)
+            if summarized_id == st.session_state['current_email_id']:
+                st.info(f"**🧾 Thread summary**\n\n{summary.text}")
+                st.caption(summary_caption(summary))
             st.markdown("---")
             st.text(detail['body'])
             st.markdown("---")
-            col1, col2 = st.columns(2)
+            col1, col2, col3 = st.columns(3)
             with col1:
                 if st.button("↩️ Reply", type="primary", use_container_width=True):
                     st.session_state['view'] = 'compose'
                     st.session_state['to'] = detail['sender']
                     st.session_state['subject'] = f"Re: {detail['subject']}"
                     st.session_state['body'] = f"\n\n---\n> {detail['body']}"
-                    st.rerun()
+                    rerun_pane()
             with col2:
+                if st.button("🧾 Summarize thread", use_container_width=True):
+                    try:
+                        with st.spinner("Summarizing thread…"):
+                            summarize_open_email(st.session_state['service'], st.session_state['current_email_id'])
+                    except Exception as e:
+                        st.error(f"❌ Couldn't summarize ({type(e).__name__}: {e})")
+                    else:
+                        rerun_pane()
+            with col3:
                 if st.button("⬅️ Back", use_container_width=True):
                     st.session_state['view'] = 'inbox'
-                    st.rerun()
+                    rerun_pane()
         else:
             st.error("❌ Error loading email")
     else:
         st.warning("⚠️ No email selected")
 
-elif st.session_state['view'] == 'sent':
+
+def render_sent():
+    """Sent listing"""
     st.title("📤 Sent Emails")
-    sent = list_emails(st.session_state['service'], label='SENT')
+    # Loaded once, then refreshed from the cache by the Sent button and after sends
+    if 'sent' not in st.session_state:
+        st.session_state['sent'] = list_emails(st.session_state['service'], label='SENT')
+    sent = st.session_state['sent']
     if not sent:
         st.info("📭 No sent emails")
     else:
         st.caption(f"📊 {len(sent)} sent")
         for email in sent:
-            with st.expander(f"✅ {email['sender']} - {email['subject']} ({email['date']})"):
-                st.write(email['preview'])
-                if st.button("📖 View", key=f"sent_{email['id']}"):
-                    st.session_state['current_email_id'] = email['id']
+            with st.expander(f"✅ {email.sender} - {email.subject} ({email.date})"):
+                st.write(email.preview)
+                if st.button("📖 View", key=f"sent_{email.id}"):
+                    st.session_state['current_email_id'] = email.id
                     st.session_state['view'] = 'detail'
-                    st.rerun()
-                    
\ No newline at end of file
+                    rerun_pane()
+
+
+VIEWS = {
+    'inbox': render_inbox,
+    'compose': render_compose,
+    'detail': render_detail,
+    'sent': render_sent,
+}
+
+@pane
+def main_pane():
+    """The current view; opening, replying and going back rerun only this"""
+    pane_started = time.perf_counter()
+    view = st.session_state['view']
+    # The first render after a command belongs to that command's trace
+    render_trace = st.session_state.get('active_trace')
+    if render_trace:
+        try:
+            with tracing.resume(render_trace), tracing.span(f'render.{view}'):
+                VIEWS[view]()
+        finally:
+            finish_command_trace()
+    else:
+        VIEWS[view]()
+    metrics.PANE_SECONDS.observe(time.perf_counter() - pane_started, pane=view)
+
+
+main_pane()
+
+# Filled again so the trace includes the render that just finished
+show_trace(trace_panel)
+
+metrics.RERUN_SECONDS.observe(time.perf_counter() - run_started, view=st.session_state['view'])
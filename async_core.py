@@ -0,0 +1,289 @@
+import asyncio
+import concurrent.futures
+import contextvars
+import os
+import threading
+
+import httplib2
+import httpx
+from google.auth.transport.requests import Request
+from googleapiclient.errors import HttpError
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+
+import mail_service
+from mail_cache import CACHE, canonical_query
+from mail_store import STORE
+import metrics
+from scheduler import PREFETCH, aexecute, priority
+
+# ────────────────────────────────────────────────
+# asyncio core for Gmail and model I/O
+# ────────────────────────────────────────────────
+# Async versions of the mail_service reads/sends over one pooled httpx
+# client, sharing the scheduler budget, the mail cache and the summary
+# helpers with the sync code. Independent calls run concurrently
+# (message metadata fan-out, parsing a command while the inbox is
+# prefetched).
+#
+# Streamlit scripts are synchronous, so the sync facade at the bottom
+# (run(), parse_and_prefetch(), ...) submits coroutines to one event loop
+# thread per process and waits for the result.
+
+GMAIL_BASE_URL = 'https://gmail.googleapis.com'
+HTTP_TIMEOUT = 30.0
+MAX_CONNECTIONS = 32
+
+
+class AsyncGmail:
+    """Minimal async Gmail REST client (users/me) using the app's credentials"""
+
+    def __init__(self, credentials=None, endpoint=None):
+        self.credentials = credentials
+        base_url = (endpoint or GMAIL_BASE_URL).rstrip('/')
+        self.client = httpx.AsyncClient(
+            base_url=f'{base_url}/gmail/v1/users/me',
+            timeout=HTTP_TIMEOUT,
+            limits=httpx.Limits(max_connections=MAX_CONNECTIONS, max_keepalive_connections=MAX_CONNECTIONS),
+        )
+        self._refresh_lock = asyncio.Lock()
+
+    async def _headers(self):
+        creds = self.credentials
+        if creds is None:
+            return {}
+        if not creds.valid:
+            async with self._refresh_lock:
+                if not creds.valid:
+                    await asyncio.to_thread(creds.refresh, Request())
+        return {'Authorization': f'Bearer {creds.token}'}
+
+    async def call(self, method, http_method, path, params=None, body=None):
+        """One scheduled request; raises HttpError like googleapiclient"""
+        params = {k: v for k, v in (params or {}).items() if v is not None}
+
+        async def send():
+            response = await self.client.request(http_method, path, params=params, json=body,
+                                                 headers=await self._headers())
+            if response.status_code >= 400:
+                resp = httplib2.Response({'status': response.status_code, 'reason': response.reason_phrase})
+                raise HttpError(resp, response.content, uri=str(response.url))
+            return response.json() if response.content else {}
+
+        return await aexecute(send, method)
+
+    async def aclose(self):
+        await self.client.aclose()
+
+
+# ── Gmail operations ────────────────────────────
+async def get_history_id(gmail):
+    profile = await gmail.call('getProfile', 'GET', '/profile')
+    CACHE.email_address = profile.get('emailAddress')
+    return profile['historyId']
+
+
+async def list_history(gmail, start_history_id, page_token=None):
+    return await gmail.call('history.list', 'GET', '/history',
+                            {'startHistoryId': start_history_id, 'pageToken': page_token})
+
+
+async def sync_cache(gmail):
+    """Async mail_service.sync_cache"""
+    current = await get_history_id(gmail)
+    if CACHE.history_id is None:
+        CACHE.clear(current)
+        return
+    if current == CACHE.history_id:
+        CACHE.mark_checked()
+        return
+
+    records = []
+    page_token = None
+    try:
+        for _ in range(mail_service.HISTORY_MAX_PAGES):
+            response = await list_history(gmail, CACHE.history_id, page_token)
+            records.extend(response.get('history', []))
+            page_token = response.get('nextPageToken')
+            if not page_token:
+                break
+        else:
+            CACHE.clear(current)
+            return
+    except HttpError as e:
+        if e.resp.status == 404:
+            CACHE.clear(current)
+            return
+        raise
+
+    CACHE.apply_history(records, current)
+
+
+async def fetch_summary(gmail, msg_id):
+    msg_data = await gmail.call('messages.get', 'GET', f'/messages/{msg_id}', {'format': 'metadata'})
+    summary, label_ids = mail_service.summarize_metadata(msg_id, msg_data)
+    CACHE.put_message(summary, label_ids)
+    return summary
+
+
+async def list_emails(gmail, label='INBOX', query='', max_results=20, page_token=None, use_cache=True):
+    """Async mail_service.list_emails; metadata for the page is fetched concurrently"""
+    query = canonical_query(query)
+    if use_cache:
+        await sync_cache(gmail)
+        cached = CACHE.get_listing(label, query, page_token, max_results)
+        if cached is not None:
+            metrics.CACHE_LOOKUPS.inc(cache='listing', result='hit')
+            return cached[:max_results]
+        metrics.CACHE_LOOKUPS.inc(cache='listing', result='miss')
+
+    results = await gmail.call('messages.list', 'GET', '/messages', {
+        'labelIds': [label], 'q': query, 'maxResults': max_results, 'pageToken': page_token,
+    })
+
+    async def summary_for(msg_id):
+        summary = CACHE.get_message(msg_id) if use_cache else None
+        if use_cache:
+            metrics.CACHE_LOOKUPS.inc(cache='message', result='hit' if summary else 'miss')
+        return summary or await fetch_summary(gmail, msg_id)
+
+    emails = list(await asyncio.gather(*(summary_for(m['id']) for m in results.get('messages', []))))
+    if use_cache:
+        CACHE.put_listing(label, query, page_token, [e.id for e in emails], max_results)
+    return emails
+
+
+async def get_email_detail(gmail, msg_id):
+    msg = await gmail.call('messages.get', 'GET', f'/messages/{msg_id}', {'format': 'full'})
+    return mail_service.parse_detail(msg)
+
+
+async def deliver_email(gmail, to, subject, body):
+    sent_message = await gmail.call('messages.send', 'POST', '/messages/send',
+                                    body={'raw': mail_service.build_raw(to, subject, body)})
+    mail_service.record_sent(sent_message, to, subject, body)
+    return sent_message['id']
+
+
+async def prefetch_inbox(gmail, max_results=20):
+    """Warm the cache for the default inbox page at background priority"""
+    with priority(PREFETCH):
+        return await list_emails(gmail, max_results=max_results)
+
+
+# ── model ───────────────────────────────────────
+async def parse_command(user_input, current_view, current_email_id=None, script_ctx=None, **kwargs):
+    """
+    ai_assistant.parse_command on its own thread (the guard already bounds
+    its latency). `script_ctx` lets its preview callbacks draw Streamlit
+    elements for the session that asked.
+    """
+    import ai_assistant
+
+    loop = asyncio.get_running_loop()
+    done = loop.create_future()
+    context = contextvars.copy_context()
+
+    def target():
+        if script_ctx is not None:
+            add_script_run_ctx(threading.current_thread(), script_ctx)
+        try:
+            result = context.run(ai_assistant.parse_command, user_input, current_view, current_email_id, **kwargs)
+        except BaseException as e:
+            loop.call_soon_threadsafe(done.set_exception, e)
+        else:
+            loop.call_soon_threadsafe(done.set_result, result)
+
+    threading.Thread(target=target, name='parse-command', daemon=True).start()
+    return await done
+
+
+# ── sync facade ─────────────────────────────────
+_loop = None
+_gmail = None
+_lock = threading.Lock()
+# The inbox refresh started by parse_and_prefetch
+_prefetch = None
+_prefetch_lock = threading.Lock()
+
+
+def _event_loop():
+    global _loop
+    with _lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name='async-core', daemon=True).start()
+    return _loop
+
+
+def submit(coro):
+    """Start a coroutine on the shared loop; returns a concurrent.futures.Future"""
+    loop = _event_loop()
+    context = contextvars.copy_context()
+    result = concurrent.futures.Future()
+
+    def finished(task):
+        if task.cancelled():
+            result.cancel()
+        elif task.exception() is not None:
+            result.set_exception(task.exception())
+        else:
+            result.set_result(task.result())
+
+    def start():
+        loop.create_task(coro, context=context).add_done_callback(finished)
+
+    loop.call_soon_threadsafe(start)
+    return result
+
+
+def run(coro):
+    """Run a coroutine on the shared loop and wait for it (keeps tracing context)"""
+    return submit(coro).result()
+
+
+def new_gmail_client():
+    """AsyncGmail configured like get_gmail_service()"""
+    if endpoint := os.getenv('GMAIL_API_ENDPOINT'):
+        return AsyncGmail(endpoint=endpoint)
+    return AsyncGmail(credentials=mail_service.load_credentials())
+
+
+def gmail_client():
+    """The facade loop's AsyncGmail (one per process)"""
+    global _gmail
+    with _lock:
+        if _gmail is None:
+            _gmail = new_gmail_client()
+    return _gmail
+
+
+def parse_and_prefetch(user_input, current_view, current_email_id=None, **kwargs):
+    """
+    Parse a command while the inbox page is refreshed in the background.
+    Returns as soon as the parse is done: the prefetch runs at PREFETCH
+    priority (and may sit in backoff) and nobody waits for it. Its
+    failures are ignored; the command runs either way. No refresh is
+    started while the local mail store answers the inbox page, since
+    list_emails reads it before the cache.
+    """
+    global _prefetch
+    script_ctx = get_script_run_ctx()
+    gmail = gmail_client()
+    if STORE.list_emails('INBOX', '') is None:
+        with _prefetch_lock:
+            # One refresh at a time; a slow one is still warming the same page
+            if _prefetch is None or _prefetch.done():
+                _prefetch = submit(prefetch_inbox(gmail))
+    return run(parse_command(user_input, current_view, current_email_id, script_ctx=script_ctx, **kwargs))
+
+
+def list_emails_sync(label='INBOX', query='', max_results=20, page_token=None, use_cache=True):
+    return run(list_emails(gmail_client(), label, query, max_results, page_token, use_cache))
+
+
+def get_email_detail_sync(msg_id):
+    return run(get_email_detail(gmail_client(), msg_id))
+
+
+def deliver_email_sync(to, subject, body):
+    return run(deliver_email(gmail_client(), to, subject, body))
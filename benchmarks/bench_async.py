@@ -0,0 +1,136 @@
+"""
+Compare the sync mail_service path with the async core on the same operations.
+
+    python -m benchmarks.bench_async --latency-ms 30 --out bench_async.json
+
+Each operation runs once through mail_service (googleapiclient, one call
+at a time) and once through async_core (httpx, concurrent where the
+calls are independent), against the fake Gmail server with injected
+latency. "parse+prefetch" parses a command on the fake model and
+refreshes the inbox page: the sync side does one after the other, the
+async side returns once the command is parsed (the refresh, still counted
+in the API calls, is waited for between runs). Both sides use an empty
+temporary mail store, so neither is answered from a synced mailstore.db.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+
+from benchmarks.common import (FakeGmailProcess, compare, measure, metadata,
+                               print_table, write_results)
+
+
+def run(args):
+    with FakeGmailProcess(args.size, args.seed, args.latency_ms, args.jitter_ms) as server:
+        os.environ['GMAIL_API_ENDPOINT'] = server.url
+        os.environ['MODEL_BACKEND'] = 'fake'
+        os.environ['FAKE_MODEL_LATENCY_MS'] = str(args.model_latency_ms)
+        # Never synced: every read goes to the API on both paths
+        os.environ['MAILSTORE_PATH'] = os.path.join(tempfile.mkdtemp(), 'mailstore.db')
+
+        # Imported after the endpoint is set
+        import ai_assistant
+        import async_core
+        import mail_service
+        from mail_cache import CACHE
+        from scheduler import SCHEDULER
+
+        SCHEDULER.rate = SCHEDULER.burst = SCHEDULER.tokens = float('inf')
+        service = mail_service.get_gmail_service()
+        gmail = async_core.gmail_client()
+        results = {}
+
+        for page_size in (20, 100):
+            def list_sync():
+                CACHE.clear()
+                mail_service.list_emails(service, max_results=page_size, use_cache=False)
+
+            def list_async():
+                CACHE.clear()
+                async_core.run(async_core.list_emails(gmail, max_results=page_size, use_cache=False))
+            results[f'list_emails[{page_size}][sync]'] = measure(list_sync, args.iterations, server)
+            results[f'list_emails[{page_size}][async]'] = measure(list_async, args.iterations, server)
+
+        ids = [email.id for email in mail_service.list_emails(service, max_results=10, use_cache=False)]
+
+        def details_sync():
+            for msg_id in ids:
+                mail_service.get_email_detail(service, msg_id)
+
+        async def details_async():
+            await asyncio.gather(*(async_core.get_email_detail(gmail, i) for i in ids))
+        results['get_email_detail[x10][sync]'] = measure(details_sync, args.iterations, server)
+        results['get_email_detail[x10][async]'] = measure(
+            lambda: async_core.run(details_async()), args.iterations, server)
+
+        results['sync_cache[sync]'] = measure(lambda: mail_service.sync_cache(service), args.iterations, server)
+        results['sync_cache[async]'] = measure(
+            lambda: async_core.run(async_core.sync_cache(gmail)), args.iterations, server)
+
+        body = 'Benchmark body.\n' * 50
+        results['send[sync]'] = measure(
+            lambda: mail_service.deliver_email(service, 'bench@example.com', 'Benchmark', body),
+            args.iterations, server)
+        results['send[async]'] = measure(
+            lambda: async_core.deliver_email_sync('bench@example.com', 'Benchmark', body),
+            args.iterations, server)
+
+        def parse_then_list():
+            CACHE.clear()
+            ai_assistant.parse_command('show unread emails', 'inbox')
+            mail_service.list_emails(service)
+
+        def parse_and_prefetch():
+            CACHE.clear()
+            async_core.parse_and_prefetch('show unread emails', 'inbox')
+        results['parse+prefetch[sync]'] = measure(parse_then_list, args.iterations, server)
+        results['parse+prefetch[async]'] = measure(parse_and_prefetch, args.iterations, server,
+                                                   settle=lambda: async_core._prefetch.result())
+
+    return results
+
+
+def print_speedups(results):
+    print(f"\n{'operation':32} {'sync p50':>10} {'async p50':>10} {'speedup':>8}")
+    for name in results:
+        if not name.endswith('[sync]'):
+            continue
+        base = name[:-len('[sync]')]
+        sync, concurrent = results[name], results[f'{base}[async]']
+        speedup = sync['p50_ms'] / concurrent['p50_ms'] if concurrent['p50_ms'] else 0
+        print(f"{base:32} {sync['p50_ms']:10.1f} {concurrent['p50_ms']:10.1f} {speedup:7.2f}x")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--size', type=int, default=5000, help='synthetic mailbox size')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--iterations', type=int, default=10)
+    parser.add_argument('--latency-ms', type=float, default=30.0, help='injected server latency')
+    parser.add_argument('--jitter-ms', type=float, default=5.0)
+    parser.add_argument('--model-latency-ms', type=float, default=400.0)
+    parser.add_argument('--out', default='bench_async.json')
+    parser.add_argument('--baseline', help='previous results file to compare against')
+    parser.add_argument('--threshold', type=float, default=0.10)
+    args = parser.parse_args(argv)
+
+    results = run(args)
+    print_table(results)
+    print_speedups(results)
+    write_results(args.out, metadata(**{k: v for k, v in vars(args).items()
+                                        if k not in ('out', 'baseline')}), results)
+    print(f'\nResults written to {args.out}')
+
+    if args.baseline:
+        regressions = compare(args.baseline, results, args.threshold)
+        for line in regressions:
+            print(f'REGRESSION {line}')
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
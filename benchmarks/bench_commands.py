@@ -0,0 +1,168 @@
+"""
+End-to-end command latency: text -> parse_command -> executor -> mail_service.
+
+    python -m benchmarks.bench_commands --model-latency-ms 400 --out bench_commands.json
+
+Drives app.py through Streamlit's AppTest with the fake model backend and
+the fake Gmail server, and splits each command's wall time into parse
+(model), API (Gmail calls) and render (everything else in the rerun).
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+from benchmarks.common import FakeGmailProcess, compare, metadata, summarize, write_results
+
+# A typical session, in order; reply relies on the email opened before it
+CORPUS = [
+    'show unread emails',
+    'show emails from alice',
+    'show emails from last week',
+    'open inbox',
+    'open email from bob',
+    'reply',
+    'compose email to carol@example.com about budget review',
+    'show unread emails about invoice',
+    'mark these as read',
+    'label these as Benchmarks',
+    'what is the weather like',
+]
+
+
+class PhaseTimer:
+    """Accumulates time spent inside wrapped callables"""
+
+    def __init__(self):
+        self.total = 0.0
+        self.calls = 0
+
+    def wrap(self, fn):
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self.total += time.perf_counter() - start
+                self.calls += 1
+        return timed
+
+    def reset(self):
+        self.total = 0.0
+        self.calls = 0
+
+
+def run(args):
+    with FakeGmailProcess(args.size, args.seed, args.api_latency_ms) as server:
+        os.environ['GMAIL_API_ENDPOINT'] = server.url
+        os.environ['MAILSTORE_PATH'] = os.path.join(tempfile.mkdtemp(), 'mailstore.db')
+        os.environ['MODEL_BACKEND'] = 'fake'
+        os.environ['FAKE_MODEL_LATENCY_MS'] = str(args.model_latency_ms)
+        os.environ['FAKE_MODEL_JITTER_MS'] = str(args.model_jitter_ms)
+        os.environ['FAKE_MODEL_MALFORMED_RATE'] = str(args.malformed_rate)
+
+        from streamlit.testing.v1 import AppTest
+        import ai_assistant
+        import outbox
+        from benchmarks.common import ROOT
+        from scheduler import SCHEDULER
+
+        outbox.OUTBOX_PATH = os.path.join(tempfile.mkdtemp(), 'outbox.db')
+        SCHEDULER.rate = SCHEDULER.burst = SCHEDULER.tokens = float('inf')
+
+        parse_timer, api_timer = PhaseTimer(), PhaseTimer()
+        ai_assistant.parse_command = parse_timer.wrap(ai_assistant.parse_command)
+        SCHEDULER.execute = api_timer.wrap(SCHEDULER.execute)
+
+        app = AppTest.from_file(os.path.join(ROOT, 'app.py'), default_timeout=60)
+        app.run()
+
+        samples = {}
+        unknown = 0
+        for _ in range(args.iterations):
+            for command in CORPUS:
+                parse_timer.reset()
+                api_timer.reset()
+                app.text_input(key='cmd_input').input(command)
+                button = next(b for b in app.button if 'Execute' in b.label)
+
+                start = time.perf_counter()
+                button.click().run()
+                total = time.perf_counter() - start
+
+                if app.exception:
+                    raise RuntimeError(f'{command!r} raised: {app.exception[0].value}')
+                if (latest := app.session_state['execution_log'].latest()) and latest.outcome == 'unknown':
+                    unknown += 1
+
+                phases = {
+                    'total': total,
+                    'parse': parse_timer.total,
+                    'api': api_timer.total,
+                    'render': max(0.0, total - parse_timer.total - api_timer.total),
+                }
+                entry = samples.setdefault(command, {name: [] for name in phases} | {'api_calls': []})
+                for name, seconds in phases.items():
+                    entry[name].append(seconds * 1000)
+                entry['api_calls'].append(api_timer.calls)
+
+    results = {}
+    overall = {'total': [], 'parse': [], 'api': [], 'render': []}
+    for command, entry in samples.items():
+        result = summarize(entry['total'])
+        for phase in ('parse', 'api', 'render'):
+            result[f'{phase}_p50_ms'] = summarize(entry[phase])['p50_ms']
+            overall[phase].extend(entry[phase])
+        overall['total'].extend(entry['total'])
+        result['api_calls_per_op'] = round(sum(entry['api_calls']) / len(entry['api_calls']), 2)
+        results[f'command[{command}]'] = result
+
+    summary = summarize(overall['total'])
+    for phase in ('parse', 'api', 'render'):
+        phase_summary = summarize(overall[phase])
+        summary[f'{phase}_p50_ms'] = phase_summary['p50_ms']
+        summary[f'{phase}_p95_ms'] = phase_summary['p95_ms']
+    summary['unrecognized'] = unknown
+    results['all_commands'] = summary
+    return results
+
+
+def print_phases(results):
+    print(f"{'command':60} {'total p50':>10} {'parse':>8} {'api':>8} {'render':>8} {'calls':>6}")
+    for name, r in results.items():
+        print(f"{name[:60]:60} {r['p50_ms']:10.1f} {r['parse_p50_ms']:8.1f} "
+              f"{r['api_p50_ms']:8.1f} {r['render_p50_ms']:8.1f} {r.get('api_calls_per_op', ''):>6}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--size', type=int, default=5000, help='synthetic mailbox size')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--iterations', type=int, default=5, help='passes over the command corpus')
+    parser.add_argument('--model-latency-ms', type=float, default=400.0)
+    parser.add_argument('--model-jitter-ms', type=float, default=100.0)
+    parser.add_argument('--malformed-rate', type=float, default=0.0)
+    parser.add_argument('--api-latency-ms', type=float, default=30.0)
+    parser.add_argument('--out', default='bench_commands.json')
+    parser.add_argument('--baseline', help='previous results file to compare against')
+    parser.add_argument('--threshold', type=float, default=0.10)
+    args = parser.parse_args(argv)
+
+    results = run(args)
+    print_phases(results)
+    write_results(args.out, metadata(**{k: v for k, v in vars(args).items()
+                                        if k not in ('out', 'baseline')}), results)
+    print(f'\nResults written to {args.out}')
+
+    if args.baseline:
+        regressions = compare(args.baseline, results, args.threshold)
+        for line in regressions:
+            print(f'REGRESSION {line}')
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
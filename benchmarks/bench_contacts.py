@@ -0,0 +1,128 @@
+"""
+Resolving "open email from X" locally vs a Gmail from: search.
+
+    python -m benchmarks.bench_contacts --size 2000 --latency-ms 40 --out bench_contacts.json
+
+Syncs the synthetic mailbox into a temporary mail store, builds the
+contact index from it and looks up every first name and full name seen
+in the inbox, and each first name with two letters swapped (a typo,
+resolved with the fuzzy lookup open_email falls back to). For
+the plain names it also runs the Gmail search open_email used before
+(from:<name>) and reports how often both pick the same message, plus the
+time per lookup each way and the index build time. Gmail's search finds
+nothing for names sent RFC 2047 encoded (José, Zoë); the index decodes them.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+from benchmarks.common import FakeGmailProcess, metadata, summarize, write_results
+
+
+def typo(word):
+    """`word` with its second and third letters swapped"""
+    return word[0] + word[2] + word[1] + word[3:] if len(word) >= 4 and word[1] != word[2] else None
+
+
+def timed_us(fn, arg, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        result = fn(arg)
+    return result, (time.perf_counter() - start) * 1e6 / iterations
+
+
+def summarize_us(samples_us):
+    return {key.replace('_ms', '_us'): value for key, value in summarize(samples_us).items()}
+
+
+def run(args):
+    with FakeGmailProcess(args.size, args.seed, args.latency_ms) as server:
+        os.environ['GMAIL_API_ENDPOINT'] = server.url
+        os.environ['MAILSTORE_PATH'] = os.path.join(tempfile.mkdtemp(), 'mailstore.db')
+        os.environ['SYNC_BACKFILL'] = str(args.size)
+
+        # Imported after the environment is set
+        import async_core
+        import contacts
+        import mail_service
+        from mail_store import STORE
+        from sync_daemon import SyncDaemon
+
+        mail_service.get_gmail_service()
+        asyncio.run(SyncDaemon(STORE, async_core.new_gmail_client()).backfill())
+
+        start = time.perf_counter()
+        index = contacts.build(STORE)
+        build_ms = (time.perf_counter() - start) * 1000
+
+        with_mail = [c for c in index.contacts if c.latest_id and c.name and 'newsletter' not in c.address]
+        first_names = sorted({c.name.split()[0] for c in with_mail})
+        full_names = sorted({c.name for c in with_mail})
+
+        results = {'index': {'contacts': len(index), 'build_ms': round(build_ms, 1)}}
+        for kind, names in (('first name', first_names), ('full name', full_names)):
+            samples, resolved = [], 0
+            for name in names:
+                contact, us = timed_us(index.latest_from, name, args.iterations)
+                samples.append(us)
+                resolved += contact is not None
+            results[f'local[{kind}]'] = dict(summarize_us(samples), queries=len(names), resolved=resolved)
+
+        samples, correct, queries = [], 0, 0
+        for name in first_names:
+            misspelt = typo(contacts.fold(name))
+            if misspelt is None:
+                continue
+            queries += 1
+            contact, us = timed_us(lambda word: index.latest_from(word, fuzzy=True), misspelt, args.iterations)
+            samples.append(us)
+            correct += contact is not None and contacts.fold(contact.name).startswith(contacts.fold(name))
+        results['local[typo]'] = dict(summarize_us(samples), queries=queries, resolved_to_intended=correct)
+
+        service = mail_service.get_gmail_service()
+        samples, found, agree = [], 0, 0
+        for name in first_names:
+            start = time.perf_counter()
+            emails = mail_service.list_emails(service, query=f'from:{name}', use_cache=False)
+            samples.append((time.perf_counter() - start) * 1000)
+            local = index.latest_from(name)
+            found += bool(emails)
+            agree += bool(emails) and local is not None and local.latest_id == emails[0].id
+        results['gmail[first name]'] = dict(summarize(samples), queries=len(first_names), found=found,
+                                           same_message=agree)
+    return results
+
+
+def print_table(results):
+    print(f"contacts {results['index']['contacts']}, index built in {results['index']['build_ms']:.1f} ms\n")
+    print(f"{'lookup':20} {'queries':>8} {'p50':>12} {'p95':>12}  result")
+    for name, result in results.items():
+        if name == 'index':
+            continue
+        unit = 'ms' if 'p50_ms' in result else 'us'
+        outcome = {k: v for k, v in result.items() if k in ('resolved', 'resolved_to_intended', 'found', 'same_message')}
+        print(f"{name:20} {result['queries']:8} {result[f'p50_{unit}']:9.2f} {unit} {result[f'p95_{unit}']:9.2f} {unit}  "
+              + ', '.join(f'{k.replace("_", " ")} {v}' for k, v in outcome.items()))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--size', type=int, default=2000, help='synthetic mailbox size')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--iterations', type=int, default=100, help='repeats per local lookup')
+    parser.add_argument('--latency-ms', type=float, default=40.0, help='fake Gmail latency per request')
+    parser.add_argument('--out', default='bench_contacts.json')
+    args = parser.parse_args(argv)
+
+    results = run(args)
+    print_table(results)
+    write_results(args.out, metadata(**{k: v for k, v in vars(args).items() if k != 'out'}), results)
+    print(f'\nResults written to {args.out}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
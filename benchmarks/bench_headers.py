@@ -0,0 +1,76 @@
+"""
+Header extraction per message: one scan per header vs the single-pass index.
+
+    python -m benchmarks.bench_headers --rows 10000 --out bench_headers.json
+
+Extracts From and Subject (plus the sender's address for the index) from
+format='metadata' messages of the synthetic mailbox, whose headers
+include lowercase names and RFC 2047 encoded words. The old scans match
+names case-sensitively and leave encoded words as they are; the report
+counts how many senders and subjects each way gets wrong.
+"""
+import argparse
+import sys
+import time
+
+from benchmarks.common import metadata, summarize, write_results
+
+
+def scan(headers):
+    """The per-header next(...) scans list_emails and get_email_detail used"""
+    sender = next((h['value'] for h in headers if h['name'] == 'From'), 'Unknown')
+    subject = next((h['value'] for h in headers if h['name'] == 'Subject'), 'No Subject')
+    return sender, subject
+
+
+def run(args):
+    from fake_gmail_server import FakeGmail
+    from mailbox_generator import SyntheticMailbox, message_id
+    import mail_headers
+
+    gmail = FakeGmail(SyntheticMailbox(args.rows, args.seed), seed=args.seed)
+    messages = [gmail.get_message(message_id(i), 'metadata') for i in range(args.rows)]
+
+    def indexed(msg):
+        index = mail_headers.HeaderIndex(msg['payload']['headers'])
+        return index.get('From', 'Unknown'), index.get('Subject', 'No Subject'), index.sender().address
+
+    results = {}
+    variants = {
+        'scan': lambda msg: scan(msg['payload']['headers']),
+        'index': indexed,
+    }
+    for name, extract in variants.items():
+        batch = messages
+        samples, outputs = [], []
+        for _ in range(args.iterations):
+            start = time.perf_counter()
+            outputs = [extract(msg) for msg in batch]
+            samples.append((time.perf_counter() - start) * 1e6 / len(batch))
+        result = summarize(samples)
+        result['us_per_message'] = result.pop('p50_ms')
+        result['unknown_senders'] = sum(out[0] == 'Unknown' for out in outputs)
+        result['encoded_left'] = sum('=?' in out[0] or '=?' in out[1] for out in outputs)
+        results[name] = result
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=10000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--iterations', type=int, default=5)
+    parser.add_argument('--out', default='bench_headers.json')
+    args = parser.parse_args(argv)
+
+    results = run(args)
+    print(f"{'variant':16} {'us/message':>11} {'unknown From':>13} {'still encoded':>14}")
+    for name, result in results.items():
+        print(f"{name:16} {result['us_per_message']:11.2f} {result['unknown_senders']:13} {result['encoded_left']:14}")
+    write_results(args.out, metadata(**{k: v for k, v in vars(args).items() if k != 'out'}), results)
+    print(f'\nResults written to {args.out}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
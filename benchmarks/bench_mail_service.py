@@ -0,0 +1,140 @@
+"""
+Benchmark the mail_service hot paths against the local Gmail stand-in.
+
+    python -m benchmarks.bench_mail_service --size 10000 --out bench.json
+    python -m benchmarks.bench_mail_service --baseline bench.json
+
+Reports p50/p95/p99 latency, API calls and bytes on the wire per
+operation and peak RSS, and flags regressions against a previous run.
+"""
+import argparse
+import os
+import sys
+import tempfile
+
+from benchmarks.common import (FakeGmailProcess, compare, measure, metadata,
+                               print_table, write_results)
+from mailbox_generator import SyntheticMailbox, message_id
+
+
+def pick_messages(mailbox, limit=5000):
+    """Find representative small, large and nested messages in the mailbox"""
+    picks = {}
+    for index in range(min(limit, mailbox.size)):
+        shape = mailbox.shape(index)
+        length = len(mailbox.body_text(index))
+        if 'small' not in picks and shape == 'plain' and length < 1000:
+            picks['small'] = index
+        elif 'large' not in picks and shape == 'alternative' and length > 20000:
+            picks['large'] = index
+        elif 'nested' not in picks and shape == 'nested':
+            picks['nested'] = index
+        if len(picks) == 3:
+            break
+    return {kind: message_id(index) for kind, index in picks.items()}
+
+
+def run(args):
+    with FakeGmailProcess(args.size, args.seed, args.latency_ms, args.jitter_ms) as server:
+        os.environ['GMAIL_API_ENDPOINT'] = server.url
+        os.environ['MAILSTORE_PATH'] = os.path.join(tempfile.mkdtemp(), 'mailstore.db')
+
+        # Imported after the endpoint is set
+        import mail_service
+        from mail_cache import CACHE
+        from scheduler import SCHEDULER
+
+        if args.quota_per_second:
+            SCHEDULER.rate = SCHEDULER.burst = args.quota_per_second
+        else:
+            # Measure the code path, not the quota throttle
+            SCHEDULER.rate = SCHEDULER.burst = float('inf')
+        SCHEDULER.tokens = SCHEDULER.burst
+
+        service = mail_service.get_gmail_service()
+        results = {}
+
+        for page_size in (20, 100, 500):
+            def list_cold():
+                CACHE.clear()
+                mail_service.list_emails(service, max_results=page_size, use_cache=False)
+            results[f'list_emails[{page_size}]'] = measure(list_cold, args.iterations, server)
+
+        mail_service.list_emails(service, max_results=20)
+        results['list_emails[20,cached]'] = measure(
+            lambda: mail_service.list_emails(service, max_results=20), args.iterations, server)
+
+        picks = pick_messages(SyntheticMailbox(args.size, args.seed))
+        payloads = {}
+        for kind, msg_id in picks.items():
+            results[f'get_email_detail[{kind}]'] = measure(
+                lambda: mail_service.get_email_detail(service, msg_id), args.iterations, server)
+            payloads[kind] = service.users().messages().get(userId='me', id=msg_id, format='full').execute()['payload']
+
+        for kind, payload in payloads.items():
+            results[f'extract_body[{kind}]'] = measure(
+                lambda: mail_service.extract_body(payload), args.iterations * 20)
+
+        def unread_by_listing():
+            """How the unread count was found before labels.get: page through the ids"""
+            count, page_token = 0, None
+            while True:
+                listing = service.users().messages().list(
+                    userId='me', labelIds=['INBOX', 'UNREAD'], maxResults=500, pageToken=page_token).execute()
+                count += len(listing.get('messages', []))
+                page_token = listing.get('nextPageToken')
+                if not page_token:
+                    return count
+
+        def unread_by_label(max_age):
+            return mail_service.label_stats(service, ['INBOX'], max_age=max_age)['INBOX']['unread']
+
+        results['unread_count[listing]'] = measure(unread_by_listing, args.iterations, server)
+
+        def unread_cold():
+            CACHE.clear()
+            return unread_by_label(0)
+        results['unread_count[labels.get]'] = measure(unread_cold, args.iterations, server)
+        results['unread_count[cached,checked]'] = measure(lambda: unread_by_label(0), args.iterations, server)
+        results['unread_count[cached]'] = measure(
+            lambda: unread_by_label(mail_service.LABEL_STATS_MAX_AGE), args.iterations, server)
+
+        body = 'Benchmark body.\n' * 50
+        results['send_email'] = measure(
+            lambda: mail_service.deliver_email(service, 'bench@example.com', 'Benchmark', body),
+            args.iterations, server)
+
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--size', type=int, default=10000, help='synthetic mailbox size')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--iterations', type=int, default=20)
+    parser.add_argument('--latency-ms', type=float, default=0.0, help='injected server latency')
+    parser.add_argument('--jitter-ms', type=float, default=0.0)
+    parser.add_argument('--quota-per-second', type=float, default=0,
+                        help='scheduler quota budget (default: unlimited)')
+    parser.add_argument('--out', default='bench_mail_service.json')
+    parser.add_argument('--baseline', help='previous results file to compare against')
+    parser.add_argument('--threshold', type=float, default=0.10, help='allowed slowdown before flagging')
+    args = parser.parse_args(argv)
+
+    results = run(args)
+    print_table(results)
+    write_results(args.out, metadata(**{k: v for k, v in vars(args).items()
+                                        if k not in ('out', 'baseline')}), results)
+    print(f'\nResults written to {args.out}')
+
+    if args.baseline:
+        regressions = compare(args.baseline, results, args.threshold)
+        for line in regressions:
+            print(f'REGRESSION {line}')
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
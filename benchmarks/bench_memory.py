@@ -0,0 +1,102 @@
+"""
+Memory held by listing rows: plain dicts vs EmailSummary.
+
+    python -m benchmarks.bench_memory --rows 10000 --sessions 50 --out bench_memory.json
+
+Builds --rows summaries from format='metadata' messages of the synthetic
+mailbox (each round-tripped through JSON, like an API response) in the
+old dict layout and as EmailSummary, and measures the heap they keep
+alive with tracemalloc. The per-session figure is what --sessions
+sessions holding the same --page rows from the shared mail cache add
+on top of the cache: the dict layout copied every row per session, while
+immutable summaries are shared.
+"""
+import argparse
+import gc
+import json
+import sys
+import tracemalloc
+from datetime import datetime
+
+from benchmarks.common import metadata, write_results
+
+
+def legacy_summary(msg_id, msg_data):
+    """The dict summarize_metadata() used to build"""
+    headers = msg_data.get('payload', {}).get('headers', [])
+    label_ids = msg_data.get('labelIds', [])
+    return {
+        'id': msg_id,
+        'sender': next((h['value'] for h in headers if h['name'] == 'From'), 'Unknown'),
+        'subject': next((h['value'] for h in headers if h['name'] == 'Subject'), 'No Subject'),
+        'preview': msg_data.get('snippet', '(No preview available)'),
+        'date': datetime.fromtimestamp(int(msg_data.get('internalDate', '0')) / 1000).strftime('%Y-%m-%d %H:%M'),
+        'unread': 'UNREAD' in label_ids,
+    }
+
+
+def retained(build):
+    """(result, bytes still allocated by build() once it returns)"""
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    result = build()
+    gc.collect()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, after - before
+
+
+def run(args):
+    from fake_gmail_server import FakeGmail
+    from mailbox_generator import SyntheticMailbox, message_id
+    import mail_service
+
+    gmail = FakeGmail(SyntheticMailbox(args.rows, args.seed), seed=args.seed)
+    responses = [json.dumps(gmail.get_message(message_id(i), 'metadata')) for i in range(args.rows)]
+
+    def build(summarize):
+        return lambda: [summarize(message_id(i), json.loads(raw)) for i, raw in enumerate(responses)]
+
+    results = {}
+    legacy_rows, legacy_bytes = retained(build(legacy_summary))
+    compact_rows, compact_bytes = retained(build(lambda i, m: mail_service.summarize_metadata(i, m)[0]))
+
+    for name, rows, size in (('dict', legacy_rows, legacy_bytes), ('EmailSummary', compact_rows, compact_bytes)):
+        page = rows[:args.page]
+        copy = dict if name == 'dict' else (lambda row: row)
+        _, session_bytes = retained(lambda: [[copy(row) for row in page] for _ in range(args.sessions)])
+        results[name] = {
+            'rows': len(rows),
+            'bytes_per_row': round(size / len(rows), 1),
+            'mb_per_10k_rows': round(size / len(rows) * 10000 / 2**20, 2),
+            'kb_per_session': round(session_bytes / args.sessions / 1024, 1),
+        }
+    return results
+
+
+def print_table(results):
+    print(f"{'representation':16} {'bytes/row':>10} {'MB/10k rows':>12} {'KB/session':>11}")
+    for name, result in results.items():
+        print(f"{name:16} {result['bytes_per_row']:10.1f} {result['mb_per_10k_rows']:12.2f} "
+              f"{result['kb_per_session']:11.1f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=10000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--page', type=int, default=100, help='rows each session holds')
+    parser.add_argument('--sessions', type=int, default=50)
+    parser.add_argument('--out', default='bench_memory.json')
+    args = parser.parse_args(argv)
+
+    results = run(args)
+    print_table(results)
+    write_results(args.out, metadata(**{k: v for k, v in vars(args).items() if k != 'out'}), results)
+    print(f'\nResults written to {args.out}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,123 @@
+"""
+parse_command tokens and latency per prompt variant, and streamed time-to-action.
+
+    python -m benchmarks.bench_prompt --out bench_prompt.json
+
+Runs every command in the bench_commands corpus through parse_command with
+each prompt variant on the fake model, whose latency grows with prompt and
+output tokens, and reports tokens and time saved per command. The
+streamed run measures how soon the action is known (when the UI can
+switch views) against the full parse.
+"""
+import argparse
+import os
+import sys
+import time
+
+from benchmarks.bench_commands import CORPUS
+from benchmarks.common import compare, metadata, summarize, write_results
+
+
+def run(args):
+    os.environ['MODEL_BACKEND'] = 'fake'
+    os.environ['FAKE_MODEL_LATENCY_MS'] = str(args.model_latency_ms)
+    os.environ['FAKE_MODEL_MS_PER_1K_PROMPT_TOKENS'] = str(args.ms_per_1k_prompt_tokens)
+    os.environ['FAKE_MODEL_MS_PER_OUTPUT_TOKEN'] = str(args.ms_per_output_token)
+
+    import ai_assistant
+
+    responses = []
+    generate = ai_assistant.model.generate_content
+
+    def recording(*a, **kw):
+        response = generate(*a, **kw)
+        responses.append(response)
+        return response
+    ai_assistant.model.generate_content = recording
+
+    results = {}
+    for command in CORPUS:
+        per_variant = {}
+        for variant in ai_assistant.PROMPT_VARIANTS:
+            samples, prompt_tokens, output_tokens = [], [], []
+            for _ in range(args.iterations):
+                start = time.perf_counter()
+                ai_assistant.parse_command(command, 'inbox', variant=variant)
+                samples.append((time.perf_counter() - start) * 1000)
+                prompt, output = ai_assistant.usage_of(responses[-1])
+                prompt_tokens.append(prompt)
+                output_tokens.append(output)
+            result = summarize(samples)
+            result['prompt_tokens'] = round(sum(prompt_tokens) / len(prompt_tokens), 1)
+            result['output_tokens'] = round(sum(output_tokens) / len(output_tokens), 1)
+            per_variant[variant] = result
+            results[f'parse[{variant}][{command}]'] = result
+
+        action_ms, samples = [], []
+        for _ in range(args.iterations):
+            start = time.perf_counter()
+            seen = []
+            ai_assistant.parse_command(command, 'inbox', variant='compact',
+                                       on_action=lambda a: seen.append(time.perf_counter()))
+            samples.append((time.perf_counter() - start) * 1000)
+            action_ms.append(((seen[0] if seen else time.perf_counter()) - start) * 1000)
+        stream = summarize(samples)
+        stream['action_p50_ms'] = summarize(action_ms)['p50_ms']
+        stream['action_p95_ms'] = summarize(action_ms)['p95_ms']
+        results[f'stream[{command}]'] = stream
+
+        full, compact = per_variant['full'], per_variant['compact']
+        results[f'saved[{command}]'] = {
+            'prompt_tokens': round(full['prompt_tokens'] - compact['prompt_tokens'], 1),
+            'output_tokens': round(full['output_tokens'] - compact['output_tokens'], 1),
+            'p50_ms': round(full['p50_ms'] - compact['p50_ms'], 3),
+            'action_p50_ms': round(full['p50_ms'] - stream['action_p50_ms'], 3),
+        }
+    return results
+
+
+def print_savings(results):
+    print(f"{'command':56} {'prompt tok':>14} {'output tok':>12} {'p50 ms':>16} {'action ms':>10}")
+    for name in results:
+        if not name.startswith('saved['):
+            continue
+        command = name[len('saved['):-1]
+        full = results[f'parse[full][{command}]']
+        compact = results[f'parse[compact][{command}]']
+        stream = results[f'stream[{command}]']
+        print(f"{command[:56]:56} "
+              f"{full['prompt_tokens']:5.0f} -> {compact['prompt_tokens']:4.0f} "
+              f"{full['output_tokens']:4.0f} -> {compact['output_tokens']:3.0f} "
+              f"{full['p50_ms']:6.1f} -> {compact['p50_ms']:6.1f} {stream['action_p50_ms']:10.1f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--iterations', type=int, default=5)
+    parser.add_argument('--model-latency-ms', type=float, default=150.0, help='fixed time per call')
+    parser.add_argument('--ms-per-1k-prompt-tokens', type=float, default=40.0, help='prefill cost')
+    parser.add_argument('--ms-per-output-token', type=float, default=8.0, help='decode cost')
+    parser.add_argument('--out', default='bench_prompt.json')
+    parser.add_argument('--baseline', help='previous results file to compare against')
+    parser.add_argument('--threshold', type=float, default=0.10)
+    args = parser.parse_args(argv)
+
+    results = run(args)
+    print_savings(results)
+    write_results(args.out, metadata(**{k: v for k, v in vars(args).items()
+                                        if k not in ('out', 'baseline')}), results)
+    print(f'\nResults written to {args.out}')
+
+    if args.baseline:
+        # Only the measured variants; a larger saving is not a regression
+        measured = {k: v for k, v in results.items() if not k.startswith('saved[')}
+        regressions = compare(args.baseline, measured, args.threshold)
+        for line in regressions:
+            print(f'REGRESSION {line}')
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,192 @@
+"""
+Render time per UI interaction with whole-script reruns vs fragment reruns.
+
+    python -m benchmarks.bench_render --iterations 20 --out bench_render.json
+
+Drives app.py through Streamlit's AppTest twice: with PARTIAL_RERUNS=0
+every click reruns the whole script; with PARTIAL_RERUNS=1 a click reruns
+only the fragment that owns the widget, as the browser would request it
+(AppTest itself always reruns everything, so the fragment id is added to
+the rerun request here). Reports wall time per interaction, the part of it
+spent running the script (AppTest adds a fixed per-run setup cost) and
+how many elements the rerun sent.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+from benchmarks.common import FakeGmailProcess, compare, metadata, summarize, write_results
+
+INTERACTIONS = ('open_email', 'back', 'unrecognized_command', 'clear_history', 'compose_typing')
+
+
+class FragmentReruns:
+    """Routes AppTest reruns to the fragment owning the widget that changed"""
+
+    def __init__(self):
+        self.owner = {}         # widget id -> fragment id, from the last full run
+        self.target = None
+        self.deltas = 0
+        self.script_seconds = 0.0   # inside the script, without AppTest's per-run setup
+
+    def install(self):
+        from streamlit.testing.v1 import local_script_runner
+        from streamlit.testing.v1.local_script_runner import LocalScriptRunner
+
+        rerun_data, run, run_script = (local_script_runner.RerunData, LocalScriptRunner.run,
+                                       LocalScriptRunner._run_script)
+        reruns = self
+
+        # Both the runner's initial request and the one run() adds must be
+        # scoped, or they coalesce into a full rerun
+        def scoped_rerun_data(**kwargs):
+            if reruns.target:
+                kwargs.setdefault('fragment_id_queue', [reruns.target])
+            return rerun_data(**kwargs)
+
+        def timed_run_script(runner, *args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return run_script(runner, *args, **kwargs)
+            finally:
+                reruns.script_seconds += time.perf_counter() - start
+
+        def recording_run(runner, *args, **kwargs):
+            reruns.script_seconds = 0.0
+            tree = run(runner, *args, **kwargs)
+            messages = [m for m in runner.forward_msgs() if m.HasField('delta')]
+            reruns.deltas = len(messages)
+            if not reruns.target:
+                reruns.owner = {}
+                for message in messages:
+                    element = message.delta.new_element
+                    kind = element.WhichOneof('type') if message.delta.HasField('new_element') else None
+                    widget_id = getattr(getattr(element, kind), 'id', None) if kind else None
+                    if widget_id and message.delta.fragment_id:
+                        reruns.owner[widget_id] = message.delta.fragment_id
+            return tree
+
+        local_script_runner.RerunData = scoped_rerun_data
+        LocalScriptRunner.run = recording_run
+        LocalScriptRunner._run_script = timed_run_script
+
+    def rerun(self, app, widget):
+        """Time the rerun triggered by `widget`; returns (ms, script ms, elements sent)"""
+        self.target = self.owner.get(widget.id)
+        start = time.perf_counter()
+        try:
+            app.run()
+        finally:
+            elapsed = (time.perf_counter() - start) * 1000
+            scoped, self.target = self.target, None
+        deltas, script_ms = self.deltas, self.script_seconds * 1000
+        if scoped:
+            # A fragment run only returns the fragment's elements; rebuild the tree
+            app.run()
+        if app.exception:
+            raise RuntimeError(app.exception[0].value)
+        return elapsed, script_ms, deltas
+
+
+def button(app, label):
+    return next(b for b in app.button if b.label == label)
+
+
+def run_mode(args, partial, reruns):
+    from streamlit.testing.v1 import AppTest
+    from benchmarks.common import ROOT
+
+    os.environ['PARTIAL_RERUNS'] = '1' if partial else '0'
+    app = AppTest.from_file(os.path.join(ROOT, 'app.py'), default_timeout=60)
+    app.run()
+
+    samples = {name: ([], [], []) for name in INTERACTIONS}
+
+    def record(name, widget):
+        for sample, value in zip(samples[name], reruns.rerun(app, widget)):
+            sample.append(value)
+
+    for _ in range(args.iterations):
+        record('open_email', next(b for b in app.button if b.label == '📖 Open').click())
+        record('back', button(app, '⬅️ Back').click())
+
+        app.text_input(key='cmd_input').input('what is the weather like')
+        record('unrecognized_command', button(app, '▶️ Execute').click())
+        record('clear_history', button(app, 'Clear History').click())
+
+        button(app, '✉️ Compose').click().run()
+        record('compose_typing', app.text_input(key='subj').input(f'Draft {time.perf_counter()}'))
+        button(app, '❌ Cancel').click().run()
+
+    results = {}
+    for name, (elapsed, script_ms, deltas) in samples.items():
+        result = summarize(elapsed)
+        result['script_p50_ms'] = summarize(script_ms)['p50_ms']
+        result['elements_per_rerun'] = round(sum(deltas) / len(deltas), 1)
+        results[f"{name}[{'fragment' if partial else 'full'}]"] = result
+    return results
+
+
+def run(args):
+    with FakeGmailProcess(args.size, args.seed, args.api_latency_ms) as server:
+        os.environ['GMAIL_API_ENDPOINT'] = server.url
+        os.environ['MODEL_BACKEND'] = 'fake'
+        os.environ['FAKE_MODEL_LATENCY_MS'] = str(args.model_latency_ms)
+        os.environ['SYNC_DAEMON'] = 'off'
+        os.environ['MAILSTORE_PATH'] = os.path.join(tempfile.mkdtemp(), 'mailstore.db')
+
+        import outbox
+        from scheduler import SCHEDULER
+
+        outbox.OUTBOX_PATH = os.path.join(tempfile.mkdtemp(), 'outbox.db')
+        SCHEDULER.rate = SCHEDULER.burst = SCHEDULER.tokens = float('inf')
+
+        reruns = FragmentReruns()
+        reruns.install()
+        results = run_mode(args, False, reruns)
+        results.update(run_mode(args, True, reruns))
+    return results
+
+
+def print_speedups(results):
+    print(f"{'interaction':24} {'full p50':>9} {'frag p50':>9} {'script full':>12} {'script frag':>12} "
+          f"{'speedup':>8} {'elements':>10}")
+    for name in INTERACTIONS:
+        full, fragment = results[f'{name}[full]'], results[f'{name}[fragment]']
+        speedup = full['script_p50_ms'] / fragment['script_p50_ms'] if fragment['script_p50_ms'] else 0
+        elements = f"{full['elements_per_rerun']:.0f} -> {fragment['elements_per_rerun']:.0f}"
+        print(f"{name:24} {full['p50_ms']:9.1f} {fragment['p50_ms']:9.1f} {full['script_p50_ms']:12.1f} "
+              f"{fragment['script_p50_ms']:12.1f} {speedup:7.2f}x {elements:>10}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--size', type=int, default=2000, help='synthetic mailbox size')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--iterations', type=int, default=20)
+    parser.add_argument('--api-latency-ms', type=float, default=0.0)
+    parser.add_argument('--model-latency-ms', type=float, default=0.0)
+    parser.add_argument('--out', default='bench_render.json')
+    parser.add_argument('--baseline', help='previous results file to compare against')
+    parser.add_argument('--threshold', type=float, default=0.10)
+    args = parser.parse_args(argv)
+
+    results = run(args)
+    print_speedups(results)
+    write_results(args.out, metadata(**{k: v for k, v in vars(args).items()
+                                        if k not in ('out', 'baseline')}), results)
+    print(f'\nResults written to {args.out}')
+
+    if args.baseline:
+        regressions = compare(args.baseline, results, args.threshold)
+        for line in regressions:
+            print(f'REGRESSION {line}')
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
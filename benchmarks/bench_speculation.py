@@ -0,0 +1,117 @@
+"""
+Speculative prefetch on partial transcripts: hit rate and latency saved.
+
+    python -m benchmarks.bench_speculation --latency-ms 40 --model-latency-ms 400 --out bench_speculation.json
+
+Speaks every command in the bench_commands corpus one word per --word-ms,
+feeding each partial transcript to a Speculator, then parses the final
+transcript on the fake model and fetches what the command needs (listing
+or open email) from the fake Gmail server, taking the speculated result
+when the guess matched. Reports the time from the final transcript to
+the command's data being ready with and without speculation, and the
+hit rate.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+from benchmarks.bench_commands import CORPUS
+from benchmarks.common import FakeGmailProcess, compare, metadata, summarize, write_results
+
+
+def run(args):
+    with FakeGmailProcess(args.size, args.seed, args.latency_ms) as server:
+        os.environ['GMAIL_API_ENDPOINT'] = server.url
+        os.environ['MODEL_BACKEND'] = 'fake'
+        os.environ['FAKE_MODEL_LATENCY_MS'] = str(args.model_latency_ms)
+        os.environ['MAILSTORE_PATH'] = os.path.join(tempfile.mkdtemp(), 'mailstore.db')
+
+        # Imported after the endpoint is set
+        import ai_assistant
+        import mail_service
+        import metrics
+        import speculation
+        from mail_cache import CACHE
+        from scheduler import SCHEDULER
+
+        SCHEDULER.rate = SCHEDULER.burst = SCHEDULER.tokens = float('inf')
+        service = mail_service.get_gmail_service()
+        current_email_id = mail_service.list_emails(service, use_cache=False)[0].id
+
+        def command(text, speculator):
+            """ms from the final transcript to the command's data"""
+            CACHE.clear()
+            words = text.split()
+            for i in range(1, len(words) + 1):
+                speculator.update(' '.join(words[:i]), current_email_id)
+                time.sleep(args.word_ms / 1000)
+
+            start = time.perf_counter()
+            parsed = ai_assistant.parse_command(text, 'inbox', current_email_id)
+            key = speculation.key_for(parsed, current_email_id)
+            if key is not None:
+                hit, _ = speculator.take(key)
+                if not hit and key[0] == 'list':
+                    mail_service.list_emails(service, query=key[1])
+                elif not hit:
+                    mail_service.get_email_detail(service, key[1])
+            speculator.settle()
+            return (time.perf_counter() - start) * 1000
+
+        results = {}
+        for enabled in (False, True):
+            mode = 'speculative' if enabled else 'baseline'
+            speculator = speculation.Speculator(enabled=enabled)
+            before = {o: metrics.SPECULATION_OUTCOMES.value(outcome=o) for o in ('hit', 'miss', 'late', 'unused', 'error')}
+            for text in CORPUS:
+                samples = [command(text, speculator) for _ in range(args.iterations)]
+                results[f'{mode}[{text}]'] = summarize(samples)
+            if enabled:
+                outcomes = {o: metrics.SPECULATION_OUTCOMES.value(outcome=o) - n for o, n in before.items()}
+                total = sum(outcomes.values())
+                results['speculation'] = dict(outcomes, hit_rate=round(outcomes['hit'] / total, 3) if total else 0.0)
+    return results
+
+
+def print_savings(results):
+    print(f"{'command':56} {'baseline p50':>13} {'spec p50':>9} {'saved':>8}")
+    for text in CORPUS:
+        base, spec = results[f'baseline[{text}]'], results[f'speculative[{text}]']
+        print(f"{text:56} {base['p50_ms']:13.1f} {spec['p50_ms']:9.1f} {base['p50_ms'] - spec['p50_ms']:8.1f}")
+    outcomes = results['speculation']
+    print(f"\nhit rate {outcomes['hit_rate']:.0%} ({outcomes['hit']} hit, {outcomes['miss']} miss, "
+          f"{outcomes['late']} late, {outcomes['unused']} unused, {outcomes['error']} error)")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--size', type=int, default=2000, help='synthetic mailbox size')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--iterations', type=int, default=5)
+    parser.add_argument('--latency-ms', type=float, default=40.0, help='fake Gmail latency per request')
+    parser.add_argument('--model-latency-ms', type=float, default=400.0)
+    parser.add_argument('--word-ms', type=float, default=250.0, help='time between partial transcripts')
+    parser.add_argument('--out', default='bench_speculation.json')
+    parser.add_argument('--baseline', help='previous results file to compare against')
+    parser.add_argument('--threshold', type=float, default=0.10)
+    args = parser.parse_args(argv)
+
+    results = run(args)
+    print_savings(results)
+    write_results(args.out, metadata(**{k: v for k, v in vars(args).items()
+                                        if k not in ('out', 'baseline')}), results)
+    print(f'\nResults written to {args.out}')
+
+    if args.baseline:
+        regressions = compare(args.baseline, results, args.threshold)
+        for line in regressions:
+            print(f'REGRESSION {line}')
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,100 @@
+"""
+End of speech -> command latency for server-side STT, with and without the fast path.
+
+    python -m benchmarks.bench_stt --model-latency-ms 400 --out bench_stt.json
+
+Streams fake_utterance() audio for every command in the bench_commands
+corpus through speech.Utterance, 100 ms chunk by chunk, on the fake
+recognizer (FAKE final-decode cost) and the fake model. The wait is the
+trailing silence the recognizer sat through plus the final decode plus,
+unless the fast path already matched, parse_command. Also checks that
+every fast-path command equals what the local grammar makes of the full
+transcript.
+"""
+import argparse
+import os
+import sys
+import time
+
+from benchmarks.bench_commands import CORPUS
+from benchmarks.common import compare, metadata, summarize, write_results
+
+
+def speak(command, recognizer, fast_path):
+    """Returns (ms from end of speech to a parsed command, path, parsed)"""
+    import ai_assistant
+    import speech
+
+    utterance = speech.Utterance(command, recognizer, fast_path=fast_path)
+    for seq, chunk in enumerate(speech.fake_utterance(command)):
+        if utterance.feed([(seq, chunk)]):
+            break
+    parsed, parse_ms = utterance.command, 0.0
+    if parsed is None:
+        start = time.perf_counter()
+        parsed = ai_assistant.parse_command(utterance.text, 'inbox')
+        parse_ms = (time.perf_counter() - start) * 1000
+    return utterance.wait_ms + parse_ms, utterance.path, parsed
+
+
+def run(args):
+    os.environ['MODEL_BACKEND'] = 'fake'
+    os.environ['FAKE_MODEL_LATENCY_MS'] = str(args.model_latency_ms)
+
+    import speech
+    from local_parser import parse_locally
+
+    recognizer = speech.FakeRecognizer(final_ms=args.final_decode_ms)
+    results, mismatches = {}, []
+    for command in CORPUS:
+        for fast_path in (False, True):
+            samples, paths = [], set()
+            for _ in range(args.iterations):
+                elapsed, path, parsed = speak(command, recognizer, fast_path)
+                samples.append(elapsed)
+                paths.add(path)
+                if path == 'fast' and parsed != parse_locally(command):
+                    mismatches.append(command)
+            result = summarize(samples)
+            result['path'] = '/'.join(sorted(paths))
+            results[f"{'fast' if fast_path else 'final'}[{command}]"] = result
+    return results, sorted(set(mismatches))
+
+
+def print_waits(results):
+    print(f"{'command':56} {'final p50':>10} {'fast p50':>10} {'path':>6}")
+    for command in CORPUS:
+        final, fast = results[f'final[{command}]'], results[f'fast[{command}]']
+        print(f"{command:56} {final['p50_ms']:10.1f} {fast['p50_ms']:10.1f} {fast['path']:>6}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--iterations', type=int, default=5)
+    parser.add_argument('--model-latency-ms', type=float, default=400.0)
+    parser.add_argument('--final-decode-ms', type=float, default=50.0,
+                        help='fake recognizer cost of the final decode')
+    parser.add_argument('--out', default='bench_stt.json')
+    parser.add_argument('--baseline', help='previous results file to compare against')
+    parser.add_argument('--threshold', type=float, default=0.10)
+    args = parser.parse_args(argv)
+
+    results, mismatches = run(args)
+    print_waits(results)
+    for command in mismatches:
+        print(f'MISMATCH fast path disagrees with the local grammar: {command}')
+    write_results(args.out, metadata(**{k: v for k, v in vars(args).items()
+                                        if k not in ('out', 'baseline')}), results)
+    print(f'\nResults written to {args.out}')
+
+    if args.baseline:
+        regressions = compare(args.baseline, results, args.threshold)
+        for line in regressions:
+            print(f'REGRESSION {line}')
+        if regressions:
+            return 1
+    return 1 if mismatches else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
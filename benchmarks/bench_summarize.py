@@ -0,0 +1,116 @@
+"""
+Thread summary tokens and latency by thread size: cold, after a reply, cached.
+
+    python -m benchmarks.bench_summarize --sizes 1,5,20,60 --out bench_summarize.json
+
+Builds threads from the synthetic mailbox's bodies, each reply quoting
+the text of the message before it, and summarizes them on the fake model, whose
+latency grows with prompt and output tokens. Per size it reports the
+cold summary (single call or map-reduce over chunks), the same thread
+after one more reply (an update of the cached summary), and asking
+again (a cache hit), with model calls and tokens for each. The
+"one prompt" row is the whole thread, quotes included, in a single call.
+"""
+import argparse
+import os
+import sys
+import time
+
+from benchmarks.common import metadata, summarize, write_results
+
+
+def build_thread(mailbox, size, offset=0):
+    """`size` messages, each quoting what the one before it said"""
+    from mailbox_generator import FIRST_NAMES, LAST_NAMES
+
+    messages, previous = [], None
+    for i in range(offset, offset + size):
+        name = f'{FIRST_NAMES[i % 5]} {LAST_NAMES[i % 7]}'
+        text = body = mailbox.body_text(i)
+        if previous:
+            quoted = '\n'.join(f'> {line}' for line in previous[1].splitlines())
+            body += f"\n\nOn Mon, 5 Jan 2026 at 10:{i % 60:02d}, {previous[0]} wrote:\n{quoted}"
+        messages.append({'id': f'bench{i:05d}', 'sender': name, 'body': body})
+        previous = name, text
+    return messages
+
+
+def run(args):
+    os.environ['MODEL_BACKEND'] = 'fake'
+    os.environ['FAKE_MODEL_LATENCY_MS'] = str(args.model_latency_ms)
+    os.environ['FAKE_MODEL_MS_PER_1K_PROMPT_TOKENS'] = str(args.ms_per_1k_prompt_tokens)
+    os.environ['FAKE_MODEL_MS_PER_OUTPUT_TOKEN'] = str(args.ms_per_output_token)
+
+    # Imported after the environment is set
+    import summarizer
+    from mailbox_generator import SyntheticMailbox
+
+    mailbox = SyntheticMailbox(max(args.sizes) + 1, args.seed)
+
+    def measure(messages, clear):
+        samples, summary = [], None
+        for _ in range(args.repeats):
+            clear()
+            start = time.perf_counter()
+            summary = summarizer.summarize_thread(messages)
+            samples.append((time.perf_counter() - start) * 1000)
+        return dict(summarize(samples), path=summary.path, chunks=summary.chunks, reused=summary.reused,
+                    model_calls=summary.model_calls, prompt_tokens=summary.prompt_tokens,
+                    output_tokens=summary.output_tokens)
+
+    results = {}
+    for size in args.sizes:
+        thread = build_thread(mailbox, size)
+        replied = build_thread(mailbox, size + 1)
+
+        prompt = summarizer.SINGLE_PROMPT.format(
+            messages='\n\n'.join(f"From: {m['sender']}\n{m['body']}" for m in thread))
+        samples = []
+        for _ in range(args.repeats):
+            start = time.perf_counter()
+            response = summarizer.model.generate_content(prompt, generation_config=summarizer.GENERATION_CONFIG)
+            samples.append((time.perf_counter() - start) * 1000)
+        prompt_tokens, output_tokens = summarizer.usage_of(response)
+        results[f'one prompt[{size}]'] = dict(summarize(samples), path='one prompt', chunks=1, reused=0,
+                                              model_calls=1, prompt_tokens=prompt_tokens,
+                                              output_tokens=output_tokens)
+
+        results[f'cold[{size}]'] = measure(thread, summarizer.clear_cache)
+
+        def summarized_before_reply():
+            summarizer.clear_cache()
+            summarizer.summarize_thread(thread)
+        results[f'reply[{size}+1]'] = measure(replied, summarized_before_reply)
+        results[f'cached[{size}+1]'] = measure(replied, lambda: None)
+    return results
+
+
+def print_table(results):
+    print(f"{'summary':18} {'path':12} {'chunks':>6} {'calls':>5} {'prompt tok':>10} {'output tok':>10} "
+          f"{'p50':>10}")
+    for name, result in results.items():
+        print(f"{name:18} {result['path']:12} {result['chunks']:6} {result['model_calls']:5} "
+              f"{result['prompt_tokens']:10} {result['output_tokens']:10} {result['p50_ms']:7.0f} ms")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', type=lambda s: [int(n) for n in s.split(',')], default=[1, 5, 20, 60],
+                        help='messages per thread, comma-separated')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--model-latency-ms', type=float, default=150.0, help='fixed time per call')
+    parser.add_argument('--ms-per-1k-prompt-tokens', type=float, default=40.0, help='prefill cost')
+    parser.add_argument('--ms-per-output-token', type=float, default=8.0, help='decode cost')
+    parser.add_argument('--out', default='bench_summarize.json')
+    args = parser.parse_args(argv)
+
+    results = run(args)
+    print_table(results)
+    write_results(args.out, metadata(**{k: v for k, v in vars(args).items() if k != 'out'}), results)
+    print(f'\nResults written to {args.out}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
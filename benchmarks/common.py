@@ -0,0 +1,178 @@
+import json
+import os
+import platform
+import resource
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+from datetime import datetime, timezone
+
+# ────────────────────────────────────────────────
+# Shared helpers for the benchmark runners
+# ────────────────────────────────────────────────
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def percentile(samples, pct):
+    """Nearest-rank percentile of a list of numbers"""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    rank = max(0, min(len(ordered) - 1, round(pct / 100 * len(ordered) + 0.5) - 1))
+    return ordered[rank]
+
+
+def summarize(samples_ms):
+    return {
+        'runs': len(samples_ms),
+        'mean_ms': round(sum(samples_ms) / len(samples_ms), 3) if samples_ms else 0.0,
+        'p50_ms': round(percentile(samples_ms, 50), 3),
+        'p95_ms': round(percentile(samples_ms, 95), 3),
+        'p99_ms': round(percentile(samples_ms, 99), 3),
+    }
+
+
+def peak_rss_kb():
+    """Peak resident set size of this process so far"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS reports bytes, Linux kilobytes
+    return peak // 1024 if sys.platform == 'darwin' else peak
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+class FakeGmailProcess:
+    """
+    fake_gmail_server.py in a subprocess, so its memory and CPU don't
+    count against the client being measured.
+    """
+
+    def __init__(self, size=1000, seed=0, latency_ms=0.0, jitter_ms=0.0, error_rate=0.0):
+        self.port = _free_port()
+        self.url = f'http://127.0.0.1:{self.port}'
+        self.process = subprocess.Popen(
+            [sys.executable, os.path.join(ROOT, 'fake_gmail_server.py'),
+             '--port', str(self.port), '--size', str(size), '--seed', str(seed),
+             '--latency-ms', str(latency_ms), '--jitter-ms', str(jitter_ms),
+             '--error-rate', str(error_rate)],
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+        self._wait_ready()
+
+    def _wait_ready(self, timeout=15):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            try:
+                self.stats()
+                return
+            except OSError:
+                time.sleep(0.05)
+        self.stop()
+        raise RuntimeError('fake Gmail server did not start')
+
+    def stats(self, reset=False):
+        request = urllib.request.Request(self.url + '/_fake/stats', method='POST' if reset else 'GET')
+        with urllib.request.urlopen(request, timeout=5) as response:
+            return json.load(response)
+
+    def stop(self):
+        self.process.terminate()
+        self.process.wait(timeout=5)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def measure(fn, iterations, server=None, warmup=1, settle=None):
+    """
+    Time `fn` over `iterations` runs.
+    With a server, also report API calls and bytes on the wire per run.
+    `settle` runs after each run, untimed (e.g. to wait for background work).
+    """
+    for _ in range(warmup):
+        fn()
+        if settle:
+            settle()
+    if server:
+        server.stats(reset=True)
+
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+        if settle:
+            settle()
+
+    result = summarize(samples)
+    if server:
+        stats = server.stats(reset=True)
+        calls = sum(count for route, count in stats['requests'].items())
+        result['api_calls_per_op'] = round(calls / iterations, 2)
+        result['bytes_per_op'] = round((stats['bytes_in'] + stats['bytes_out']) / iterations)
+        result['calls_by_method'] = {k: round(v / iterations, 2) for k, v in stats['requests'].items()}
+    result['peak_rss_kb'] = peak_rss_kb()
+    return result
+
+
+def metadata(**extra):
+    meta = {
+        'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'git_rev': git_revision(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+    }
+    meta.update(extra)
+    return meta
+
+
+def write_results(path, meta, results):
+    with open(path, 'w') as f:
+        json.dump({'meta': meta, 'results': results}, f, indent=2, sort_keys=True)
+
+
+def compare(baseline_path, results, threshold=0.10):
+    """
+    Compare against a previous results file.
+    Returns a list of human-readable regressions (empty if none).
+    """
+    with open(baseline_path) as f:
+        baseline = json.load(f)['results']
+
+    regressions = []
+    for name, current in results.items():
+        previous = baseline.get(name)
+        if not previous:
+            continue
+        for key in ('p50_ms', 'p95_ms', 'api_calls_per_op', 'bytes_per_op'):
+            if key not in current or not previous.get(key):
+                continue
+            change = (current[key] - previous[key]) / previous[key]
+            if change > threshold:
+                regressions.append(f'{name}: {key} {previous[key]} -> {current[key]} (+{change:.0%})')
+    return regressions
+
+
+def print_table(results):
+    print(f"{'operation':40} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'calls':>7} {'bytes':>10}")
+    for name, r in results.items():
+        print(f"{name:40} {r['p50_ms']:9.2f} {r['p95_ms']:9.2f} {r['p99_ms']:9.2f} "
+              f"{r.get('api_calls_per_op', 0):7} {r.get('bytes_per_op', 0):10}")
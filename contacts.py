@@ -0,0 +1,321 @@
+import bisect
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import Counter
+from email.utils import formataddr
+
+from mail_headers import parse_sender
+from mail_store import STORE
+import metrics
+
+# ────────────────────────────────────────────────
+# Contact index
+# ────────────────────────────────────────────────
+# Everyone in the local mail store: senders of inbox mail and the To/Cc
+# addresses of every stored message. Each message adds
+# 0.5 ** (age / CONTACT_HALF_LIFE_DAYS) to a contact's score, mail we sent
+# to them SENT_WEIGHT times as much, so people written to often and
+# lately rank first.
+#
+# Names and address parts are folded to lowercase ASCII tokens ("Zoë
+# Müller <zoe.muller@...>" → zoe, muller, zoe.muller@...) in a sorted list,
+# so a prefix lookup is a bisect. Words with no prefix match fall back to
+# a bigram index of the tokens: tokens sharing enough bigrams with the word
+# are checked with a bounded edit distance ("aclie" → alice).
+#
+# "open email from alice" resolves to the newest inbox message of the
+# matching contact without a Gmail search. Only exact and prefix matches
+# replace the search: the store holds recent mail only, so "john" could
+# be someone it doesn't know, one edit from "joan". A typo match is used
+# only when Gmail's from: search finds nothing. Likewise names in a
+# command's To are expanded to addresses only on exact or prefix matches;
+# the compose view suggests recipients, typo matches included. The
+# index is rebuilt when the store has changed, checked at most every
+# CONTACT_REFRESH_SECONDS.
+
+CONTACT_HALF_LIFE_DAYS = float(os.getenv('CONTACT_HALF_LIFE_DAYS', '30'))
+CONTACT_REFRESH_SECONDS = float(os.getenv('CONTACT_REFRESH_SECONDS', '5'))
+SENT_WEIGHT = 2.0
+# Shorter words match too many tokens to be worth a typo guess
+FUZZY_MIN_LENGTH = 4
+
+# Match quality, best first
+EXACT, PREFIX, FUZZY = 0, 1, 2
+
+_SPLIT = re.compile(r'[^a-z0-9@.+-]+')
+_ADDRESS_PARTS = re.compile(r'[._+-]')
+# Letters NFKD doesn't decompose
+_FOLD = str.maketrans({'ł': 'l', 'ø': 'o', 'đ': 'd', 'ß': 'ss', 'æ': 'ae', 'œ': 'oe'})
+
+
+def fold(text):
+    """Lowercase ASCII approximation of `text` for matching"""
+    text = unicodedata.normalize('NFKD', text.lower().translate(_FOLD))
+    return text.encode('ascii', 'ignore').decode()
+
+
+def _words(text):
+    return [word for word in _SPLIT.split(fold(text)) if word]
+
+
+def _bigrams(word):
+    padded = f'^{word}'
+    return {padded[i:i + 2] for i in range(len(padded) - 1)}
+
+
+def _within(a, b, limit):
+    """Whether the edit distance (with transpositions) of a and b is at most `limit`"""
+    if abs(len(a) - len(b)) > limit:
+        return False
+    previous2, previous = None, list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = a[i - 1] != b[j - 1]
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], previous2[j - 2] + 1)
+        if min(current) > limit:
+            return False
+        previous2, previous = previous, current
+    return previous[-1] <= limit
+
+
+class Contact:
+    __slots__ = ('address', 'name', 'score', 'count', 'last_seen', 'latest_id', 'latest_at')
+
+    def __init__(self, address):
+        self.address = address
+        self.name = ''
+        self.score = 0.0
+        self.count = 0
+        self.last_seen = 0
+        # Newest inbox message from this contact
+        self.latest_id = None
+        self.latest_at = 0
+
+    def tokens(self):
+        local, _, domain = self.address.partition('@')
+        parts = _words(self.name) + _ADDRESS_PARTS.split(local) + [local, domain.split('.')[0], self.address]
+        return {part for part in parts if part}
+
+    def __str__(self):
+        # Quoted when the name has specials: "Smith, John" <john.smith@...>
+        return formataddr((self.name, self.address))
+
+    def __repr__(self):
+        return f'Contact({self.address!r}, score={self.score:.2f}, count={self.count})'
+
+
+class ContactIndex:
+    """Prefix and typo-tolerant lookup over contacts, ranked by score"""
+
+    def __init__(self, contacts):
+        # A contact's rank is its position here
+        self.contacts = sorted(contacts, key=lambda c: (-c.score, c.address))
+        entries = sorted((token, rank) for rank, contact in enumerate(self.contacts)
+                         for token in contact.tokens())
+        self._tokens = [token for token, _ in entries]
+        self._ranks = [rank for _, rank in entries]
+        self._bigrams = {}
+        # Typos are matched against words, not whole addresses
+        for token in {token for token in self._tokens if '@' not in token and '.' not in token}:
+            for gram in _bigrams(token):
+                self._bigrams.setdefault(gram, []).append(token)
+
+    def __len__(self):
+        return len(self.contacts)
+
+    def _ranks_of(self, token):
+        start = bisect.bisect_left(self._tokens, token)
+        end = bisect.bisect_right(self._tokens, token, start)
+        return self._ranks[start:end]
+
+    def _match(self, word):
+        """{rank: quality} of the contacts with a token matching `word`"""
+        matches = {}
+        start = bisect.bisect_left(self._tokens, word)
+        for i in range(start, len(self._tokens)):
+            token = self._tokens[i]
+            if not token.startswith(word):
+                break
+            quality = EXACT if token == word else PREFIX
+            rank = self._ranks[i]
+            matches[rank] = min(quality, matches.get(rank, FUZZY))
+        if matches or len(word) < FUZZY_MIN_LENGTH:
+            return matches
+
+        limit = 1 if len(word) < 7 else 2
+        grams = _bigrams(word)
+        shared = Counter(token for gram in grams for token in self._bigrams.get(gram, ()))
+        # Each edit changes at most three of the word's bigrams
+        needed = max(1, len(grams) - 3 * limit)
+        for token, count in shared.items():
+            if count < needed:
+                continue
+            # A typo in what was typed so far, or in the whole token
+            if _within(word, token[:len(word)], limit) or _within(word, token, limit):
+                for rank in self._ranks_of(token):
+                    matches[rank] = FUZZY
+        return matches
+
+    def _scored(self, text):
+        """{rank: worst quality over the words} of contacts matching every word"""
+        combined = None
+        for word in _words(text):
+            matches = self._match(word)
+            if combined is None:
+                combined = matches
+            else:
+                combined = {rank: max(quality, matches[rank]) for rank, quality in combined.items() if rank in matches}
+            if not combined:
+                break
+        return combined or {}
+
+    def search(self, text, limit=5, fuzzy=True):
+        """
+        Contacts matching every word of `text`, best match then highest
+        score first. Typo matches only count if `fuzzy`.
+        """
+        scored = self._scored(text)
+        worst = FUZZY if fuzzy else PREFIX
+        ranked = sorted((rank for rank, quality in scored.items() if quality <= worst),
+                        key=lambda rank: (scored[rank], rank))
+        return [self.contacts[rank] for rank in ranked[:limit]]
+
+    def latest_from(self, text, fuzzy=False):
+        """
+        The best-matching contact with inbox mail, preferring the newest
+        mail among equally good matches (what a Gmail from: search would
+        return first), or None. Typo matches only count if `fuzzy`.
+        """
+        scored = self._scored(text)
+        worst = FUZZY if fuzzy else PREFIX
+        with_mail = [rank for rank, quality in scored.items()
+                     if quality <= worst and self.contacts[rank].latest_id is not None]
+        if not with_mail:
+            return None
+        best = min(with_mail, key=lambda rank: (scored[rank], -self.contacts[rank].latest_at))
+        return self.contacts[best]
+
+
+def build(store=STORE, now=None):
+    """ContactIndex of everyone in the store"""
+    now = time.time() if now is None else now
+    me = (store.get_state('email_address') or '').lower()
+    half_life = CONTACT_HALF_LIFE_DAYS * 86400
+    contacts = {}
+
+    def add(address, name, seen_at, weight):
+        if '@' not in address or address == me:
+            return None
+        contact = contacts.get(address)
+        if contact is None:
+            contact = contacts[address] = Contact(address)
+        contact.count += 1
+        contact.score += weight * 0.5 ** (max(0.0, now - seen_at) / half_life)
+        if seen_at >= contact.last_seen:
+            contact.last_seen = seen_at
+            contact.name = name or contact.name
+        return contact
+
+    for row in store.inbox_senders():
+        sender = parse_sender(row['sender'])
+        seen_at = row['internal_date'] // 1000
+        contact = add(sender.address, sender.name, seen_at, 1.0)
+        if contact is not None and seen_at >= contact.latest_at:
+            contact.latest_id, contact.latest_at = row['id'], seen_at
+    for row in store.recipients():
+        add(row['address'], row['name'], row['internal_date'] // 1000, SENT_WEIGHT if row['sent'] else 1.0)
+    return ContactIndex(contacts.values())
+
+
+_index = ContactIndex([])
+_version = None
+_checked_at = 0.0
+_index_lock = threading.Lock()
+
+
+def index(store=STORE):
+    """The process-wide ContactIndex, rebuilt if the store changed"""
+    global _index, _version, _checked_at
+    with _index_lock:
+        if time.monotonic() - _checked_at < CONTACT_REFRESH_SECONDS:
+            return _index
+        _checked_at = time.monotonic()
+        version = store.contacts_version()
+        if version != _version:
+            _index, _version = build(store), version
+        return _index
+
+
+def invalidate():
+    """Check the store again on the next lookup"""
+    global _checked_at
+    _checked_at = 0.0
+
+
+def latest_from(sender, fuzzy=False):
+    """Contact (with latest_id) for a spoken or typed sender, or None"""
+    contact = index().latest_from(sender, fuzzy)
+    metrics.CACHE_LOOKUPS.inc(cache='contacts', result='hit' if contact else 'miss')
+    return contact
+
+
+def suggest(text, limit=5):
+    return index().search(text, limit)
+
+
+def split_recipients(value):
+    """
+    Comma-separated parts of a To value. Commas inside quoted names or
+    <...> don't split; unlike getaddresses, a bare "john smith" stays whole.
+    """
+    parts, start, quoted, angle, escaped = [], 0, False, False, False
+    for i, ch in enumerate(value):
+        if escaped:
+            escaped = False
+        elif quoted:
+            escaped = ch == '\\'
+            quoted = ch != '"'
+        elif angle:
+            angle = ch != '>'
+        elif ch == '"':
+            quoted = True
+        elif ch == '<':
+            angle = True
+        elif ch == ',':
+            parts.append(value[start:i].strip())
+            start = i + 1
+    parts.append(value[start:].strip())
+    return parts
+
+
+def expand_recipients(value):
+    """
+    Replace names in a comma-separated To value by their best exact or
+    prefix match; a possible typo is left for the To suggestions.
+    """
+    parts = []
+    for part in split_recipients(value):
+        if part and '@' not in part and (found := index().search(part, 1, fuzzy=False)):
+            part = str(found[0])
+        parts.append(part)
+    return ', '.join(p for p in parts if p)
+
+
+def complete(value, limit=5):
+    """
+    (contact, completed To value) pairs for the last comma-separated
+    part of `value`, unless that part is already a full address.
+    """
+    *head, last = split_recipients(value)
+    if not last or last.endswith('>'):
+        return []
+    head = [part for part in head if part]
+    prefix = ', '.join(head) + ', ' if head else ''
+    return [(contact, f'{prefix}{contact}') for contact in suggest(last, limit)
+            if contact.address != last.lower()]
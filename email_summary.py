@@ -0,0 +1,57 @@
+import sys
+from datetime import datetime
+
+from mail_headers import parse_sender
+
+# ────────────────────────────────────────────────
+# Listing rows
+# ────────────────────────────────────────────────
+# One EmailSummary per message in a listing. They are slotted and
+# immutable, so the mail cache hands the same objects to every session
+# instead of copying dicts. Senders repeat across a mailbox and are
+# interned, along with the sender's lowercased address for grouping by
+# correspondent. The date stays an int (epoch seconds) and is only formatted
+# when a row is rendered.
+
+DATE_FORMAT = '%Y-%m-%d %H:%M'
+
+
+class EmailSummary:
+    __slots__ = ('id', 'sender', 'subject', 'preview', 'internal_date', 'unread', 'sender_address')
+
+    def __init__(self, id, sender, subject, preview, internal_date, unread, sender_address=None):
+        set_field = object.__setattr__
+        set_field(self, 'id', id)
+        set_field(self, 'sender', sys.intern(sender))
+        set_field(self, 'sender_address',
+                  parse_sender(sender).address if sender_address is None else sys.intern(sender_address))
+        set_field(self, 'subject', subject)
+        set_field(self, 'preview', preview)
+        set_field(self, 'internal_date', int(internal_date))
+        set_field(self, 'unread', bool(unread))
+
+    def __setattr__(self, name, value):
+        raise AttributeError('EmailSummary is immutable; use replace()')
+
+    @property
+    def date(self):
+        return datetime.fromtimestamp(self.internal_date).strftime(DATE_FORMAT)
+
+    def replace(self, **changes):
+        fields = {name: getattr(self, name) for name in self.__slots__}
+        fields.update(changes)
+        return EmailSummary(**fields)
+
+    def __eq__(self, other):
+        if not isinstance(other, EmailSummary):
+            return NotImplemented
+        return all(getattr(self, name) == getattr(other, name) for name in self.__slots__)
+
+    def __hash__(self):
+        return hash((self.id, self.unread))
+
+    def __reduce__(self):
+        return EmailSummary, tuple(getattr(self, name) for name in self.__slots__)
+
+    def __repr__(self):
+        return f'EmailSummary(id={self.id!r}, sender={self.sender!r}, subject={self.subject!r}, unread={self.unread})'
@@ -0,0 +1,92 @@
+import json
+import os
+import threading
+import time
+from collections import deque
+
+# ────────────────────────────────────────────────
+# Execution log
+# ────────────────────────────────────────────────
+# What the assistant did, per session: a bounded ring buffer of small
+# structured entries instead of an ever-growing list of strings in
+# session state. The command history shows the last few; the compose
+# view and the voice widget look at the latest entry's action and outcome.
+#
+# EXECUTION_LOG_FILE=actions.jsonl additionally appends every entry, from
+# every session in the process, as a JSON line. The file is shared, so it
+# leaves out the message, and of the params keeps only the ones in
+# LOGGED_PARAMS (flags, counts, ids); any other param, including names,
+# addresses, search words and dictated text, is written as its length.
+
+LOG_CAPACITY = int(os.getenv('EXECUTION_LOG_CAPACITY', '200'))
+LOG_FILE = os.getenv('EXECUTION_LOG_FILE')
+
+# Outcomes
+OK = 'ok'
+HEARD = 'heard'         # voice transcript parsed, not executed yet
+PENDING = 'pending'     # queued in the outbox, or waiting for confirmation
+UNKNOWN = 'unknown'     # command not understood
+FAILED = 'failed'
+
+# Params written to the file as they are; everything else as its length only
+LOGGED_PARAMS = frozenset({'unread', 'date_range', 'msg_id', 'outbox_id', 'source', 'confirmed',
+                           'path', 'model_calls', 'tokens', 'total', 'modified', 'targets'})
+
+_write_lock = threading.Lock()
+
+
+class Entry:
+    __slots__ = ('ts', 'action', 'params', 'latency_ms', 'outcome', 'message')
+
+    def __init__(self, message, action=None, params=None, latency_ms=None, outcome=OK):
+        self.ts = time.time()
+        self.action = action
+        self.params = params or None
+        self.latency_ms = None if latency_ms is None else round(latency_ms, 1)
+        self.outcome = outcome
+        self.message = message
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def to_record(self):
+        """The entry as written to the shared file: no message, no free text"""
+        params = self.params and {key: value if key in LOGGED_PARAMS else f'<{len(str(value))} chars>'
+                                  for key, value in self.params.items()}
+        return {'ts': self.ts, 'action': self.action, 'params': params,
+                'latency_ms': self.latency_ms, 'outcome': self.outcome}
+
+    def __str__(self):
+        return self.message
+
+
+class ExecutionLog:
+    """The last `capacity` entries of one session, newest last"""
+
+    def __init__(self, capacity=LOG_CAPACITY, path=LOG_FILE):
+        self.entries = deque(maxlen=capacity)
+        self.path = path
+
+    def record(self, message, action=None, params=None, latency_ms=None, outcome=OK):
+        entry = Entry(message, action, params, latency_ms, outcome)
+        self.entries.append(entry)
+        if self.path:
+            line = json.dumps(entry.to_record(), default=str) + '\n'
+            with _write_lock, open(self.path, 'a', encoding='utf-8') as f:
+                f.write(line)
+        return entry
+
+    def latest(self):
+        return self.entries[-1] if self.entries else None
+
+    def last(self, n):
+        """The newest `n` entries, newest first"""
+        count = min(n, len(self.entries))
+        return [self.entries[-i] for i in range(1, count + 1)]
+
+    def clear(self):
+        """Forget this session's entries (the file keeps them)"""
+        self.entries.clear()
+
+    def __len__(self):
+        return len(self.entries)
@@ -0,0 +1,626 @@
+import base64
+import json
+import random
+import re
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from email import message_from_bytes, policy
+from email.parser import BytesParser
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from mailbox_generator import ME, SyntheticMailbox, b64url, message_id, message_index
+
+# ────────────────────────────────────────────────
+# Local stand-in for the Gmail REST API (v1)
+# ────────────────────────────────────────────────
+# Speaks the subset of the discovery surface the app uses: profile,
+# messages list/get/send/modify/batchModify/trash, attachments, threads,
+# history, labels, watch and the multipart /batch endpoint. Mutations are
+# recorded as history so incremental sync can be exercised end to end.
+#
+#   python fake_gmail_server.py --size 100000 --latency-ms 40 --error-rate 0.01
+#   GMAIL_API_ENDPOINT=http://127.0.0.1:8765 streamlit run app.py
+
+SYSTEM_LABELS = ['INBOX', 'SENT', 'UNREAD', 'STARRED', 'IMPORTANT', 'TRASH', 'SPAM', 'DRAFT',
+                 'CATEGORY_PERSONAL', 'CATEGORY_UPDATES', 'CATEGORY_PROMOTIONS']
+
+# Extra messages (sent through the API) get ids above the synthetic range
+EXTRA_BASE = 0xf000000000000000
+
+IS_LABELS = {'unread': 'UNREAD', 'starred': 'STARRED', 'important': 'IMPORTANT'}
+
+
+class ApiError(Exception):
+    def __init__(self, status, message, reason='invalidArgument'):
+        super().__init__(message)
+        self.status = status
+        self.reason = reason
+
+    def body(self):
+        return {'error': {'code': self.status, 'message': str(self),
+                          'errors': [{'reason': self.reason, 'message': str(self)}]}}
+
+
+class FakeGmail:
+    """Mailbox state plus the API operations, independent of HTTP"""
+
+    def __init__(self, mailbox, latency_ms=0.0, jitter_ms=0.0, error_rate=0.0, seed=0):
+        self.mailbox = mailbox
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+
+        self.lock = threading.RLock()
+        self.history_id = 1000
+        self.history = []                  # [{'id': str, ...}] newest last
+        self.label_overrides = {}          # msg id -> [label ids]
+        self.deleted = set()
+        self.extra = {}                    # msg id -> full Message resource
+        self.extra_order = []              # newest first
+        self.user_labels = {}              # label id -> Label resource
+        self._label_counts = None
+
+        self.requests = Counter()          # route -> calls
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+    # ── injected faults ──────────────────────────
+    def delay(self):
+        if self.latency_ms or self.jitter_ms:
+            time.sleep(max(0.0, self.latency_ms + self.random.uniform(-1, 1) * self.jitter_ms) / 1000)
+
+    def maybe_fail(self):
+        if self.error_rate and self.random.random() < self.error_rate:
+            if self.random.random() < 0.5:
+                raise ApiError(429, 'User-rate limit exceeded.', 'rateLimitExceeded')
+            raise ApiError(503, 'Backend Error', 'backendError')
+
+    # ── message storage ──────────────────────────
+    def _exists(self, msg_id):
+        if msg_id in self.deleted:
+            return False
+        if msg_id in self.extra:
+            return True
+        try:
+            return message_index(msg_id) < self.mailbox.size
+        except ValueError:
+            return False
+
+    def labels_of(self, msg_id):
+        if msg_id in self.label_overrides:
+            return self.label_overrides[msg_id]
+        if msg_id in self.extra:
+            return self.extra[msg_id]['labelIds']
+        return self.mailbox.labels(message_index(msg_id))
+
+    def _static_message(self, msg_id):
+        if msg_id in self.extra:
+            return dict(self.extra[msg_id])
+        return self.mailbox.message(message_index(msg_id))
+
+    def iter_ids(self, start=0):
+        """(position, id) pairs, newest first, from a page-token position"""
+        extras = len(self.extra_order)
+        for position in range(start, extras + self.mailbox.size):
+            if position < extras:
+                msg_id = self.extra_order[position]
+            else:
+                msg_id = message_id(position - extras)
+            if msg_id not in self.deleted:
+                yield position, msg_id
+
+    def _record(self, **changes):
+        self.history_id += 1
+        record = {'id': str(self.history_id)}
+        record.update(changes)
+        record['messages'] = [item['message'] for values in changes.values() for item in values]
+        self.history.append(record)
+
+    def _set_labels(self, msg_id, add, remove):
+        current = list(self.labels_of(msg_id))
+        added = [l for l in add if l not in current]
+        removed = [l for l in remove if l in current]
+        if not added and not removed:
+            return
+        updated = [l for l in current if l not in removed] + added
+        self.label_overrides[msg_id] = updated
+        if self._label_counts is not None:
+            self._count_labels(current, -1)
+            self._count_labels(updated, +1)
+
+        ref = {'id': msg_id, 'threadId': self._thread_of(msg_id), 'labelIds': updated}
+        changes = {}
+        if added:
+            changes['labelsAdded'] = [{'message': ref, 'labelIds': added}]
+        if removed:
+            changes['labelsRemoved'] = [{'message': ref, 'labelIds': removed}]
+        self._record(**changes)
+
+    def _thread_of(self, msg_id):
+        if msg_id in self.extra:
+            return self.extra[msg_id]['threadId']
+        return self.mailbox.thread_id(message_index(msg_id))
+
+    # ── query matching ───────────────────────────
+    def _headers(self, msg_id):
+        if msg_id in self.extra:
+            headers = self.extra[msg_id]['payload']['headers']
+        else:
+            headers = self.mailbox.headers(message_index(msg_id))
+        return {h['name'].lower(): h['value'] for h in headers}
+
+    def _internal_date(self, msg_id):
+        if msg_id in self.extra:
+            return int(self.extra[msg_id]['internalDate'])
+        return self.mailbox.internal_date(message_index(msg_id))
+
+    def _label_id(self, name):
+        upper = name.upper()
+        if upper in SYSTEM_LABELS:
+            return upper
+        for label in self.user_labels.values():
+            if label['name'].lower() == name.lower() or label['id'] == name:
+                return label['id']
+        return name
+
+    def _term_matches(self, msg_id, term):
+        labels = self.labels_of(msg_id)
+        key, _, value = term.partition(':')
+        key = key.lower()
+        value = value.lower()
+        if not _:
+            key, value = '', term.lower()
+
+        if key == 'is':
+            if value == 'read':
+                return 'UNREAD' not in labels
+            return IS_LABELS.get(value, value.upper()) in labels
+        if key == 'in':
+            return ('DRAFT' if value == 'drafts' else value.upper()) in labels
+        if key == 'label':
+            return self._label_id(value) in labels
+        if key in ('after', 'before', 'newer_than', 'older_than'):
+            date = self._internal_date(msg_id) / 1000
+            if key in ('after', 'before'):
+                bound = datetime.strptime(value.replace('-', '/'), '%Y/%m/%d').replace(tzinfo=timezone.utc)
+            else:
+                unit = {'d': 1, 'm': 30, 'y': 365}[value[-1]]
+                bound = datetime.now(timezone.utc) - timedelta(days=int(value[:-1]) * unit)
+            newer = date >= bound.timestamp()
+            return newer if key in ('after', 'newer_than') else not newer
+        if key == 'has':
+            return value == 'attachment' and self._has_attachment(msg_id)
+
+        headers = self._headers(msg_id)
+        if key in ('from', 'to', 'cc', 'subject'):
+            return value in headers.get(key, '').lower()
+        # Free text: sender, recipients, subject and snippet
+        haystack = ' '.join((headers.get('from', ''), headers.get('to', ''),
+                             headers.get('subject', ''))).lower()
+        if value in haystack:
+            return True
+        return value in self._static_message(msg_id)['snippet'].lower()
+
+    def _has_attachment(self, msg_id):
+        if msg_id in self.extra:
+            return False
+        return self.mailbox.shape(message_index(msg_id)) in ('mixed', 'nested')
+
+    def matches(self, msg_id, label_ids, terms):
+        labels = self.labels_of(msg_id)
+        if any(label not in labels for label in label_ids):
+            return False
+        # Like Gmail, trash and spam are hidden unless asked for
+        if not label_ids and ('TRASH' in labels or 'SPAM' in labels):
+            if not any(t.lower() in ('in:trash', 'in:spam') for t in terms):
+                return False
+        for term in terms:
+            negate = term.startswith('-')
+            if self._term_matches(msg_id, term.lstrip('-')) == negate:
+                return False
+        return True
+
+    # ── API operations ───────────────────────────
+    def profile(self):
+        with self.lock:
+            return {
+                'emailAddress': ME,
+                'messagesTotal': self.mailbox.size + len(self.extra) - len(self.deleted),
+                'threadsTotal': self.mailbox.size // 2,
+                'historyId': str(self.history_id),
+            }
+
+    def list_messages(self, label_ids=(), q='', max_results=100, page_token=None):
+        max_results = min(int(max_results or 100), 500)
+        terms = [t for t in q.split() if t.upper() != 'AND']
+        start = int(page_token) if page_token else 0
+        found = []
+        next_token = None
+        with self.lock:
+            for position, msg_id in self.iter_ids(start):
+                if len(found) == max_results:
+                    next_token = str(position)
+                    break
+                if self.matches(msg_id, [self._label_id(l) for l in label_ids], terms):
+                    found.append({'id': msg_id, 'threadId': self._thread_of(msg_id)})
+        response = {'resultSizeEstimate': len(found)}
+        if found:
+            response['messages'] = found
+        if next_token:
+            response['nextPageToken'] = next_token
+        return response
+
+    def get_message(self, msg_id, fmt='full', metadata_headers=()):
+        with self.lock:
+            if not self._exists(msg_id):
+                raise ApiError(404, 'Requested entity was not found.', 'notFound')
+            message = self._static_message(msg_id)
+            message['labelIds'] = list(self.labels_of(msg_id))
+            message['historyId'] = str(self.history_id)
+
+        if fmt == 'minimal':
+            message.pop('payload', None)
+        elif fmt == 'metadata':
+            payload = message['payload']
+            headers = payload['headers']
+            if metadata_headers:
+                wanted = {h.lower() for h in metadata_headers}
+                headers = [h for h in headers if h['name'].lower() in wanted]
+            message['payload'] = {'partId': '', 'mimeType': payload['mimeType'], 'filename': '',
+                                  'headers': headers, 'body': {'size': 0}}
+        elif fmt == 'raw':
+            message['raw'] = b64url(self._raw(message['payload']))
+            message.pop('payload')
+        return message
+
+    def _raw(self, payload):
+        lines = [f"{h['name']}: {h['value']}" for h in payload['headers']]
+        def find_text(part):
+            if part['mimeType'] == 'text/plain' and 'data' in part['body']:
+                return base64.urlsafe_b64decode(part['body']['data']).decode('utf-8')
+            for child in part.get('parts', []):
+                found = find_text(child)
+                if found:
+                    return found
+            return ''
+
+        text = find_text(payload)
+        return ('\r\n'.join(lines) + '\r\n\r\n' + text).encode('utf-8')
+
+    def get_attachment(self, msg_id, attachment_id):
+        with self.lock:
+            if not self._exists(msg_id) or msg_id in self.extra:
+                raise ApiError(404, 'Requested entity was not found.', 'notFound')
+        part_id = attachment_id.split(msg_id + '_', 1)[-1].replace('_', '.')
+        data = self.mailbox.attachment_data(message_index(msg_id), part_id)
+        return {'attachmentId': attachment_id, 'size': len(data), 'data': b64url(data)}
+
+    def send(self, body):
+        raw = base64.urlsafe_b64decode(body.get('raw', '') + '==')
+        parsed = message_from_bytes(raw, policy=policy.default)
+        text = parsed.get_body(('plain',)) if parsed.is_multipart() else parsed
+        content = text.get_content() if text is not None else ''
+        headers = [{'name': k, 'value': str(v)} for k, v in parsed.items()]
+        if not any(h['name'].lower() == 'from' for h in headers):
+            headers.append({'name': 'From', 'value': ME})
+
+        with self.lock:
+            msg_id = f'{EXTRA_BASE + len(self.extra):016x}'
+            data = content.encode('utf-8')
+            message = {
+                'id': msg_id,
+                'threadId': body.get('threadId') or msg_id,
+                'labelIds': ['SENT'],
+                'snippet': content[:120],
+                'internalDate': str(int(time.time() * 1000)),
+                'sizeEstimate': len(raw),
+                'payload': {'partId': '', 'mimeType': 'text/plain', 'filename': '', 'headers': headers,
+                            'body': {'size': len(data), 'data': b64url(data)}},
+            }
+            self.extra[msg_id] = message
+            self.extra_order.insert(0, msg_id)
+            if self._label_counts is not None:
+                self._count_labels(['SENT'], +1)
+            ref = {'id': msg_id, 'threadId': message['threadId'], 'labelIds': ['SENT']}
+            self._record(messagesAdded=[{'message': ref}])
+        return {'id': msg_id, 'threadId': message['threadId'], 'labelIds': ['SENT']}
+
+    def modify(self, msg_ids, add=(), remove=()):
+        with self.lock:
+            for msg_id in msg_ids:
+                if not self._exists(msg_id):
+                    raise ApiError(404, f'Requested entity was not found: {msg_id}', 'notFound')
+            for msg_id in msg_ids:
+                self._set_labels(msg_id, [self._label_id(l) for l in add],
+                                 [self._label_id(l) for l in remove])
+
+    def list_threads(self, label_ids=(), q='', max_results=100, page_token=None):
+        response = self.list_messages(label_ids, q, max_results, page_token)
+        seen = []
+        for message in response.pop('messages', []):
+            if message['threadId'] not in seen:
+                seen.append(message['threadId'])
+        response['threads'] = [{'id': t, 'snippet': '', 'historyId': str(self.history_id)} for t in seen]
+        response['resultSizeEstimate'] = len(seen)
+        return response
+
+    def get_thread(self, thread_id, fmt='full', metadata_headers=()):
+        with self.lock:
+            if thread_id in self.extra:
+                ids = [thread_id]
+            else:
+                start = message_index(thread_id)
+                ids = [message_id(i) for i in range(start, min(start + 4, self.mailbox.size))
+                       if self.mailbox.thread_id(i) == thread_id]
+            ids = [i for i in ids if self._exists(i)]
+            if not ids:
+                raise ApiError(404, 'Requested entity was not found.', 'notFound')
+        # Oldest first, like Gmail
+        messages = [self.get_message(i, fmt, metadata_headers) for i in reversed(ids)]
+        return {'id': thread_id, 'historyId': str(self.history_id), 'messages': messages}
+
+    def list_history(self, start_history_id, max_results=100, page_token=None, history_types=()):
+        start = int(start_history_id)
+        with self.lock:
+            oldest = int(self.history[0]['id']) - 1 if self.history else self.history_id
+            if start < min(oldest, 1000):
+                raise ApiError(404, 'Requested entity was not found.', 'notFound')
+            records = [r for r in self.history if int(r['id']) > start]
+            current = str(self.history_id)
+        if history_types:
+            records = [r for r in records if any(t in r for t in history_types)]
+        offset = int(page_token) if page_token else 0
+        max_results = min(int(max_results or 100), 500)
+        page = records[offset:offset + max_results]
+        response = {'historyId': current}
+        if page:
+            response['history'] = page
+        if offset + max_results < len(records):
+            response['nextPageToken'] = str(offset + max_results)
+        return response
+
+    # ── labels ───────────────────────────────────
+    def _count_labels(self, labels, delta):
+        for label in labels:
+            total, unread = self._label_counts.get(label, (0, 0))
+            self._label_counts[label] = (total + delta, unread + (delta if 'UNREAD' in labels else 0))
+
+    def label_counts(self):
+        with self.lock:
+            if self._label_counts is None:
+                self._label_counts = {}
+                for _, msg_id in self.iter_ids():
+                    self._count_labels(self.labels_of(msg_id), +1)
+            return dict(self._label_counts)
+
+    def list_labels(self):
+        labels = [{'id': l, 'name': l, 'type': 'system'} for l in SYSTEM_LABELS]
+        return {'labels': labels + list(self.user_labels.values())}
+
+    def get_label(self, label_id):
+        label = next((l for l in self.list_labels()['labels'] if l['id'] == label_id), None)
+        if label is None:
+            raise ApiError(404, 'Requested entity was not found.', 'notFound')
+        total, unread = self.label_counts().get(label_id, (0, 0))
+        return dict(label, messagesTotal=total, messagesUnread=unread,
+                    threadsTotal=total, threadsUnread=unread)
+
+    def create_label(self, body):
+        with self.lock:
+            if any(l['name'].lower() == body['name'].lower() for l in self.user_labels.values()):
+                raise ApiError(409, 'Label name exists or conflicts', 'duplicate')
+            label_id = f'Label_{len(self.user_labels) + 1}'
+            label = dict(body, id=label_id, type='user')
+            self.user_labels[label_id] = label
+        return label
+
+    def watch(self, body):
+        return {'historyId': str(self.history_id),
+                'expiration': str(int((time.time() + 7 * 86400) * 1000))}
+
+
+# ────────────────────────────────────────────────
+# HTTP routing
+# ────────────────────────────────────────────────
+_USER = r'/gmail/v1/users/[^/]+'
+ROUTES = [
+    ('GET', _USER + r'/profile$', 'profile'),
+    ('GET', _USER + r'/messages$', 'messages.list'),
+    ('POST', _USER + r'/messages/send$', 'messages.send'),
+    ('POST', r'/upload' + _USER + r'/messages/send$', 'messages.send'),
+    ('POST', _USER + r'/messages/batchModify$', 'messages.batchModify'),
+    ('GET', _USER + r'/messages/(?P<id>[^/]+)$', 'messages.get'),
+    ('POST', _USER + r'/messages/(?P<id>[^/]+)/modify$', 'messages.modify'),
+    ('POST', _USER + r'/messages/(?P<id>[^/]+)/trash$', 'messages.trash'),
+    ('GET', _USER + r'/messages/(?P<id>[^/]+)/attachments/(?P<aid>[^/]+)$', 'messages.attachments.get'),
+    ('GET', _USER + r'/threads$', 'threads.list'),
+    ('GET', _USER + r'/threads/(?P<id>[^/]+)$', 'threads.get'),
+    ('GET', _USER + r'/history$', 'history.list'),
+    ('GET', _USER + r'/labels$', 'labels.list'),
+    ('POST', _USER + r'/labels$', 'labels.create'),
+    ('GET', _USER + r'/labels/(?P<id>[^/]+)$', 'labels.get'),
+    ('POST', _USER + r'/watch$', 'watch'),
+]
+
+
+def dispatch(gmail, method, url, body):
+    """Route one API call; returns (status, JSON-able body)"""
+    parts = urlsplit(url)
+    params = parse_qs(parts.query)
+    one = lambda name, default=None: params.get(name, [default])[0]
+    data = json.loads(body) if body else {}
+
+    for route_method, pattern, name in ROUTES:
+        match = re.match(pattern, parts.path)
+        if route_method != method or not match:
+            continue
+        gmail.requests[name] += 1
+        try:
+            gmail.delay()
+            gmail.maybe_fail()
+            ids = match.groupdict()
+            if name == 'profile':
+                return 200, gmail.profile()
+            if name == 'messages.list':
+                return 200, gmail.list_messages(params.get('labelIds', []), one('q', ''),
+                                                one('maxResults'), one('pageToken'))
+            if name == 'messages.get':
+                return 200, gmail.get_message(ids['id'], one('format', 'full'),
+                                              params.get('metadataHeaders', []))
+            if name == 'messages.send':
+                return 200, gmail.send(data)
+            if name == 'messages.batchModify':
+                gmail.modify(data.get('ids', []), data.get('addLabelIds', []), data.get('removeLabelIds', []))
+                return 204, None
+            if name == 'messages.modify':
+                gmail.modify([ids['id']], data.get('addLabelIds', []), data.get('removeLabelIds', []))
+                return 200, gmail.get_message(ids['id'], 'minimal')
+            if name == 'messages.trash':
+                gmail.modify([ids['id']], ['TRASH'], ['INBOX'])
+                return 200, gmail.get_message(ids['id'], 'minimal')
+            if name == 'messages.attachments.get':
+                return 200, gmail.get_attachment(ids['id'], ids['aid'])
+            if name == 'threads.list':
+                return 200, gmail.list_threads(params.get('labelIds', []), one('q', ''),
+                                               one('maxResults'), one('pageToken'))
+            if name == 'threads.get':
+                return 200, gmail.get_thread(ids['id'], one('format', 'full'),
+                                             params.get('metadataHeaders', []))
+            if name == 'history.list':
+                if not one('startHistoryId'):
+                    raise ApiError(400, 'Missing startHistoryId')
+                return 200, gmail.list_history(one('startHistoryId'), one('maxResults'),
+                                               one('pageToken'), params.get('historyTypes', []))
+            if name == 'labels.list':
+                return 200, gmail.list_labels()
+            if name == 'labels.get':
+                return 200, gmail.get_label(ids['id'])
+            if name == 'labels.create':
+                return 200, gmail.create_label(data)
+            if name == 'watch':
+                return 200, gmail.watch(data)
+        except ApiError as e:
+            return e.status, e.body()
+    return 404, ApiError(404, f'No route for {method} {parts.path}', 'notFound').body()
+
+
+_STATUS_TEXT = {200: 'OK', 204: 'No Content', 400: 'Bad Request', 404: 'Not Found',
+                409: 'Conflict', 429: 'Too Many Requests', 503: 'Service Unavailable'}
+
+
+def handle_batch(gmail, content_type, body):
+    """Serve a multipart/mixed batch request; returns (content type, bytes)"""
+    gmail.requests['batch'] += 1
+    envelope = BytesParser().parsebytes(b'Content-Type: ' + content_type.encode() + b'\r\n\r\n' + body)
+    boundary = 'batch_' + format(random.getrandbits(64), 'x')
+    out = []
+    for part in envelope.get_payload():
+        payload = part.get_payload()
+        head, _, inner_body = payload.replace('\r\n', '\n').partition('\n\n')
+        request_line = head.split('\n', 1)[0]
+        method, url, _ = request_line.split(' ', 2)
+        status, result = dispatch(gmail, method, url, inner_body.strip())
+        content = '' if result is None else json.dumps(result)
+        content_id = part.get('Content-ID', '')
+        if content_id.startswith('<'):
+            content_id = '<response-' + content_id[1:]
+        out.append(
+            f'--{boundary}\r\n'
+            f'Content-Type: application/http\r\n'
+            f'Content-ID: {content_id}\r\n\r\n'
+            f'HTTP/1.1 {status} {_STATUS_TEXT.get(status, "")}\r\n'
+            f'Content-Type: application/json; charset=UTF-8\r\n'
+            f'Content-Length: {len(content.encode())}\r\n\r\n'
+            f'{content}\r\n'
+        )
+    out.append(f'--{boundary}--\r\n')
+    return f'multipart/mixed; boundary={boundary}', ''.join(out).encode('utf-8')
+
+
+class GmailHandler(BaseHTTPRequestHandler):
+    gmail = None                # set by make_server
+    protocol_version = 'HTTP/1.1'
+    # Headers and body go out in separate writes; don't let Nagle hold them
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def _read_body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else b''
+        self.gmail.bytes_in += length
+        return body
+
+    def _send(self, status, content_type, payload):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+        self.gmail.bytes_out += len(payload)
+
+    def _handle(self, method):
+        body = self._read_body()
+        path = urlsplit(self.path).path
+        if path == '/_fake/stats':
+            stats = {'requests': dict(self.gmail.requests), 'bytes_in': self.gmail.bytes_in,
+                     'bytes_out': self.gmail.bytes_out, 'historyId': self.gmail.history_id}
+            if method == 'POST':
+                self.gmail.requests.clear()
+                self.gmail.bytes_in = self.gmail.bytes_out = 0
+            return self._send(200, 'application/json', json.dumps(stats).encode())
+        if path.startswith('/batch'):
+            content_type, payload = handle_batch(self.gmail, self.headers.get('Content-Type', ''), body)
+            return self._send(200, content_type, payload)
+
+        status, result = dispatch(self.gmail, method, self.path, body.decode('utf-8'))
+        payload = b'' if result is None else json.dumps(result).encode('utf-8')
+        self._send(status, 'application/json; charset=UTF-8', payload)
+
+    def do_GET(self):
+        self._handle('GET')
+
+    def do_POST(self):
+        self._handle('POST')
+
+
+def make_server(gmail, host='127.0.0.1', port=8765):
+    """Build (but don't start) an HTTP server for a FakeGmail"""
+    handler = type('BoundGmailHandler', (GmailHandler,), {'gmail': gmail})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def start_in_thread(size=1000, seed=0, port=0, **faults):
+    """Start a fake server in a daemon thread; returns (server, FakeGmail, base URL)"""
+    gmail = FakeGmail(SyntheticMailbox(size, seed), seed=seed, **faults)
+    server = make_server(gmail, port=port)
+    threading.Thread(target=server.serve_forever, name='fake-gmail', daemon=True).start()
+    host, port = server.server_address
+    return server, gmail, f'http://{host}:{port}'
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Local Gmail API stand-in')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--size', type=int, default=1000, help='number of synthetic messages')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--latency-ms', type=float, default=0.0)
+    parser.add_argument('--jitter-ms', type=float, default=0.0)
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of calls failing with 429/503')
+    args = parser.parse_args()
+
+    gmail = FakeGmail(SyntheticMailbox(args.size, args.seed), args.latency_ms,
+                      args.jitter_ms, args.error_rate, args.seed)
+    server = make_server(gmail, args.host, args.port)
+    print(f'Fake Gmail serving {args.size} messages on http://{args.host}:{args.port}')
+    server.serve_forever()
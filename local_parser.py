@@ -0,0 +1,89 @@
+import re
+
+# ────────────────────────────────────────────────
+# Rule-based command parser
+# ────────────────────────────────────────────────
+# Understands the common phrasings of every parse_command action without
+# calling a model. Used by the fake model backend and anywhere a cheap
+# local guess is good enough. Returns the same {'action', 'params'}
+# shape as parse_command.
+
+EMAIL_RE = re.compile(r'[\w.+-]+@[\w-]+(\.[\w-]+)+')
+# Start of a command, after any politeness ("please archive these")
+_IMPERATIVE = r'^\s*(?:(?:please|now|ok|okay|can you|could you|go ahead and),?\s+)*'
+
+_RULES = [
+    ('count', re.compile(r'\bhow many\b(?!.*\bfrom\b)|\b(count|number of)\b.*\b(emails?|mails?|messages?|unread)\b', re.I)),
+    ('summarize', re.compile(r'\b(summari[sz]e|summary|tl;? ?dr)\b', re.I)),
+    ('reply', re.compile(r'^\s*(reply|respond)\b', re.I)),
+    # Bulk actions change every email shown, so only imperatives count:
+    # "find emails about delete" is a search, not a trash
+    ('mark_unread', re.compile(_IMPERATIVE + r'mark\b.*\bunread\b', re.I)),
+    ('mark_read', re.compile(_IMPERATIVE + r'mark\b.*\bread\b', re.I)),
+    ('archive', re.compile(_IMPERATIVE + r'archive\b', re.I)),
+    ('trash', re.compile(_IMPERATIVE + r'(trash|delete|bin)\b|^\s*move\b.*\bto (the )?(trash|bin)\s*$', re.I)),
+    ('label', re.compile(_IMPERATIVE + r'(label|tag)\b', re.I)),
+    ('compose', re.compile(r'\b(compose|write|draft|new email|send (an? )?(email|mail|message))\b', re.I)),
+    ('open_email', re.compile(r'\b(open|read)\b.*\b(email|mail|message)\b', re.I)),
+    ('filter_inbox', re.compile(r'\b(show|list|find|filter|search|get|open inbox|inbox|unread)\b', re.I)),
+]
+
+
+def _after(pattern, text):
+    match = re.search(pattern, text, re.I)
+    return match.group(1).strip(' .,!?"\'') if match else ''
+
+
+def _sender(text):
+    if match := EMAIL_RE.search(text):
+        return match.group(0)
+    return _after(r'\bfrom\s+([\w.@+-]+(?:\s+[A-Z][\w-]*)?)', text)
+
+
+def _date_range(text):
+    lowered = text.lower()
+    if '10 days' in lowered:
+        return 'last 10 days'
+    if 'week' in lowered:
+        return 'this week'
+    return ''
+
+
+def parse_locally(text):
+    """Best-effort parse of a command into {'action': ..., 'params': {...}}"""
+    text = (text or '').strip()
+    for action, pattern in _RULES:
+        if pattern.search(text):
+            break
+    else:
+        return {'action': 'unknown', 'params': {}}
+
+    params = {}
+    if action == 'compose':
+        if match := EMAIL_RE.search(text):
+            params['to'] = match.group(0)
+        elif to := _after(r'\bto\s+([\w.-]+)', text):
+            params['to'] = to
+        if subject := _after(r'\b(?:about|subject|regarding)\s+(.+)$', text):
+            params['subject'] = subject
+    elif action == 'open_email':
+        params['sender'] = _sender(text)
+    elif action == 'label':
+        params['label'] = _after(r'\b(?:as|with|to)\s+["\']?([\w -]+?)["\']?\s*$', text) or \
+            _after(r'\blabel\s+(?:these|them|all|it)?\s*["\']?([\w -]+?)["\']?\s*$', text)
+    elif action == 'count':
+        if re.search(r'\bunread\b', text, re.I):
+            params['unread'] = True
+        if label := _after(r'\b(?:in|under|labell?ed)\s+(?:my\s+|the\s+)?["\']?([\w -]+?)["\']?'
+                           r'(?:\s+(?:folder|label))?\s*[?.!]*$', text):
+            params['label'] = label
+    elif action == 'filter_inbox':
+        if re.search(r'\bunread\b', text, re.I):
+            params['unread'] = True
+        if sender := _sender(text):
+            params['sender'] = sender
+        if keyword := _after(r'\b(?:about|containing|with|mentioning)\s+["\']?([\w-]+)', text):
+            params['keyword'] = keyword
+        if date_range := _date_range(text):
+            params['date_range'] = date_range
+    return {'action': action, 'params': params}
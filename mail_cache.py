@@ -0,0 +1,275 @@
+import re
+import threading
+import time
+
+# ────────────────────────────────────────────────
+# Query-result cache for list_emails
+# ────────────────────────────────────────────────
+# Listings are keyed by (label, canonical query, page token) and hold the
+# ordered message ids Gmail returned. Message summaries are stored once per
+# id so several listings can share them. Everything is stamped with the
+# mailbox historyId it was valid at; mail_service brings the cache forward
+# with history deltas instead of re-listing.
+#
+# Label statistics (labels.get: messagesTotal / messagesUnread) are kept
+# per label until a delta touches a message carrying that label.
+
+# Maps `is:` / `in:` operators onto the system labels they test
+OPERATOR_LABELS = {
+    'is:unread': 'UNREAD',
+    'is:starred': 'STARRED',
+    'is:important': 'IMPORTANT',
+    'in:inbox': 'INBOX',
+    'in:sent': 'SENT',
+    'in:spam': 'SPAM',
+    'in:trash': 'TRASH',
+    'in:drafts': 'DRAFT',
+}
+
+# Queries containing these can't be reasoned about term by term
+_OPAQUE_QUERY = re.compile(r'(\bor\b|[{}()"]|(^|\s)-)', re.IGNORECASE)
+_OPERATOR = re.compile(r'^([A-Za-z_]+):(.*)$')
+
+
+def canonical_query(query):
+    """
+    Normalize a Gmail search string so equivalent filters share a cache key.
+    Operators are lowercased and whitespace collapsed; terms are sorted only
+    when the query is a plain AND of terms, so grouping/OR stays untouched.
+    """
+    terms = (query or '').split()
+    normalized = []
+    for term in terms:
+        match = _OPERATOR.match(term)
+        if match:
+            term = f"{match.group(1).lower()}:{match.group(2)}"
+        normalized.append(term)
+    if not _OPAQUE_QUERY.search(' '.join(normalized)):
+        normalized = sorted(set(normalized))
+    return ' '.join(normalized)
+
+
+def query_labels(label, query):
+    """
+    Return the set of label ids a listing's membership depends on,
+    or None if any label change could affect it.
+    """
+    if _OPAQUE_QUERY.search(query):
+        return None
+    labels = {label} if label else set()
+    for term in query.split():
+        if term.startswith('label:'):
+            return None
+        if term.startswith(('is:', 'in:')):
+            if term not in OPERATOR_LABELS:
+                return None
+            labels.add(OPERATOR_LABELS[term])
+    return labels
+
+
+class MailCache:
+    """Thread-safe store shared by every session talking to the mailbox"""
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.history_id = None
+        self.email_address = None
+        self.listings = {}   # (label, query, page_token) -> [msg ids]
+        self.limits = {}     # (label, query, page_token) -> maxResults listed with
+        self.messages = {}   # msg id -> {'summary': EmailSummary, 'labels': set}
+        self.labels = None       # [{'id', 'name', 'type'}] (labels.list)
+        self.label_stats = {}    # label id -> {'name', 'total', 'unread'} (labels.get)
+        # When sync_cache last confirmed history_id is current (monotonic)
+        self.checked_at = None
+
+    def clear(self, history_id=None):
+        with self.lock:
+            self.history_id = history_id
+            self.listings.clear()
+            self.limits.clear()
+            self.messages.clear()
+            self.label_stats.clear()
+            self.checked_at = None if history_id is None else time.monotonic()
+
+    def mark_checked(self):
+        self.checked_at = time.monotonic()
+
+    def checked_age(self):
+        """Seconds since the cache was last known current, or None"""
+        return None if self.checked_at is None else time.monotonic() - self.checked_at
+
+    # ── listings ─────────────────────────────────
+    def get_listing(self, label, query, page_token=None, max_results=20):
+        """Return cached summaries for a listing, or None on a miss"""
+        with self.lock:
+            key = (label, query, page_token)
+            ids = self.listings.get(key)
+            if ids is None or self.limits.get(key, 0) < max_results:
+                return None
+            if any(msg_id not in self.messages for msg_id in ids):
+                return None
+            # Summaries are immutable: every session can share the same objects
+            return [self.messages[msg_id]['summary'] for msg_id in ids]
+
+    def put_listing(self, label, query, page_token, ids, max_results):
+        with self.lock:
+            self.listings[(label, query, page_token)] = list(ids)
+            self.limits[(label, query, page_token)] = max_results
+
+    def insert_into_listing(self, label, summary, label_ids):
+        """
+        Put a locally created message at the head of the unfiltered listing
+        for `label`, e.g. mail we just sent showing up under SENT.
+        """
+        with self.lock:
+            self.put_message(summary, label_ids)
+            for label_id in label_ids:
+                self.label_stats.pop(label_id, None)
+            key = (label, '', None)
+            ids = self.listings.get(key)
+            if ids is not None and summary.id not in ids:
+                ids.insert(0, summary.id)
+                del ids[self.limits[key]:]
+
+    # ── labels ───────────────────────────────────
+    def get_label_stats(self, label_id):
+        with self.lock:
+            return self.label_stats.get(label_id)
+
+    def put_label_stats(self, label_id, stats):
+        with self.lock:
+            self.label_stats[label_id] = stats
+
+    def put_labels(self, labels):
+        with self.lock:
+            self.labels = list(labels)
+
+    def forget_labels(self):
+        """After creating a label"""
+        with self.lock:
+            self.labels = None
+
+    # ── messages ─────────────────────────────────
+    def get_message(self, msg_id):
+        with self.lock:
+            entry = self.messages.get(msg_id)
+            return entry['summary'] if entry else None
+
+    def put_message(self, summary, label_ids):
+        with self.lock:
+            self.messages[summary.id] = {
+                'summary': summary,
+                'labels': set(label_ids),
+            }
+
+    def apply_labels(self, msg_ids, add_labels=(), remove_labels=()):
+        """
+        Apply a label change we made ourselves, ahead of its history record.
+        Summaries are updated in place; listings the change touches are
+        dropped, so the next view is re-listed in full.
+        """
+        with self.lock:
+            # Counts of every label the messages carry move; refetch them all
+            self.label_stats.clear()
+            for msg_id in msg_ids:
+                if add_labels:
+                    self._relabel(msg_id, set(add_labels), added=True)
+                if remove_labels:
+                    self._relabel(msg_id, set(remove_labels), added=False)
+            self._invalidate_for(set(add_labels) | set(remove_labels), added=True)
+
+    # ── history deltas ───────────────────────────
+    def apply_history(self, records, history_id):
+        """
+        Patch the cache with Gmail history records.
+        Label flips update cached summaries in place; listings are only
+        dropped when a change could add a message they don't know about,
+        or when a full listing loses one.
+        """
+        with self.lock:
+            for record in records:
+                for item in record.get('messagesDeleted', []):
+                    self._drop_message(item['message']['id'])
+                    self._drop_stats(item['message'])
+                for item in record.get('messagesAdded', []):
+                    message = item['message']
+                    self._invalidate_for(set(message.get('labelIds', [])), added=True, msg_id=message['id'])
+                    self._drop_stats(message)
+                for item in record.get('labelsAdded', []):
+                    self._flip_labels(item['message']['id'], item.get('labelIds', []), added=True)
+                    self._drop_stats(item['message'], item.get('labelIds', []))
+                for item in record.get('labelsRemoved', []):
+                    self._flip_labels(item['message']['id'], item.get('labelIds', []), added=False)
+                    self._drop_stats(item['message'], item.get('labelIds', []))
+            self.history_id = history_id
+            self.checked_at = time.monotonic()
+
+    def _drop_stats(self, message, changed=()):
+        """Forget the stats of labels whose counts a history item may have moved"""
+        carried = message.get('labelIds')
+        if carried is None and (not changed or 'UNREAD' in changed):
+            # An unread flip moves the counts of labels we can't see
+            self.label_stats.clear()
+            return
+        for label_id in set(changed) | set(carried or ()):
+            self.label_stats.pop(label_id, None)
+
+    def _drop_message(self, msg_id):
+        self.messages.pop(msg_id, None)
+        for key in list(self.listings):
+            self._remove_from_listing(key, msg_id)
+
+    def _remove_from_listing(self, key, msg_id):
+        """
+        Take a message out of a cached listing. A listing that was full
+        would now be missing the message after its last one, so it is
+        dropped instead; a shorter one already reached the end.
+        """
+        ids = self.listings[key]
+        if msg_id not in ids:
+            return
+        if len(ids) >= self.limits.get(key, 0):
+            del self.listings[key]
+        else:
+            ids.remove(msg_id)
+
+    def _relabel(self, msg_id, changed, added):
+        """Update a cached message's labels and unread flag"""
+        entry = self.messages.get(msg_id)
+        if entry:
+            if added:
+                entry['labels'] |= changed
+            else:
+                entry['labels'] -= changed
+            entry['summary'] = entry['summary'].replace(unread='UNREAD' in entry['labels'])
+
+    def _flip_labels(self, msg_id, label_ids, added):
+        changed = set(label_ids)
+        self._relabel(msg_id, changed, added)
+
+        if added:
+            self._invalidate_for(changed, added=True)
+            return
+
+        # A message losing a label can only fall out of listings that need it
+        for key in list(self.listings):
+            label, query, _ = key
+            depends_on = query_labels(label, query)
+            if depends_on is None:
+                del self.listings[key]
+            elif depends_on & changed:
+                self._remove_from_listing(key, msg_id)
+
+    def _invalidate_for(self, changed, added, msg_id=None):
+        for key in list(self.listings):
+            label, query, _ = key
+            # Already inserted locally (see insert_into_listing)
+            if msg_id is not None and msg_id in self.listings[key]:
+                continue
+            depends_on = query_labels(label, query)
+            if depends_on is None or depends_on & changed or (added and not depends_on):
+                del self.listings[key]
+
+
+# Shared by all Streamlit sessions in this process
+CACHE = MailCache()
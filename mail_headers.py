@@ -0,0 +1,112 @@
+import base64
+import binascii
+import re
+import sys
+from email.utils import getaddresses, parseaddr
+
+# ────────────────────────────────────────────────
+# Message headers
+# ────────────────────────────────────────────────
+# Gmail returns headers as a list of {'name', 'value'} in wire order.
+# HeaderIndex walks that list once into a dict keyed by the lowercased
+# name (some servers send "from" and "subject"), then decodes RFC 2047
+# encoded words (=?utf-8?b?...?=) on first access and keeps the result.
+# Indexes live as long as the fetch that built them: what callers keep
+# (EmailSummary, detail dicts) holds only the few decoded fields it needs,
+# not the message's whole header list.
+#
+# parse_sender() splits From into display name and lowercased address, the
+# key for grouping and indexing mail by correspondent; recipients() does
+# the same for every address in To and Cc.
+
+_ENCODED_WORD = re.compile(r'=\?([^?\s]+)\?([bBqQ])\?([^?\s]*)\?=')
+_BETWEEN_WORDS = re.compile(r'(?<=\?=)\s+(?==\?)')
+# "Name <address>", "<address>" or a bare address; anything else goes to parseaddr
+_SIMPLE_ADDRESS = re.compile(r'^\s*(?:([^"<>,;:()\\]*?)\s*<([^<>\s"]+)>|([^<>\s",;:()]+@[^<>\s",;:()]+))\s*$')
+
+
+def _decode_word(match):
+    charset, encoding, text = match.groups()
+    try:
+        if encoding in 'bB':
+            data = base64.b64decode(text + '=' * (-len(text) % 4))
+        else:
+            data = binascii.a2b_qp(text, header=True)
+        return data.decode(charset.split('*')[0], errors='replace')
+    except (binascii.Error, LookupError):
+        return match.group(0)
+
+
+def decode_words(value):
+    """Decode RFC 2047 encoded words; plain values are returned as they are"""
+    if '=?' not in value:
+        return value
+    # Whitespace between two encoded words is not part of the text
+    return _ENCODED_WORD.sub(_decode_word, _BETWEEN_WORDS.sub('', value))
+
+
+class Sender:
+    __slots__ = ('name', 'address')
+
+    def __init__(self, name, address):
+        self.name = name
+        self.address = address
+
+    def __str__(self):
+        return f'{self.name} <{self.address}>' if self.name else self.address
+
+    def __repr__(self):
+        return f'Sender({self.name!r}, {self.address!r})'
+
+
+def parse_sender(value):
+    """Sender from a raw (possibly encoded) From value"""
+    # Split before decoding: a decoded name may contain commas or brackets
+    if match := _SIMPLE_ADDRESS.match(value or ''):
+        name, address = match.group(1) or '', match.group(2) or match.group(3)
+    else:
+        name, address = parseaddr(value or '')
+    return Sender(decode_words(name), sys.intern(address.lower()))
+
+
+class HeaderIndex:
+    """Case-insensitive, decoded access to one message's headers"""
+
+    __slots__ = ('_raw', '_decoded', '_sender', '_recipients')
+
+    def __init__(self, headers):
+        raw = {}
+        for header in headers:
+            # The first occurrence wins, as with the previous next(...) scans
+            raw.setdefault(header['name'].lower(), header['value'])
+        self._raw = raw
+        self._decoded = {}
+        self._sender = None
+        self._recipients = None
+
+    def get(self, name, default=None):
+        key = name.lower()
+        decoded = self._decoded.get(key)
+        if decoded is None:
+            value = self._raw.get(key)
+            if value is None:
+                return default
+            decoded = self._decoded[key] = decode_words(value)
+        return decoded
+
+    def raw(self, name, default=None):
+        return self._raw.get(name.lower(), default)
+
+    def sender(self):
+        if self._sender is None:
+            self._sender = parse_sender(self.raw('from'))
+        return self._sender
+
+    def recipients(self):
+        """Senders for every address in To and Cc, in header order"""
+        if self._recipients is None:
+            values = [value for value in (self.raw('to'), self.raw('cc')) if value]
+            self._recipients = [Sender(decode_words(name), sys.intern(address.lower()))
+                                for name, address in getaddresses(values) if address]
+        return self._recipients
+
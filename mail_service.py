@@ -1,21 +1,70 @@
 import os
 import pickle
 import base64
+import logging
+import time
 from email.mime.text import MIMEText
-from datetime import datetime
+from datetime import datetime, timedelta
 import streamlit as st
 from google.auth.transport.requests import Request
 from google.oauth2.credentials import Credentials
+from google.auth.credentials import AnonymousCredentials
 from google_auth_oauthlib.flow import InstalledAppFlow
 from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
 from google.cloud import pubsub_v1
+import metrics
+from email_summary import EmailSummary
+from mail_headers import HeaderIndex
+from mail_cache import CACHE, canonical_query
+from mail_store import STORE
+from scheduler import execute
+from tracing import span, traced
 
 # Scopes for Gmail API
 SCOPES = ['https://www.googleapis.com/auth/gmail.modify']
 
+log = logging.getLogger(__name__)
+
+# batchModify accepts at most this many ids per request
+BATCH_MODIFY_LIMIT = 1000
+
+# Bulk actions -> (labels to add, labels to remove)
+BULK_ACTIONS = {
+    'mark_read': ([], ['UNREAD']),
+    'mark_unread': (['UNREAD'], []),
+    'archive': ([], ['INBOX']),
+    'trash': (['TRASH'], ['INBOX']),
+    'label': ([], []),
+}
+
+# Give up replaying history after this many pages and re-list instead
+HISTORY_MAX_PAGES = 5
+
+# Sidebar badges: these system labels, then every user label
+BADGE_LABELS = ('INBOX', 'STARRED')
+# Label stats trust the cache's history check for this long (seconds)
+LABEL_STATS_MAX_AGE = float(os.getenv('LABEL_STATS_MAX_AGE', '30'))
+
 def get_gmail_service():
-    """Authenticate and return Gmail API service"""
+    """
+    Authenticate and return Gmail API service.
+    If GMAIL_API_ENDPOINT is set (e.g. to fake_gmail_server.py), talk to
+    that endpoint anonymously instead of Google.
+    """
+    if endpoint := os.getenv('GMAIL_API_ENDPOINT'):
+        return build(
+            'gmail', 'v1',
+            credentials=AnonymousCredentials(),
+            client_options={'api_endpoint': endpoint},
+            static_discovery=True
+        )
+
+    return build('gmail', 'v1', credentials=load_credentials())
+
+
+def load_credentials():
+    """Saved OAuth2 credentials, refreshed or re-authorized as needed"""
     creds = None
     if os.path.exists('token.pickle'):
         with open('token.pickle', 'rb') as token:
@@ -23,7 +72,8 @@ def get_gmail_service():
     
     if not creds or not creds.valid:
         if creds and creds.expired and creds.refresh_token:
-            creds.refresh(Request())
+            with span('auth.refresh'):
+                creds.refresh(Request())
         else:
             flow = InstalledAppFlow.from_client_secrets_file('credentials.json', SCOPES)
             creds = flow.run_local_server(port=0)
@@ -31,50 +81,176 @@ def get_gmail_service():
         with open('token.pickle', 'wb') as token:
             pickle.dump(creds, token)
     
-    return build('gmail', 'v1', credentials=creds)
+    return traced_refresh(creds)
+
+
+def traced_refresh(creds):
+    """
+    Give every token refresh of `creds` an auth.refresh span, including the
+    ones googleapiclient and async_core make mid-session when the token
+    expires (otherwise unexplained time inside a gmail.* span).
+    """
+    refresh = creds.refresh
+
+    def refresh_with_span(request):
+        with span('auth.refresh'):
+            return refresh(request)
+
+    # An instance attribute: the saved token.pickle stays a plain Credentials
+    creds.refresh = refresh_with_span
+    return creds
+
+
+def get_history_id(service):
+    """Return the mailbox's current historyId (one cheap getProfile call)"""
+    profile = execute(service.users().getProfile(userId='me'))
+    CACHE.email_address = profile.get('emailAddress')
+    return profile['historyId']
+
+
+def sync_cache(service):
+    """
+    Bring the shared listing cache up to the mailbox's current historyId.
+    Unchanged mailboxes cost a single getProfile call; otherwise the history
+    deltas since the cached historyId are applied in place.
+    """
+    current = get_history_id(service)
+    if CACHE.history_id is None:
+        CACHE.clear(current)
+        return
+    if current == CACHE.history_id:
+        CACHE.mark_checked()
+        return
+
+    records = []
+    page_token = None
+    try:
+        for _ in range(HISTORY_MAX_PAGES):
+            response = execute(service.users().history().list(
+                userId='me',
+                startHistoryId=CACHE.history_id,
+                pageToken=page_token
+            ))
+            records.extend(response.get('history', []))
+            page_token = response.get('nextPageToken')
+            if not page_token:
+                break
+        else:
+            # Too far behind to be worth replaying
+            CACHE.clear(current)
+            return
+    except HttpError as e:
+        # 404 means the startHistoryId has expired; start over
+        if e.resp.status == 404:
+            CACHE.clear(current)
+            return
+        raise
 
+    CACHE.apply_history(records, current)
 
-def list_emails(service, label='INBOX', query='', max_results=20):
+
+def _fetch_summary(service, msg_id):
+    """Fetch one message's metadata and store its summary in the cache"""
+    # Use 'metadata' format to include headers
+    msg_data = execute(service.users().messages().get(
+        userId='me',
+        id=msg_id,
+        format='metadata'
+    ))
+    summary, label_ids = summarize_metadata(msg_id, msg_data)
+    CACHE.put_message(summary, label_ids)
+    return summary
+
+
+def summarize_metadata(msg_id, msg_data):
+    """(summary, label ids) from a format='metadata' message resource"""
+    headers = HeaderIndex(msg_data.get('payload', {}).get('headers', []))
+    label_ids = msg_data.get('labelIds', [])
+
+    summary = EmailSummary(
+        id=msg_id,
+        sender=headers.get('From', 'Unknown'),
+        subject=headers.get('Subject', 'No Subject'),
+        preview=msg_data.get('snippet', '(No preview available)'),
+        internal_date=int(msg_data.get('internalDate', '0')) // 1000,
+        unread='UNREAD' in label_ids,
+        sender_address=headers.sender().address,
+    )
+    return summary, label_ids
+
+
+def filter_query(params):
+    """Gmail query for filter_inbox params, and a description of each filter"""
+    query = ''
+    filter_desc = []
+
+    if params.get('unread', False):
+        query += 'is:unread '
+        filter_desc.append("unread")
+
+    if sender := params.get('sender'):
+        query += f'from:{sender} '
+        filter_desc.append(f"from {sender}")
+
+    if keyword := params.get('keyword'):
+        query += f'{keyword} '
+        filter_desc.append(f"containing '{keyword}'")
+
+    if date_range := params.get('date_range', '').lower():
+        if 'week' in date_range or 'this week' in date_range:
+            date_str = (datetime.now() - timedelta(days=7)).strftime('%Y/%m/%d')
+            query += f'after:{date_str} '
+            filter_desc.append("from last week")
+        elif '10 days' in date_range or 'last 10 days' in date_range:
+            date_str = (datetime.now() - timedelta(days=10)).strftime('%Y/%m/%d')
+            query += f'after:{date_str} '
+            filter_desc.append("from last 10 days")
+
+    return query.strip(), filter_desc
+
+
+def list_emails(service, label='INBOX', query='', max_results=20, page_token=None, use_cache=True):
     """
     List emails with sender, subject, preview, date, unread status.
     Uses format='metadata' to get headers without full body.
+    First pages are served from the sync daemon's local store when it can
+    answer the query; otherwise results are cached per (label, canonical
+    query, page token) and revalidated against the mailbox historyId.
     """
     try:
-        results = service.users().messages().list(
+        query = canonical_query(query)
+        if use_cache and page_token is None:
+            stored = STORE.list_emails(label, query, max_results)
+            metrics.CACHE_LOOKUPS.inc(cache='store', result='miss' if stored is None else 'hit')
+            if stored is not None:
+                return stored
+        if use_cache:
+            sync_cache(service)
+            cached = CACHE.get_listing(label, query, page_token, max_results)
+            if cached is not None:
+                metrics.CACHE_LOOKUPS.inc(cache='listing', result='hit')
+                return cached[:max_results]
+            metrics.CACHE_LOOKUPS.inc(cache='listing', result='miss')
+
+        results = execute(service.users().messages().list(
             userId='me',
             labelIds=[label],
             q=query,
-            maxResults=max_results
-        ).execute()
+            maxResults=max_results,
+            pageToken=page_token
+        ))
         
         messages = results.get('messages', [])
         emails = []
         
         for msg in messages:
-            # Use 'metadata' format to include headers
-            msg_data = service.users().messages().get(
-                userId='me',
-                id=msg['id'],
-                format='metadata'
-            ).execute()
-            
-            # Extract headers safely
-            headers = msg_data.get('payload', {}).get('headers', [])
-            
-            sender = next((h['value'] for h in headers if h['name'] == 'From'), 'Unknown')
-            subject = next((h['value'] for h in headers if h['name'] == 'Subject'), 'No Subject')
-            date_raw = msg_data.get('internalDate', '0')
-            date = datetime.fromtimestamp(int(date_raw) / 1000).strftime('%Y-%m-%d %H:%M')
-            
-            emails.append({
-                'id': msg['id'],
-                'sender': sender,
-                'subject': subject,
-                'preview': msg_data.get('snippet', '(No preview available)'),
-                'date': date,
-                'unread': 'UNREAD' in msg_data.get('labelIds', [])
-            })
-        
+            summary = CACHE.get_message(msg['id']) if use_cache else None
+            if use_cache:
+                metrics.CACHE_LOOKUPS.inc(cache='message', result='hit' if summary else 'miss')
+            emails.append(summary or _fetch_summary(service, msg['id']))
+
+        if use_cache:
+            CACHE.put_listing(label, query, page_token, [e.id for e in emails], max_results)
         return emails
     
     except HttpError as e:
@@ -85,40 +261,39 @@ def list_emails(service, label='INBOX', query='', max_results=20):
         return []
 
 
+@traced('mime.decode')
+def extract_body(payload):
+    """Decode the message body from a format='full' payload (prefer plain text)"""
+    body = ''
+    if 'parts' in payload:
+        for part in payload['parts']:
+            if part.get('mimeType') == 'text/plain':
+                data = part['body'].get('data', '')
+                if data:
+                    body = base64.urlsafe_b64decode(data).decode('utf-8', errors='ignore')
+                break
+    else:
+        data = payload.get('body', {}).get('data', '')
+        if data:
+            body = base64.urlsafe_b64decode(data).decode('utf-8', errors='ignore')
+    return body
+
+
 def get_email_detail(service, msg_id):
-    """Get full content of a single email"""
+    """Get full content of a single email (from the local store if it has the body)"""
+    stored = STORE.get_detail(msg_id)
+    metrics.CACHE_LOOKUPS.inc(cache='store', result='miss' if stored is None else 'hit')
+    if stored is not None:
+        return stored
     try:
-        msg = service.users().messages().get(
+        msg = execute(service.users().messages().get(
             userId='me',
             id=msg_id,
             format='full'
-        ).execute()
-        
-        payload = msg.get('payload', {})
-        headers = payload.get('headers', [])
-        
-        sender = next((h['value'] for h in headers if h['name'] == 'From'), 'Unknown')
-        subject = next((h['value'] for h in headers if h['name'] == 'Subject'), 'No Subject')
-        
-        # Extract body (prefer plain text)
-        body = ''
-        if 'parts' in payload:
-            for part in payload['parts']:
-                if part.get('mimeType') == 'text/plain':
-                    data = part['body'].get('data', '')
-                    if data:
-                        body = base64.urlsafe_b64decode(data).decode('utf-8', errors='ignore')
-                    break
-        else:
-            data = payload.get('body', {}).get('data', '')
-            if data:
-                body = base64.urlsafe_b64decode(data).decode('utf-8', errors='ignore')
-        
-        return {
-            'sender': sender,
-            'subject': subject,
-            'body': body or '(No content available)'
-        }
+        ))
+        detail = parse_detail(msg)
+        STORE.put_body(msg_id, detail['body'])
+        return detail
     
     except HttpError as e:
         st.error(f"Error reading email {msg_id}: {e}")
@@ -128,27 +303,223 @@ def get_email_detail(service, msg_id):
         return None
 
 
+def parse_detail(msg):
+    """Sender, subject and decoded body of a format='full' message resource"""
+    payload = msg.get('payload', {})
+    headers = HeaderIndex(payload.get('headers', []))
+
+    body = extract_body(payload)
+    
+    return {
+        'sender': headers.get('From', 'Unknown'),
+        'sender_address': headers.sender().address,
+        'subject': headers.get('Subject', 'No Subject'),
+        'body': body or '(No content available)',
+        'thread_id': msg.get('threadId'),
+    }
+
+
+def get_thread(service, thread_id):
+    """parse_detail() of every message in a thread, oldest first, with its 'id'; None on errors"""
+    try:
+        thread = execute(service.users().threads().get(userId='me', id=thread_id, format='full'))
+    except HttpError as e:
+        st.error(f"Error reading thread {thread_id}: {e}")
+        return None
+    return [dict(parse_detail(msg), id=msg['id']) for msg in thread.get('messages', [])]
+
+
+def build_raw(to, subject, body):
+    """base64url-encoded RFC 2822 message for messages.send"""
+    message = MIMEText(body)
+    message['to'] = to
+    message['subject'] = subject
+    return base64.urlsafe_b64encode(message.as_bytes()).decode()
+
+
+def deliver_email(service, to, subject, body, on_sent=None):
+    """
+    Send a plain text email without touching the UI and return its message ID.
+    Send errors propagate so callers (e.g. the outbox worker) can retry;
+    on_sent(message_id) runs as soon as Gmail has accepted the message,
+    before the sent message is added to the cached SENT listing.
+    """
+    sent_message = execute(service.users().messages().send(
+        userId='me',
+        body={'raw': build_raw(to, subject, body)}
+    ))
+
+    if on_sent:
+        on_sent(sent_message['id'])
+    record_sent(sent_message, to, subject, body)
+    return sent_message['id']
+
+
 def send_email(service, to, subject, body):
-    """Send a plain text email"""
+    """Send a plain text email and return its message ID (None on failure)"""
     try:
-        message = MIMEText(body)
-        message['to'] = to
-        message['subject'] = subject
-        
-        raw = base64.urlsafe_b64encode(message.as_bytes()).decode()
-        body = {'raw': raw}
-        
-        sent_message = service.users().messages().send(
-            userId='me',
-            body=body
-        ).execute()
-        
-        st.success(f"Email sent successfully! Message ID: {sent_message['id']}")
+        sent_id = deliver_email(service, to, subject, body)
+        st.success(f"Email sent successfully! Message ID: {sent_id}")
+        return sent_id
     
     except HttpError as e:
         st.error(f"Error sending email: {e}")
     except Exception as e:
         st.error(f"Unexpected error sending email: {e}")
+    return None
+
+
+def record_sent(sent_message, to, subject, body):
+    """
+    Build a summary for a message we just sent and cache it under SENT.
+    The message is already sent: errors here are logged, never raised, so
+    no caller mistakes them for a failed send and sends it again.
+    """
+    try:
+        return _record_sent(sent_message, to, subject, body)
+    except Exception:
+        log.exception('Recording sent message %s failed', sent_message.get('id'))
+        return None
+
+
+def _record_sent(sent_message, to, subject, body):
+    # Gmail's internalDate units, converted like summarize_metadata does
+    sent_at = int(time.time() * 1000)
+    summary = EmailSummary(
+        id=sent_message['id'],
+        sender=CACHE.email_address or 'me',
+        subject=subject or 'No Subject',
+        preview=body[:200] or '(No preview available)',
+        internal_date=sent_at // 1000,
+        unread=False,
+    )
+    label_ids = sent_message.get('labelIds', ['SENT'])
+    CACHE.insert_into_listing('SENT', summary, label_ids)
+    if STORE.get_state('history_id') is not None:
+        recipients = HeaderIndex([{'name': 'To', 'value': to}]).recipients()
+        STORE.upsert([(summary, label_ids, sent_at, sent_message.get('threadId'), recipients)])
+    return summary
+
+
+def list_labels(service):
+    """The mailbox's labels as {'id', 'name', 'type'}, from labels.list (cached)"""
+    labels = CACHE.labels
+    if labels is None:
+        labels = [{'id': label['id'], 'name': label['name'], 'type': label.get('type', 'user')}
+                  for label in execute(service.users().labels().list(userId='me')).get('labels', [])]
+        CACHE.put_labels(labels)
+    return labels
+
+
+def get_label_id(service, name, create=True):
+    """Resolve a label name (case-insensitive) to its id, creating it if needed"""
+    for refresh in (False, True):
+        if refresh:
+            # Maybe created elsewhere since labels were listed
+            CACHE.forget_labels()
+        for label in list_labels(service):
+            if label['name'].lower() == name.lower() or label['id'] == name.upper():
+                return label['id']
+    if not create:
+        return None
+    label = execute(service.users().labels().create(
+        userId='me',
+        body={'name': name, 'labelListVisibility': 'labelShow', 'messageListVisibility': 'show'}
+    ))
+    CACHE.forget_labels()
+    return label['id']
+
+
+@traced('mail.label_stats')
+def label_stats(service, label_ids, max_age=LABEL_STATS_MAX_AGE):
+    """
+    {label id: {'name', 'total', 'unread'}} from labels.get, without listing
+    or fetching any message. Cached stats are used until a history delta
+    touches their label; the history check itself (one getProfile) runs
+    only when the cache hasn't been checked for `max_age` seconds.
+    """
+    age = CACHE.checked_age()
+    if age is None or age > max_age:
+        sync_cache(service)
+    stats = {}
+    for label_id in label_ids:
+        entry = CACHE.get_label_stats(label_id)
+        metrics.CACHE_LOOKUPS.inc(cache='labels', result='miss' if entry is None else 'hit')
+        if entry is None:
+            label = execute(service.users().labels().get(userId='me', id=label_id))
+            entry = {'name': label['name'], 'total': label.get('messagesTotal', 0),
+                     'unread': label.get('messagesUnread', 0)}
+            CACHE.put_label_stats(label_id, entry)
+        stats[label_id] = entry
+    return stats
+
+
+def badge_stats(service):
+    """label_stats for BADGE_LABELS and every user label"""
+    user_labels = [label['id'] for label in list_labels(service) if label['type'] == 'user']
+    return label_stats(service, [*BADGE_LABELS, *user_labels])
+
+
+def batch_modify(service, msg_ids, add_labels=(), remove_labels=()):
+    """
+    Add/remove labels on many messages with messages.batchModify,
+    BATCH_MODIFY_LIMIT ids per request. Cached summaries are updated
+    optimistically before the calls go out, and the listings the change
+    touches are dropped; the whole cache is dropped if any call fails.
+    Returns the number of messages modified (0 on failure).
+    """
+    msg_ids = list(msg_ids)
+    if not msg_ids:
+        return 0
+
+    CACHE.apply_labels(msg_ids, add_labels, remove_labels)
+    STORE.apply_labels(msg_ids, add_labels, remove_labels)
+    try:
+        for start in range(0, len(msg_ids), BATCH_MODIFY_LIMIT):
+            execute(service.users().messages().batchModify(
+                userId='me',
+                body={
+                    'ids': msg_ids[start:start + BATCH_MODIFY_LIMIT],
+                    'addLabelIds': list(add_labels),
+                    'removeLabelIds': list(remove_labels)
+                }
+            ))
+        return len(msg_ids)
+
+    except HttpError as e:
+        # Local state no longer matches the server; re-list on next access
+        CACHE.clear()
+        STORE.clear()
+        st.error(f"Error modifying emails: {e}")
+    except Exception as e:
+        CACHE.clear()
+        STORE.clear()
+        st.error(f"Unexpected error in batch_modify: {e}")
+    return 0
+
+
+def apply_bulk_action(service, action, emails, label_name=None):
+    """
+    Run a BULK_ACTIONS entry over a list of email summaries.
+    Returns (emails left in the current view, number modified, seconds taken).
+    """
+    add_labels, remove_labels = BULK_ACTIONS[action]
+    if action == 'label':
+        add_labels = [get_label_id(service, label_name)]
+
+    ids = [email.id for email in emails]
+    start = time.perf_counter()
+    modified = batch_modify(service, ids, add_labels, remove_labels)
+    elapsed = time.perf_counter() - start
+
+    if not modified:
+        return emails, 0, elapsed
+    if 'INBOX' in remove_labels:
+        return [], modified, elapsed
+    if 'UNREAD' in remove_labels or 'UNREAD' in add_labels:
+        unread = 'UNREAD' in add_labels
+        emails = [email.replace(unread=unread) for email in emails]
+    return emails, modified, elapsed
 
 
 def setup_push_notifications(service, project_id, topic_name='gmail-notifications'):
@@ -159,7 +530,7 @@ def setup_push_notifications(service, project_id, topic_name='gmail-notification
             'labelFilterBehavior': 'INCLUDE',
             'topicName': f'projects/{project_id}/topics/{topic_name}'
         }
-        response = service.users().watch(userId='me', body=request).execute()
+        response = execute(service.users().watch(userId='me', body=request))
         st.info("Push notifications watch setup successful.")
         return response
     except HttpError as e:
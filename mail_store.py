@@ -0,0 +1,314 @@
+import os
+import re
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+from email_summary import EmailSummary
+from mail_headers import parse_sender
+
+# ────────────────────────────────────────────────
+# Local mail store shared by the sync daemon and UI sessions
+# ────────────────────────────────────────────────
+# sync_daemon.py keeps this SQLite file up to date from Gmail (backfill,
+# then history deltas); Streamlit renders read from it instead of calling
+# the API. WAL mode lets one writer and any number of readers, in this
+# process or another one, work at the same time.
+#
+# Reads return None when the store can't answer authoritatively (not
+# synced yet or not lately, a query operator it doesn't understand, or a label whose
+# backfill window might hide older matches); callers then go to Gmail.
+
+STORE_PATH = os.getenv('MAILSTORE_PATH', 'mailstore.db')
+# Idle connections kept per store; Streamlit runs each rerun on a new
+# thread, so connections are pooled rather than kept per thread
+POOL_SIZE = int(os.getenv('MAILSTORE_POOL_SIZE', '4'))
+# The daemon stamps synced_at every SYNC_INTERVAL. A store not synced for
+# longer (daemon off, a dead sidecar, a leftover file) stops answering and
+# Gmail does instead.
+MAX_AGE_SECONDS = float(os.getenv('MAILSTORE_MAX_AGE', 4 * float(os.getenv('SYNC_INTERVAL', '15'))))
+# SYNC_DAEMON=off (see sync_daemon.py): nothing keeps the store current
+SYNC_ENABLED = os.getenv('SYNC_DAEMON', 'thread') != 'off'
+# Bumped when the schema changes; older files are rebuilt by the next backfill
+SCHEMA_VERSION = 2
+
+_DROP = """
+DROP TABLE IF EXISTS message_recipients;
+DROP TABLE IF EXISTS message_labels;
+DROP TABLE IF EXISTS messages;
+DROP TABLE IF EXISTS state;
+"""
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    id TEXT PRIMARY KEY,
+    thread_id TEXT,
+    sender TEXT NOT NULL,
+    subject TEXT NOT NULL,
+    preview TEXT NOT NULL,
+    internal_date INTEGER NOT NULL,
+    unread INTEGER NOT NULL,
+    body TEXT
+);
+CREATE TABLE IF NOT EXISTS message_labels (
+    msg_id TEXT NOT NULL REFERENCES messages(id) ON DELETE CASCADE,
+    label TEXT NOT NULL,
+    PRIMARY KEY (label, msg_id)
+);
+CREATE INDEX IF NOT EXISTS message_labels_by_msg ON message_labels (msg_id);
+CREATE TABLE IF NOT EXISTS message_recipients (
+    msg_id TEXT NOT NULL REFERENCES messages(id) ON DELETE CASCADE,
+    address TEXT NOT NULL,
+    name TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS message_recipients_by_msg ON message_recipients (msg_id);
+CREATE INDEX IF NOT EXISTS messages_by_date ON messages (internal_date DESC);
+CREATE TABLE IF NOT EXISTS state (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+# Gmail search terms the store can evaluate exactly. Words, from: and
+# subject: go to Gmail, which matches them by token and searches bodies.
+_TERM = re.compile(r'^(is|after|before):(.+)$', re.IGNORECASE)
+
+
+def _epoch_ms(value):
+    return int(datetime.strptime(value, '%Y/%m/%d').timestamp() * 1000)
+
+
+def local_filter(query):
+    """
+    Translate a Gmail query into (SQL condition, params), or None if it
+    uses anything but is:unread / is:read / after: / before:.
+    """
+    clauses, params = [], []
+    for term in (query or '').split():
+        match = _TERM.match(term)
+        if not match:
+            return None
+        op, value = match.group(1).lower(), match.group(2)
+        if op == 'is':
+            if value.lower() not in ('unread', 'read'):
+                return None
+            clauses.append('m.unread = ?')
+            params.append(int(value.lower() == 'unread'))
+        else:
+            try:
+                ts = _epoch_ms(value)
+            except ValueError:
+                return None
+            clauses.append('m.internal_date >= ?' if op == 'after' else 'm.internal_date < ?')
+            params.append(ts)
+    return ' AND '.join(clauses) or '1', params
+
+
+class MailStore:
+    """SQLite-backed message summaries, labels and (some) bodies"""
+
+    def __init__(self, path=None, max_age=MAX_AGE_SECONDS, enabled=SYNC_ENABLED):
+        self.path = path or STORE_PATH
+        self.max_age = max_age
+        self.enabled = enabled
+        self._idle = []
+        self._lock = threading.Lock()
+        self._ready = False
+
+    def _open(self):
+        conn = sqlite3.connect(self.path, timeout=10, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        conn.execute('PRAGMA foreign_keys=ON')
+        with self._lock:
+            ready = self._ready
+        if not ready:
+            # Once per process: WAL mode sticks to the file, the schema is IF NOT EXISTS
+            conn.execute('PRAGMA journal_mode=WAL')
+            if conn.execute('PRAGMA user_version').fetchone()[0] < SCHEMA_VERSION:
+                conn.executescript(_DROP)
+            conn.executescript(_SCHEMA)
+            conn.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+            with self._lock:
+                self._ready = True
+        return conn
+
+    @contextmanager
+    def _conn(self):
+        """A pooled connection for one operation; `with conn:` inside for a transaction"""
+        with self._lock:
+            conn = self._idle.pop() if self._idle else None
+        if conn is None:
+            conn = self._open()
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+            with self._lock:
+                if len(self._idle) < POOL_SIZE:
+                    self._idle.append(conn)
+                    conn = None
+            if conn is not None:
+                conn.close()
+
+    # ── state ────────────────────────────────────
+    def get_state(self, key, default=None):
+        with self._conn() as conn:
+            row = conn.execute('SELECT value FROM state WHERE key = ?', (key,)).fetchone()
+        return row['value'] if row else default
+
+    def set_state(self, **values):
+        with self._conn() as conn, conn:
+            conn.executemany('INSERT OR REPLACE INTO state (key, value) VALUES (?, ?)',
+                             [(k, None if v is None else str(v)) for k, v in values.items()])
+
+    def status(self):
+        """Sync progress for the sidebar"""
+        with self._conn() as conn:
+            state = {row['key']: row['value'] for row in conn.execute('SELECT key, value FROM state')}
+            state['messages'] = conn.execute('SELECT COUNT(*) FROM messages').fetchone()[0]
+        return state
+
+    # ── writes (sync daemon) ─────────────────────
+    def clear(self):
+        with self._conn() as conn, conn:
+            conn.execute('DELETE FROM message_recipients')
+            conn.execute('DELETE FROM message_labels')
+            conn.execute('DELETE FROM messages')
+            conn.execute('DELETE FROM state')
+
+    def upsert(self, entries):
+        """entries: iterable of (summary, label ids, internalDate ms, thread id, To/Cc Senders)"""
+        with self._conn() as conn, conn:
+            for summary, label_ids, internal_date, thread_id, recipients in entries:
+                conn.execute(
+                    'INSERT INTO messages (id, thread_id, sender, subject, preview, internal_date, unread) '
+                    'VALUES (?, ?, ?, ?, ?, ?, ?) '
+                    'ON CONFLICT(id) DO UPDATE SET sender = excluded.sender, subject = excluded.subject, '
+                    'preview = excluded.preview, unread = excluded.unread',
+                    (summary.id, thread_id, summary.sender, summary.subject, summary.preview,
+                     int(internal_date), int('UNREAD' in label_ids))
+                )
+                conn.execute('DELETE FROM message_labels WHERE msg_id = ?', (summary.id,))
+                conn.executemany('INSERT INTO message_labels (msg_id, label) VALUES (?, ?)',
+                                 [(summary.id, label) for label in label_ids])
+                conn.execute('DELETE FROM message_recipients WHERE msg_id = ?', (summary.id,))
+                conn.executemany('INSERT INTO message_recipients (msg_id, address, name) VALUES (?, ?, ?)',
+                                 [(summary.id, r.address, r.name) for r in recipients])
+
+    def delete(self, msg_ids):
+        with self._conn() as conn, conn:
+            conn.executemany('DELETE FROM messages WHERE id = ?', [(i,) for i in msg_ids])
+
+    def apply_labels(self, msg_ids, add_labels=(), remove_labels=()):
+        """Apply label changes to stored messages; returns the ids the store didn't have"""
+        unknown = []
+        with self._conn() as conn, conn:
+            for msg_id in msg_ids:
+                if not conn.execute('SELECT 1 FROM messages WHERE id = ?', (msg_id,)).fetchone():
+                    unknown.append(msg_id)
+                    continue
+                conn.executemany('INSERT OR IGNORE INTO message_labels (msg_id, label) VALUES (?, ?)',
+                                 [(msg_id, label) for label in add_labels])
+                conn.executemany('DELETE FROM message_labels WHERE msg_id = ? AND label = ?',
+                                 [(msg_id, label) for label in remove_labels])
+                if 'UNREAD' in add_labels or 'UNREAD' in remove_labels:
+                    conn.execute('UPDATE messages SET unread = ? WHERE id = ?',
+                                 (int('UNREAD' in add_labels), msg_id))
+        return unknown
+
+    def put_body(self, msg_id, body):
+        with self._conn() as conn, conn:
+            conn.execute('UPDATE messages SET body = ? WHERE id = ?', (body, msg_id))
+
+    def ids_without_body(self, label, limit):
+        with self._conn() as conn:
+            rows = conn.execute(
+                'SELECT m.id FROM messages m JOIN message_labels l ON l.msg_id = m.id '
+                'WHERE l.label = ? AND m.body IS NULL ORDER BY m.internal_date DESC LIMIT ?',
+                (label, limit)
+            ).fetchall()
+        return [row['id'] for row in rows]
+
+    def known_ids(self, msg_ids):
+        if not msg_ids:
+            return set()
+        placeholders = ','.join('?' * len(msg_ids))
+        with self._conn() as conn:
+            rows = conn.execute(f'SELECT id FROM messages WHERE id IN ({placeholders})', list(msg_ids))
+            return {row['id'] for row in rows}
+
+    # ── reads (UI) ───────────────────────────────
+    def list_emails(self, label='INBOX', query='', max_results=20):
+        """Summaries like mail_service.list_emails, or None if Gmail must answer"""
+        if not self.is_current():
+            return None
+        translated = local_filter(query)
+        if translated is None:
+            return None
+        condition, params = translated
+        with self._conn() as conn:
+            rows = conn.execute(
+                f'SELECT m.* FROM messages m JOIN message_labels l ON l.msg_id = m.id '
+                f'WHERE l.label = ? AND {condition} ORDER BY m.internal_date DESC LIMIT ?',
+                [label, *params, max_results]
+            ).fetchall()
+        # Fewer hits than asked for only proves anything if we hold the whole label
+        if len(rows) < max_results and self.get_state(f'complete:{label}') != '1':
+            return None
+        return [EmailSummary(row['id'], row['sender'], row['subject'], row['preview'],
+                             row['internal_date'] // 1000, row['unread']) for row in rows]
+
+    def get_detail(self, msg_id):
+        """Stored sender/subject/body/thread for the detail view, or None"""
+        with self._conn() as conn:
+            row = conn.execute(
+                'SELECT sender, subject, body, thread_id FROM messages WHERE id = ? AND body IS NOT NULL', (msg_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        return {'sender': row['sender'], 'sender_address': parse_sender(row['sender']).address,
+                'subject': row['subject'], 'body': row['body'], 'thread_id': row['thread_id']}
+
+    def contacts_version(self):
+        """Changes whenever the daemon or a send changed the stored mail"""
+        with self._conn() as conn:
+            row = conn.execute(
+                "SELECT (SELECT value FROM state WHERE key = 'history_id'), COUNT(*), MAX(internal_date) FROM messages"
+            ).fetchone()
+        return tuple(row)
+
+    def inbox_senders(self):
+        """(id, sender, internal_date ms) of every stored inbox message"""
+        with self._conn() as conn:
+            return conn.execute(
+                "SELECT m.id, m.sender, m.internal_date FROM messages m JOIN message_labels l ON l.msg_id = m.id "
+                "WHERE l.label = 'INBOX'"
+            ).fetchall()
+
+    def recipients(self):
+        """(address, name, internal_date ms, sent) for every stored To/Cc address"""
+        with self._conn() as conn:
+            return conn.execute(
+                "SELECT r.address, r.name, m.internal_date, "
+                "EXISTS (SELECT 1 FROM message_labels l WHERE l.msg_id = m.id AND l.label = 'SENT') AS sent "
+                "FROM message_recipients r JOIN messages m ON m.id = r.msg_id"
+            ).fetchall()
+
+    def is_current(self):
+        """Whether the daemon synced recently enough for the store to answer reads"""
+        if not self.enabled:
+            return False
+        age = self.synced_age()
+        return age is not None and age <= self.max_age
+
+    def synced_age(self):
+        """Seconds since the daemon last caught up, or None"""
+        synced_at = self.get_state('synced_at')
+        return time.time() - float(synced_at) if synced_at else None
+
+
+# Shared by the sync daemon thread and every UI session in this process
+STORE = MailStore()
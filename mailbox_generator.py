@@ -0,0 +1,284 @@
+import base64
+import hashlib
+import random
+from datetime import datetime, timezone
+from email.header import Header
+from email.utils import format_datetime
+
+# ────────────────────────────────────────────────
+# Seeded synthetic mailbox for offline benchmarking
+# ────────────────────────────────────────────────
+# Messages are generated on demand from (seed, index), so a 1M-message
+# mailbox costs nothing until it is read and the same seed always yields
+# byte-identical messages. Index 0 is the newest message.
+
+FIRST_NAMES = ['Alice', 'Bob', 'Carol', 'Dave', 'Erin', 'Frank', 'Grace', 'Heidi',
+               'Ivan', 'Judy', 'Mallory', 'Niaj', 'Olivia', 'Peggy', 'Rupert',
+               'Sybil', 'Trent', 'Victor', 'Walter', 'José', 'Zoë', 'Łukasz']
+LAST_NAMES = ['Smith', 'Jones', 'Nguyen', 'Müller', 'Garcia', 'Kim', 'Patel',
+              'Rossi', 'Dubois', 'Sato', 'Okafor', 'Novak']
+DOMAINS = ['example.com', 'example.org', 'mail.test', 'corp.example', 'news.example']
+NEWSLETTERS = ['Weekly Digest', 'Product Updates', 'Deals', 'Release Notes', 'Community']
+SUBJECT_WORDS = ['meeting', 'invoice', 'report', 'project', 'launch', 'update', 'lunch',
+                 'review', 'budget', 'travel', 'offer', 'contract', 'schedule', 'demo',
+                 'feedback', 'question', 'reminder', 'ticket', 'release', 'plan']
+BODY_WORDS = SUBJECT_WORDS + ['the', 'a', 'we', 'please', 'attached', 'thanks', 'next',
+                              'week', 'team', 'will', 'can', 'you', 'for', 'and', 'to',
+                              'see', 'notes', 'from', 'call', 'details', 'regards']
+
+ME = 'me@example.com'
+EPOCH_NEWEST = 1767225600          # 2026-01-01T00:00:00Z
+SECONDS_BETWEEN_MESSAGES = 600
+THREAD_SPAN = 4                     # consecutive messages may share a thread
+
+# Payload shapes and how often they occur (weights sum to 100)
+SHAPES = [
+    ('plain', 40),
+    ('html', 10),
+    ('alternative', 30),
+    ('mixed', 15),           # alternative + attachment
+    ('nested', 5),           # mixed > related > alternative + inline image + attachment
+]
+
+
+def b64url(data):
+    """Gmail-style base64url encoding"""
+    return base64.urlsafe_b64encode(data).decode('ascii')
+
+
+def message_id(index):
+    return f'{index:016x}'
+
+
+def message_index(msg_id):
+    return int(msg_id, 16)
+
+
+def _rng(seed, index, salt=''):
+    digest = hashlib.blake2b(f'{seed}:{index}:{salt}'.encode(), digest_size=8).digest()
+    return random.Random(int.from_bytes(digest, 'big'))
+
+
+def _words(rng, count):
+    return ' '.join(rng.choice(BODY_WORDS) for _ in range(count))
+
+
+def _person(rng):
+    first = rng.choice(FIRST_NAMES)
+    last = rng.choice(LAST_NAMES)
+    address = f'{first.lower()}.{last.lower()}@{rng.choice(DOMAINS)}'
+    address = address.encode('ascii', 'ignore').decode()
+    return f'{first} {last}', address
+
+
+def _format_address(name, address, encode):
+    if encode or not name.isascii():
+        name = Header(name, 'utf-8').encode()
+    return f'{name} <{address}>'
+
+
+class SyntheticMailbox:
+    """
+    Deterministic mailbox of `size` messages.
+    Only static content is generated here; mutable state (labels changed
+    later, sent mail, deletions) lives in the fake server.
+    """
+
+    def __init__(self, size=1000, seed=0):
+        self.size = size
+        self.seed = seed
+
+    # ── cheap per-message facts used for filtering ─────
+    def labels(self, index):
+        rng = _rng(self.seed, index, 'labels')
+        if rng.random() < 0.1:
+            labels = ['SENT']
+        else:
+            labels = ['INBOX']
+            if rng.random() < 0.3:
+                labels.append('UNREAD')
+            category = rng.choice(['CATEGORY_PERSONAL', 'CATEGORY_UPDATES', 'CATEGORY_PROMOTIONS'])
+            labels.append(category)
+        if rng.random() < 0.05:
+            labels.append('STARRED')
+        if rng.random() < 0.2:
+            labels.append('IMPORTANT')
+        return labels
+
+    def internal_date(self, index):
+        """Milliseconds since the epoch, newest first"""
+        return (EPOCH_NEWEST - index * SECONDS_BETWEEN_MESSAGES) * 1000
+
+    def thread_id(self, index):
+        rng = _rng(self.seed, index // THREAD_SPAN, 'thread')
+        # Roughly half of all runs of THREAD_SPAN messages form a thread
+        if rng.random() < 0.5:
+            return message_id(index - index % THREAD_SPAN)
+        return message_id(index)
+
+    def shape(self, index):
+        rng = _rng(self.seed, index, 'shape')
+        roll = rng.randrange(100)
+        for shape, weight in SHAPES:
+            if roll < weight:
+                return shape
+            roll -= weight
+        return 'plain'
+
+    # ── full message ─────────────────────────────
+    def headers(self, index):
+        rng = _rng(self.seed, index, 'headers')
+        sent = 'SENT' in self.labels(index)
+        name, address = _person(rng)
+        newsletter = not sent and rng.random() < 0.25
+        if newsletter:
+            name, address = rng.choice(NEWSLETTERS), f'newsletter@{rng.choice(DOMAINS)}'
+
+        subject = ' '.join(rng.choice(SUBJECT_WORDS) for _ in range(rng.randint(2, 6))).capitalize()
+        if index % THREAD_SPAN and self.thread_id(index) != message_id(index):
+            subject = f'Re: {subject}'
+        encode_subject = rng.random() < 0.1
+        if encode_subject:
+            subject = Header(subject + ' ✓', 'utf-8').encode()
+
+        date = datetime.fromtimestamp(self.internal_date(index) / 1000, tz=timezone.utc)
+        sender = _format_address(name, address, rng.random() < 0.05)
+        recipient = _format_address('Me', ME, False)
+        if sent:
+            sender, recipient = recipient, sender
+
+        # Some servers send lowercase header names
+        lower = rng.random() < 0.05
+        headers = [
+            ('Delivered-To', ME),
+            ('Received', f'from mx{rng.randint(1, 9)}.{rng.choice(DOMAINS)} by mx.google.test'),
+            ('MIME-Version', '1.0'),
+            ('Date', format_datetime(date)),
+            ('Message-ID', f'<{message_id(index)}.{self.seed}@mail.test>'),
+            ('from' if lower else 'From', sender),
+            ('to' if lower else 'To', recipient),
+            ('subject' if lower else 'Subject', subject),
+        ]
+        if rng.random() < 0.2:
+            cc_name, cc_address = _person(rng)
+            headers.append(('Cc', _format_address(cc_name, cc_address, False)))
+        if newsletter:
+            headers.append(('List-Unsubscribe', f'<mailto:unsubscribe@{address.split("@")[1]}>'))
+        return [{'name': k, 'value': v} for k, v in headers]
+
+    def body_text(self, index):
+        rng = _rng(self.seed, index, 'body')
+        # Mostly short mails with a long tail of large ones
+        paragraphs = rng.choice([1, 1, 2, 3, 5, 8, 40])
+        return '\n\n'.join(_words(rng, rng.randint(20, 120)).capitalize() + '.'
+                           for _ in range(paragraphs))
+
+    def snippet(self, index):
+        return self.body_text(index)[:120]
+
+    def attachment_size(self, index, part):
+        rng = _rng(self.seed, index, f'attachment:{part}')
+        return rng.choice([2_000, 15_000, 80_000, 250_000])
+
+    def attachment_data(self, index, part):
+        """Deterministic pseudo-random bytes for an attachment"""
+        size = self.attachment_size(index, part)
+        rng = _rng(self.seed, index, f'attachment-data:{part}')
+        return rng.randbytes(size)
+
+    def payload(self, index):
+        """Gmail API `payload` tree for format=full"""
+        text = self.body_text(index)
+        html = '<html><body>' + ''.join(f'<p>{p}</p>' for p in text.split('\n\n')) + '</body></html>'
+        headers = self.headers(index)
+        shape = self.shape(index)
+
+        def leaf(part_id, mime_type, data, filename=''):
+            raw = data.encode('utf-8')
+            return {
+                'partId': part_id,
+                'mimeType': mime_type,
+                'filename': filename,
+                'headers': [{'name': 'Content-Type', 'value': f'{mime_type}; charset="UTF-8"'}],
+                'body': {'size': len(raw), 'data': b64url(raw)},
+            }
+
+        def attachment(part_id, mime_type, filename):
+            return {
+                'partId': part_id,
+                'mimeType': mime_type,
+                'filename': filename,
+                'headers': [
+                    {'name': 'Content-Type', 'value': f'{mime_type}; name="{filename}"'},
+                    {'name': 'Content-Disposition', 'value': f'attachment; filename="{filename}"'},
+                ],
+                'body': {
+                    'size': self.attachment_size(index, part_id),
+                    'attachmentId': f'ANGjd{message_id(index)}_{part_id.replace(".", "_")}',
+                },
+            }
+
+        def container(part_id, mime_type, parts):
+            return {
+                'partId': part_id,
+                'mimeType': mime_type,
+                'filename': '',
+                'headers': [{'name': 'Content-Type', 'value': f'{mime_type}; boundary="{message_id(index)}"'}],
+                'body': {'size': 0},
+                'parts': parts,
+            }
+
+        if shape == 'plain':
+            root = leaf('', 'text/plain', text)
+        elif shape == 'html':
+            root = leaf('', 'text/html', html)
+        elif shape == 'alternative':
+            root = container('', 'multipart/alternative', [
+                leaf('0', 'text/plain', text), leaf('1', 'text/html', html)])
+        elif shape == 'mixed':
+            root = container('', 'multipart/mixed', [
+                container('0', 'multipart/alternative', [
+                    leaf('0.0', 'text/plain', text), leaf('0.1', 'text/html', html)]),
+                attachment('1', 'application/pdf', 'report.pdf')])
+        else:
+            root = container('', 'multipart/mixed', [
+                container('0', 'multipart/related', [
+                    container('0.0', 'multipart/alternative', [
+                        leaf('0.0.0', 'text/plain', text), leaf('0.0.1', 'text/html', html)]),
+                    attachment('0.1', 'image/png', 'logo.png')]),
+                attachment('1', 'application/zip', 'archive.zip')])
+
+        root['headers'] = headers + root['headers']
+        return root
+
+    def message(self, index):
+        """Static parts of a Gmail `Message` resource (format=full)"""
+        payload = self.payload(index)
+        size = sum(len(h['name']) + len(h['value']) for h in payload['headers'])
+        return {
+            'id': message_id(index),
+            'threadId': self.thread_id(index),
+            'snippet': self.snippet(index),
+            'internalDate': str(self.internal_date(index)),
+            'sizeEstimate': size + self._payload_size(payload),
+            'payload': payload,
+        }
+
+    def _payload_size(self, part):
+        return part['body'].get('size', 0) + sum(self._payload_size(p) for p in part.get('parts', []))
+
+
+if __name__ == '__main__':
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description='Print synthetic Gmail messages as JSON')
+    parser.add_argument('--size', type=int, default=1000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--index', type=int, default=0)
+    args = parser.parse_args()
+
+    mailbox = SyntheticMailbox(args.size, args.seed)
+    message = mailbox.message(args.index)
+    message['labelIds'] = mailbox.labels(args.index)
+    print(json.dumps(message, indent=2, ensure_ascii=False))
@@ -0,0 +1,244 @@
+import bisect
+import logging
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+log = logging.getLogger(__name__)
+
+# ────────────────────────────────────────────────
+# Process-wide metrics in the Prometheus text format
+# ────────────────────────────────────────────────
+# Counters, gauges and histograms shared by every Streamlit session in the
+# process. start_exporter() (called from app.py) serves them on
+# METRICS_HOST:METRICS_PORT (localhost unless overridden) and/or rewrites
+# METRICS_FILE every METRICS_INTERVAL seconds.
+
+METRICS_HOST = os.getenv('METRICS_HOST', '127.0.0.1')
+METRICS_PORT = os.getenv('METRICS_PORT')
+METRICS_FILE = os.getenv('METRICS_FILE')
+METRICS_INTERVAL = float(os.getenv('METRICS_INTERVAL', '5'))
+
+# Seconds; covers a cached read (~1 ms) up to a slow model call
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_registry = []
+_registry_lock = threading.Lock()
+
+
+def _escape(value):
+    """A label value escaped for the exposition format (backslash, quote, newline)"""
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _label_text(names, values):
+    if not names:
+        return ''
+    pairs = ','.join(f'{n}="{_escape(v)}"' for n, v in zip(names, values))
+    return '{' + pairs + '}'
+
+
+class _Metric:
+    kind = ''
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(labels)
+        self.lock = threading.Lock()
+        self.values = {}
+        with _registry_lock:
+            _registry.append(self)
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, '')) for name in self.label_names)
+
+    def header(self):
+        return [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.kind}']
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self.values.get(self._key(labels), 0)
+
+    def render(self):
+        with self.lock:
+            items = sorted(self.values.items())
+        return self.header() + [f'{self.name}{_label_text(self.label_names, k)} {v}' for k, v in items]
+
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        with self.lock:
+            self.values[self._key(labels)] = value
+
+    def render(self):
+        with self.lock:
+            items = sorted(self.values.items())
+        return self.header() + [f'{self.name}{_label_text(self.label_names, k)} {v}' for k, v in items]
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self.lock:
+            counts, total = self.values.get(key, ([0] * (len(self.buckets) + 1), 0.0))
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            self.values[key] = (counts, total + value)
+
+    def time(self, **labels):
+        """Context manager observing the block's duration"""
+        return _Timer(self, labels)
+
+    def render(self):
+        lines = self.header()
+        with self.lock:
+            items = sorted((k, (list(c), t)) for k, (c, t) in self.values.items())
+        for key, (counts, total) in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                labels = _label_text(self.label_names + ('le',), key + (le,))
+                lines.append(f'{self.name}_bucket{labels} {cumulative}')
+            base = _label_text(self.label_names, key)
+            lines.append(f'{self.name}_sum{base} {total}')
+            lines.append(f'{self.name}_count{base} {cumulative}')
+        return lines
+
+
+class _Timer:
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start, **self.labels)
+
+
+def render():
+    """All registered metrics in the Prometheus text exposition format"""
+    with _registry_lock:
+        metrics = list(_registry)
+    lines = []
+    for metric in metrics:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+
+# ── metrics recorded across the app ─────────────
+API_CALLS = Counter('gmail_api_calls_total', 'Gmail API requests by method and outcome', ('method', 'outcome'))
+API_LATENCY = Histogram('gmail_api_request_seconds', 'Gmail API request latency', ('method',))
+QUOTA_UNITS = Counter('gmail_quota_units_total', 'Gmail quota units consumed', ('method',))
+CACHE_LOOKUPS = Counter('cache_lookups_total', 'Cache lookups by cache and result', ('cache', 'result'))
+MODEL_LATENCY = Histogram('gemini_request_seconds', 'Model (Gemini) request latency', ('backend',))
+MODEL_OUTCOMES = Counter('gemini_outcomes_total', 'Guarded model calls by outcome', ('outcome',))
+MODEL_CIRCUIT_OPEN = Gauge('gemini_circuit_open', '1 while model calls are short-circuited to the local parser')
+MODEL_TOKENS = Counter('gemini_tokens_total', 'Model tokens by kind', ('kind',))
+RERUN_SECONDS = Histogram('streamlit_rerun_seconds', 'Duration of completed script runs', ('view',))
+VOICE_TO_ACTION_SECONDS = Histogram('voice_to_action_seconds', 'Speech recognized in the browser to command parsed')
+STT_WAIT_SECONDS = Histogram('stt_wait_seconds', 'End of speech to command dispatch (silence waited plus final decode)',
+                             ('path',))
+SPECULATION_OUTCOMES = Counter('speculation_outcomes_total', 'Speculative prefetches from partial transcripts by outcome',
+                               ('outcome',))
+SPECULATION_SAVED_SECONDS = Histogram('speculation_saved_seconds',
+                                      'Fetch time a command did not wait for thanks to speculation')
+SUMMARY_SECONDS = Histogram('summary_seconds', 'Thread summaries by path (cached, incremental, single, map_reduce)',
+                            ('path',))
+PANE_SECONDS = Histogram('streamlit_pane_seconds', 'Pane render time, in full or partial reruns', ('pane',))
+CACHE_HIT_RATIO = Gauge('cache_hit_ratio', 'Cache hits / lookups since start', ('cache',))
+OUTBOX_DEPTH = Gauge('outbox_queue_depth', 'Messages waiting in the outbox')
+SCHEDULER_IN_FLIGHT = Gauge('scheduler_in_flight', 'Gmail requests currently in flight')
+SCHEDULER_LIMIT = Gauge('scheduler_concurrency_limit', 'Current AIMD concurrency limit')
+
+
+def cache_hit_ratio(cache):
+    hits = CACHE_LOOKUPS.value(cache=cache, result='hit')
+    total = hits + CACHE_LOOKUPS.value(cache=cache, result='miss')
+    return hits / total if total else 0.0
+
+
+# ── exporter ────────────────────────────────────
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        payload = render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+
+_exporter = None
+_exporter_lock = threading.Lock()
+
+
+def _write_file(path):
+    tmp = f'{path}.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        f.write(render())
+    os.replace(tmp, path)
+
+
+def _refresh_loop(collectors):
+    while True:
+        for collect in collectors:
+            try:
+                collect()
+            except Exception:
+                # Its gauges keep their last value; say so instead of freezing quietly
+                log.warning('Metrics collector %s failed', getattr(collect, '__name__', collect), exc_info=True)
+        if METRICS_FILE:
+            try:
+                _write_file(METRICS_FILE)
+            except OSError as e:
+                # Disk full, directory gone...: keep refreshing and try again
+                log.warning('Writing metrics file %s failed: %s', METRICS_FILE, e)
+        time.sleep(METRICS_INTERVAL)
+
+
+def start_exporter(collectors=()):
+    """
+    Start the metrics thread(s) once per process.
+    `collectors` are callables run every METRICS_INTERVAL to refresh gauges
+    that are expensive to compute at scrape time (e.g. outbox depth).
+    """
+    global _exporter
+    with _exporter_lock:
+        if _exporter is not None:
+            return _exporter
+        # Bind first: if the port is taken this raises, and the next call tries again
+        server = None
+        if METRICS_PORT:
+            server = ThreadingHTTPServer((METRICS_HOST, int(METRICS_PORT)), _MetricsHandler)
+            server.daemon_threads = True
+        exporter = threading.Thread(target=_refresh_loop, args=(list(collectors),),
+                                    name='metrics-refresh', daemon=True)
+        exporter.start()
+        if server:
+            threading.Thread(target=server.serve_forever, name='metrics-http', daemon=True).start()
+        _exporter = exporter
+    return _exporter
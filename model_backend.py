@@ -0,0 +1,230 @@
+import json
+import os
+import random
+import re
+import time
+from dataclasses import dataclass, field
+from functools import lru_cache
+
+from local_parser import parse_locally
+
+# ────────────────────────────────────────────────
+# Pluggable model backends for parse_command
+# ────────────────────────────────────────────────
+# A backend is anything with generate_content(prompt, generation_config=...)
+# returning an object with `.text` (and optionally `.usage_metadata`), i.e.
+# the google.generativeai GenerativeModel interface. MODEL_BACKEND picks
+# one: "gemini" (default) or "fake" for offline runs and benchmarks.
+
+GEMINI_MODEL = "gemini-2.5-flash"
+
+# gemini-2.5 models think before answering, and thinking tokens count
+# against max_output_tokens. Commands and summaries don't need it, so
+# with_thinking_cap() caps it at THINKING_BUDGET (0 turns it off on
+# flash); SDKs without thinking_config get THINKING_HEADROOM_TOKENS of
+# extra room instead, so the answer isn't cut off.
+THINKING_BUDGET = int(os.getenv("THINKING_BUDGET", "0"))
+THINKING_HEADROOM_TOKENS = 2048
+
+_COMMAND_RE = re.compile(r'command:\s*"(.*?)"\s*$', re.I | re.M)
+SUMMARY_BULLETS = 5
+SUMMARY_BULLET_WORDS = 16
+
+
+@dataclass
+class UsageMetadata:
+    prompt_token_count: int = 0
+    candidates_token_count: int = 0
+    total_token_count: int = 0
+
+
+@dataclass
+class FakeResponse:
+    text: str
+    usage_metadata: UsageMetadata = field(default_factory=UsageMetadata)
+
+
+class FakeStream:
+    """
+    Iterates FakeResponse chunks of `chunk_tokens` tokens, paced at the
+    decode rate; like a streamed Gemini response, `.text` and
+    `.usage_metadata` describe the whole answer once iteration is done.
+    """
+
+    def __init__(self, text, usage, first_delay_ms, ms_per_token, chunk_tokens=4):
+        self.text = text
+        self.usage_metadata = usage
+        self.first_delay_ms = first_delay_ms
+        self.ms_per_token = ms_per_token
+        self.chunk_chars = chunk_tokens * 4
+
+    def __iter__(self):
+        if self.first_delay_ms > 0:
+            time.sleep(self.first_delay_ms / 1000)
+        for start in range(0, len(self.text), self.chunk_chars):
+            chunk = self.text[start:start + self.chunk_chars]
+            if self.ms_per_token:
+                time.sleep(estimate_tokens(chunk) * self.ms_per_token / 1000)
+            yield FakeResponse(chunk)
+
+
+class FakeModelError(Exception):
+    """Injected failure, shaped like a Gemini 503"""
+
+
+# What a model call raises when the model is unreachable or overloaded
+# (ModelGuard's timeouts are TimeoutErrors): the cases where answering
+# from the local parser instead is right. Anything else is a bug.
+MODEL_UNAVAILABLE_ERRORS = (FakeModelError, ConnectionError, TimeoutError, OSError)
+try:
+    from google.api_core.exceptions import GoogleAPIError
+    MODEL_UNAVAILABLE_ERRORS += (GoogleAPIError,)
+except ImportError:
+    pass
+
+
+@lru_cache(maxsize=None)
+def _sdk_has_thinking_config():
+    try:
+        from google.generativeai import protos
+    except ImportError:
+        return False
+    return "thinking_config" in protos.GenerationConfig.meta.fields
+
+
+def with_thinking_cap(config):
+    """`config` with the model's thinking capped, or room made for it in max_output_tokens"""
+    if _sdk_has_thinking_config():
+        return dict(config, thinking_config={"thinking_budget": THINKING_BUDGET})
+    if "max_output_tokens" in config:
+        return dict(config, max_output_tokens=config["max_output_tokens"] + THINKING_HEADROOM_TOKENS)
+    return config
+
+
+def estimate_tokens(text):
+    """Rough token count (~4 characters per token)"""
+    return max(1, len(text) // 4)
+
+
+class FakeModel:
+    """
+    Deterministic local stand-in for Gemini.
+    Parses the command quoted in the prompt with local_parser and returns
+    it as JSON after `latency_ms` (± `jitter_ms`) plus per-token prefill
+    and decode time. With `malformed_rate`, that fraction of responses is
+    wrapped in markdown fences, prefixed with prose or truncated, the ways
+    real model output goes wrong. A `response_schema` in the generation
+    config gets compact JSON and, like Gemini, never fences or prose.
+    `error_rate` of calls raise and `tail_rate` of calls take an extra
+    `tail_ms` before the first token, for exercising timeouts and hedging.
+    Prompts starting with "Summarize" (summarizer.py) get an extractive
+    summary instead: the opening words of up to five paragraphs.
+    """
+
+    def __init__(self, latency_ms=0.0, jitter_ms=0.0, malformed_rate=0.0, seed=0,
+                 ms_per_1k_prompt_tokens=0.0, ms_per_output_token=0.0,
+                 error_rate=0.0, tail_rate=0.0, tail_ms=0.0):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.malformed_rate = malformed_rate
+        self.ms_per_1k_prompt_tokens = ms_per_1k_prompt_tokens
+        self.ms_per_output_token = ms_per_output_token
+        self.error_rate = error_rate
+        self.tail_rate = tail_rate
+        self.tail_ms = tail_ms
+        self.random = random.Random(seed)
+        self.calls = 0
+
+    def _command(self, prompt):
+        match = _COMMAND_RE.search(prompt)
+        return match.group(1) if match else prompt
+
+    def _summary(self, prompt):
+        paragraphs = [p for p in prompt.split('\n\n')[1:] if p.strip()]
+        step = max(1, len(paragraphs) // SUMMARY_BULLETS)
+        return '\n'.join('- ' + ' '.join(p.split()[:SUMMARY_BULLET_WORDS])
+                         for p in paragraphs[::step][:SUMMARY_BULLETS])
+
+    def _malform(self, text, structured):
+        kinds = ['truncated'] if structured else ['fenced', 'bare_fence', 'prose', 'truncated']
+        kind = self.random.choice(kinds)
+        if kind == 'fenced':
+            return f"```json\n{text}\n```"
+        if kind == 'bare_fence':
+            return f"```\n{text}\n```"
+        if kind == 'prose':
+            return f"Here is the parsed command:\n{text}"
+        return text[:len(text) // 2]
+
+    def generate_content(self, prompt, generation_config=None, stream=False, **kwargs):
+        self.calls += 1
+        config = generation_config or {}
+        structured = 'response_schema' in config
+
+        if prompt.startswith('Summarize'):
+            text = self._summary(prompt)
+        else:
+            parsed = parse_locally(self._command(prompt))
+            # Free-form JSON mode pretty-prints; schema mode emits the minimum
+            text = json.dumps(parsed, separators=(',', ':')) if structured else json.dumps(parsed, indent=2)
+            if self.malformed_rate and self.random.random() < self.malformed_rate:
+                text = self._malform(text, structured)
+        if limit := config.get('max_output_tokens'):
+            text = text[:limit * 4]
+
+        prompt_tokens = estimate_tokens(prompt)
+        output_tokens = estimate_tokens(text)
+        usage = UsageMetadata(prompt_tokens, output_tokens, prompt_tokens + output_tokens)
+        # Time to first token, then decode time per output token
+        first_delay = (self.latency_ms + self.random.uniform(-1, 1) * self.jitter_ms
+                       + prompt_tokens / 1000 * self.ms_per_1k_prompt_tokens)
+        if self.tail_rate and self.random.random() < self.tail_rate:
+            first_delay += self.tail_ms
+        if self.error_rate and self.random.random() < self.error_rate:
+            time.sleep(max(0.0, first_delay) / 1000)
+            raise FakeModelError("503 The model is overloaded. Please try again later.")
+        if stream:
+            return FakeStream(text, usage, first_delay, self.ms_per_output_token)
+
+        delay = first_delay + output_tokens * self.ms_per_output_token
+        if delay > 0:
+            time.sleep(delay / 1000)
+        return FakeResponse(text, usage)
+
+
+def gemini_model():
+    import google.generativeai as genai
+
+    api_key = os.getenv("GEMINI_API_KEY")
+    if not api_key:
+        raise ValueError("GEMINI_API_KEY not found in .env file. Please add it.")
+    genai.configure(api_key=api_key)
+    return genai.GenerativeModel(GEMINI_MODEL)
+
+
+def fake_model():
+    return FakeModel(
+        latency_ms=float(os.getenv("FAKE_MODEL_LATENCY_MS", "0")),
+        jitter_ms=float(os.getenv("FAKE_MODEL_JITTER_MS", "0")),
+        malformed_rate=float(os.getenv("FAKE_MODEL_MALFORMED_RATE", "0")),
+        seed=int(os.getenv("FAKE_MODEL_SEED", "0")),
+        ms_per_1k_prompt_tokens=float(os.getenv("FAKE_MODEL_MS_PER_1K_PROMPT_TOKENS", "0")),
+        ms_per_output_token=float(os.getenv("FAKE_MODEL_MS_PER_OUTPUT_TOKEN", "0")),
+        error_rate=float(os.getenv("FAKE_MODEL_ERROR_RATE", "0")),
+        tail_rate=float(os.getenv("FAKE_MODEL_TAIL_RATE", "0")),
+        tail_ms=float(os.getenv("FAKE_MODEL_TAIL_MS", "0")),
+    )
+
+
+BACKENDS = {
+    "gemini": gemini_model,
+    "fake": fake_model,
+}
+
+
+def get_model(name=None):
+    """Build the backend named by `name` or the MODEL_BACKEND env var"""
+    name = (name or os.getenv("MODEL_BACKEND") or "gemini").lower()
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown MODEL_BACKEND '{name}'. Choose from: {', '.join(BACKENDS)}")
+    return BACKENDS[name]()
@@ -0,0 +1,228 @@
+import os
+import queue
+import threading
+import time
+from collections import deque
+
+import metrics
+
+# ────────────────────────────────────────────────
+# Resilience layer around model calls
+# ────────────────────────────────────────────────
+# ModelGuard.generate() runs generate_content on worker threads so the
+# Streamlit script never waits longer than MODEL_DEADLINE_S:
+#   - a hedged second request starts once the first has taken longer than
+#     the recent p95, and whichever answers first wins;
+#   - after MODEL_BREAKER_FAILURES consecutive failures or timeouts the
+#     circuit opens and calls fail fast (callers fall back to the local
+#     parser) until a probe succeeds MODEL_BREAKER_COOLDOWN_S later.
+# Streamed chunks are handed back to the calling thread, so on_chunk
+# callbacks can still draw Streamlit elements.
+
+MODEL_DEADLINE_S = float(os.getenv('MODEL_DEADLINE_S', '8'))
+MODEL_HEDGE = os.getenv('MODEL_HEDGE', '1') == '1'
+HEDGE_MIN_SAMPLES = 10          # don't guess a p95 from fewer calls
+HEDGE_MIN_DELAY_S = 0.25
+MODEL_BREAKER_FAILURES = int(os.getenv('MODEL_BREAKER_FAILURES', '3'))
+MODEL_BREAKER_COOLDOWN_S = float(os.getenv('MODEL_BREAKER_COOLDOWN_S', '30'))
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling the model while the circuit is open"""
+
+
+class ModelTimeoutError(TimeoutError):
+    """No attempt answered before the deadline"""
+
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold=MODEL_BREAKER_FAILURES, cooldown=MODEL_BREAKER_COOLDOWN_S):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.lock = threading.Lock()
+
+    def allow(self):
+        """True if a call may go out; after the cooldown one probe is let through"""
+        with self.lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN and time.monotonic() - self.opened_at >= self.cooldown:
+                self.state = HALF_OPEN
+                return True
+            return False
+
+    def record_success(self):
+        with self.lock:
+            self.state = CLOSED
+            self.failures = 0
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state = OPEN
+                self.opened_at = time.monotonic()
+
+
+class ModelGuard:
+    """Deadline, hedging and circuit breaking for one model backend"""
+
+    def __init__(self, model, deadline=MODEL_DEADLINE_S, hedge=MODEL_HEDGE, breaker=None):
+        self.model = model
+        self.deadline = deadline
+        self.hedge = hedge
+        self.breaker = breaker or CircuitBreaker()
+        self.latencies = deque(maxlen=200)     # seconds, successful calls only
+        self.lock = threading.Lock()
+        self.counts = {'calls': 0, 'ok': 0, 'errors': 0, 'timeouts': 0,
+                       'rejected': 0, 'hedged': 0, 'hedge_wins': 0, 'fallbacks': 0}
+
+    # ── stats ────────────────────────────────────
+    def _count(self, key):
+        with self.lock:
+            self.counts[key] += 1
+
+    def record_fallback(self):
+        """The caller answered from its local fallback instead"""
+        self._count('fallbacks')
+        metrics.MODEL_OUTCOMES.inc(outcome='fallback')
+
+    def percentile(self, pct):
+        with self.lock:
+            ordered = sorted(self.latencies)
+        if not ordered:
+            return None
+        return ordered[min(len(ordered) - 1, int(pct / 100 * len(ordered)))]
+
+    def hedge_delay(self):
+        """Seconds to wait before hedging, or None to not hedge"""
+        if not self.hedge or len(self.latencies) < HEDGE_MIN_SAMPLES:
+            return None
+        return max(HEDGE_MIN_DELAY_S, self.percentile(95))
+
+    def stats(self):
+        with self.lock:
+            counts = dict(self.counts)
+        p50, p95 = self.percentile(50), self.percentile(95)
+        counts.update(
+            circuit=self.breaker.state,
+            p50_ms=round(p50 * 1000, 1) if p50 is not None else None,
+            p95_ms=round(p95 * 1000, 1) if p95 is not None else None,
+        )
+        return counts
+
+    # ── attempts ─────────────────────────────────
+    def _attempt(self, attempt, events, prompt, generation_config, stream):
+        try:
+            response = self.model.generate_content(prompt, generation_config=generation_config, stream=stream)
+            if stream:
+                for chunk in response:
+                    events.put(('chunk', attempt, chunk))
+            events.put(('done', attempt, response))
+        except Exception as e:
+            events.put(('error', attempt, e))
+
+    def _start(self, attempt, events, *args):
+        threading.Thread(target=self._attempt, args=(attempt, events) + args,
+                         name=f'model-attempt-{attempt}', daemon=True).start()
+
+    def generate(self, prompt, generation_config=None, stream=False, on_chunk=None, parse=None):
+        """
+        generate_content under the deadline; returns (response, parse(response)).
+        With stream=True, on_chunk(chunk) runs on this thread for the attempt
+        that streamed first. `parse` errors count as failures.
+        Raises CircuitOpenError, ModelTimeoutError or the model's error.
+        """
+        if not self.breaker.allow():
+            self._count('rejected')
+            metrics.MODEL_OUTCOMES.inc(outcome='rejected')
+            raise CircuitOpenError('model circuit open')
+
+        self._count('calls')
+        events = queue.Queue()
+        started = time.monotonic()
+        deadline = started + self.deadline
+        delay = self.hedge_delay()
+        hedge_at = started + delay if delay is not None else None
+
+        self._start(0, events, prompt, generation_config, stream)
+        running, winner, error = 1, None, None
+        settled = False
+        try:
+            while True:
+                now = time.monotonic()
+                wake = min(deadline, hedge_at) if hedge_at else deadline
+                try:
+                    kind, attempt, payload = events.get(timeout=max(0.0, wake - now))
+                except queue.Empty:
+                    if hedge_at and time.monotonic() < deadline and winner is None:
+                        # Hedged request: whichever attempt answers first wins
+                        hedge_at = None
+                        self._count('hedged')
+                        metrics.MODEL_OUTCOMES.inc(outcome='hedged')
+                        self._start(1, events, prompt, generation_config, stream)
+                        running += 1
+                        continue
+                    if time.monotonic() >= deadline:
+                        settled = True
+                        self._fail('timeouts')
+                        raise ModelTimeoutError(f'model did not answer within {self.deadline:.1f}s')
+                    hedge_at = None
+                    continue
+
+                if winner is not None and attempt != winner:
+                    continue
+                if kind == 'chunk':
+                    winner = attempt
+                    if on_chunk:
+                        on_chunk(payload)
+                    continue
+                if kind == 'error':
+                    running -= 1
+                    error = payload
+                    if winner is None and running:
+                        continue            # the other attempt may still answer
+                    settled = True
+                    self._fail('errors')
+                    raise error
+
+                try:
+                    parsed = parse(payload) if parse else None
+                except Exception:
+                    # The model answered, so it is available: a garbled answer
+                    # is counted but doesn't push the breaker towards open
+                    settled = True
+                    self.breaker.record_success()
+                    self._count('errors')
+                    metrics.MODEL_OUTCOMES.inc(outcome='error')
+                    raise
+                settled = True
+                self._succeed(time.monotonic() - started, hedge_won=attempt == 1)
+                return payload, parsed
+        finally:
+            if not settled:
+                # on_chunk raised, or a BaseException (e.g. a Streamlit rerun)
+                # came through: still settle the call so a half-open probe
+                # can't leave the breaker stuck rejecting everything
+                self._fail('errors')
+
+    def _succeed(self, elapsed, hedge_won):
+        self.breaker.record_success()
+        with self.lock:
+            self.latencies.append(elapsed)
+            self.counts['ok'] += 1
+            if hedge_won:
+                self.counts['hedge_wins'] += 1
+        metrics.MODEL_OUTCOMES.inc(outcome='hedge_win' if hedge_won else 'ok')
+
+    def _fail(self, key):
+        self.breaker.record_failure()
+        self._count(key)
+        metrics.MODEL_OUTCOMES.inc(outcome=key.rstrip('s'))
@@ -0,0 +1,276 @@
+import http.client
+import random
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+
+import httplib2
+from google.auth.exceptions import RefreshError, TransportError
+from googleapiclient.errors import HttpError
+
+from mail_service import deliver_email
+from scheduler import priority, SYNC
+
+# ────────────────────────────────────────────────
+# Persistent outbox with a background delivery worker
+# ────────────────────────────────────────────────
+# Compose only writes a row to a local SQLite queue and returns. A single
+# worker thread per process delivers queued rows with exponential backoff,
+# so sends neither block the Streamlit script nor get lost on restart.
+#
+# A row is marked sent the moment Gmail accepts the message. A worker
+# holds a lease on the row it is sending and renews it while it works; a
+# row still "sending" after its lease ran out was interrupted mid-send. A
+# send that failed with a 5xx or a transport error (reset, timeout, TLS)
+# may have been accepted anyway. Both may have gone out, so they are set
+# aside for review instead of being sent again. Only throttled sends (429)
+# and errors raised before the request was written (token refresh, DNS,
+# connect) are retried.
+
+OUTBOX_PATH = 'outbox.db'
+
+MAX_ATTEMPTS = 5
+BACKOFF_BASE = 2.0      # seconds; doubled after every failed attempt
+BACKOFF_MAX = 300.0
+POLL_INTERVAL = 1.0
+LEASE_SECONDS = 60.0    # renewed every LEASE_SECONDS / 3 while the worker is alive
+
+# Status values stored in the `status` column
+QUEUED = 'queued'
+SENDING = 'sending'
+SENT = 'sent'
+FAILED = 'failed'
+REVIEW = 'review'       # may have been sent; check Sent before sending again
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    to_addr TEXT NOT NULL,
+    subject TEXT NOT NULL,
+    body TEXT NOT NULL,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL,
+    message_id TEXT,
+    error TEXT,
+    owner TEXT,
+    lease_until REAL,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+)
+"""
+# Columns added after the first release, for outbox.db files that predate them
+_ADDED_COLUMNS = {'owner': 'TEXT', 'lease_until': 'REAL'}
+
+# Raised before any of the request was written: refreshing the token,
+# resolving or connecting to Gmail. Safe to send again.
+_BEFORE_SEND = (RefreshError, TransportError, httplib2.ServerNotFoundError,
+                socket.gaierror, ConnectionRefusedError)
+# Raised while talking to Gmail: the request may have gone out
+_TRANSPORT = (OSError, http.client.HTTPException, httplib2.HttpLib2Error)
+
+_worker = None
+_worker_lock = threading.Lock()
+_wakeup = threading.Event()
+
+
+def _connect(path=None):
+    conn = sqlite3.connect(path or OUTBOX_PATH, timeout=10)
+    conn.row_factory = sqlite3.Row
+    conn.execute(_SCHEMA)
+    columns = {row['name'] for row in conn.execute('PRAGMA table_info(outbox)')}
+    for name, kind in _ADDED_COLUMNS.items():
+        if name not in columns:
+            conn.execute(f'ALTER TABLE outbox ADD COLUMN {name} {kind}')
+    return conn
+
+
+def enqueue(to, subject, body):
+    """Persist a send request and return its outbox id immediately"""
+    now = time.time()
+    with _connect() as conn:
+        cursor = conn.execute(
+            "INSERT INTO outbox (to_addr, subject, body, status, next_attempt_at, created_at, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (to, subject, body, QUEUED, now, now, now)
+        )
+    _wakeup.set()
+    return cursor.lastrowid
+
+
+def statuses(outbox_ids):
+    """Return {outbox id: row dict} for the given ids"""
+    if not outbox_ids:
+        return {}
+    placeholders = ','.join('?' * len(outbox_ids))
+    with _connect() as conn:
+        rows = conn.execute(
+            f"SELECT id, to_addr, subject, status, attempts, message_id, error "
+            f"FROM outbox WHERE id IN ({placeholders})",
+            list(outbox_ids)
+        ).fetchall()
+    return {row['id']: dict(row) for row in rows}
+
+
+def queue_depth():
+    """Number of messages still waiting to be delivered"""
+    with _connect() as conn:
+        return conn.execute(
+            "SELECT COUNT(*) FROM outbox WHERE status IN (?, ?)", (QUEUED, SENDING)
+        ).fetchone()[0]
+
+
+def backoff_delay(attempts):
+    """Exponential backoff with full jitter for the given attempt count"""
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempts))
+
+
+def _outcome_unknown(error):
+    """A server or transport error: Gmail may have accepted the message anyway"""
+    if isinstance(error, HttpError):
+        return error.resp.status >= 500
+    if isinstance(error, _BEFORE_SEND):
+        return False
+    return isinstance(error, _TRANSPORT)
+
+
+def _is_retryable(error):
+    if isinstance(error, HttpError):
+        return error.resp.status == 429
+    return isinstance(error, _BEFORE_SEND)
+
+
+def _claim_next(conn, owner):
+    """Atomically move the next due row from queued to sending, leased to `owner`"""
+    with conn:
+        row = conn.execute(
+            "SELECT * FROM outbox WHERE status = ? AND next_attempt_at <= ? "
+            "ORDER BY next_attempt_at, id LIMIT 1",
+            (QUEUED, time.time())
+        ).fetchone()
+        if row is None:
+            return None
+        now = time.time()
+        conn.execute(
+            "UPDATE outbox SET status = ?, owner = ?, lease_until = ?, updated_at = ? WHERE id = ?",
+            (SENDING, owner, now + LEASE_SECONDS, now, row['id'])
+        )
+    return row
+
+
+def _renew_leases(conn, owner):
+    with conn:
+        conn.execute(
+            "UPDATE outbox SET lease_until = ? WHERE status = ? AND owner = ?",
+            (time.time() + LEASE_SECONDS, SENDING, owner)
+        )
+
+
+def _reclaim_expired(conn):
+    """Set aside rows whose worker stopped renewing its lease mid-send"""
+    with conn:
+        conn.execute(
+            "UPDATE outbox SET status = ?, error = ?, updated_at = ? "
+            "WHERE status = ? AND (lease_until IS NULL OR lease_until < ?)",
+            (REVIEW, 'Interrupted while sending; check Sent before sending again', time.time(),
+             SENDING, time.time())
+        )
+
+
+def _mark_sent(conn, row, message_id):
+    with conn:
+        conn.execute(
+            "UPDATE outbox SET status = ?, attempts = ?, message_id = ?, error = NULL, updated_at = ? "
+            "WHERE id = ?",
+            (SENT, row['attempts'] + 1, message_id, time.time(), row['id'])
+        )
+
+
+def _deliver(conn, service, row):
+    sent = []
+
+    def on_sent(message_id):
+        sent.append(message_id)
+        _mark_sent(conn, row, message_id)
+
+    try:
+        deliver_email(service, row['to_addr'], row['subject'], row['body'], on_sent=on_sent)
+    except Exception as e:
+        if sent:
+            return              # Gmail has the message; never send it twice
+        attempts = row['attempts'] + 1
+        error = str(e)
+        if _outcome_unknown(e):
+            status, next_at = REVIEW, time.time()
+            error = f'{e}; check Sent before sending again'
+        elif _is_retryable(e) and attempts < MAX_ATTEMPTS:
+            status, next_at = QUEUED, time.time() + backoff_delay(attempts)
+        else:
+            status, next_at = FAILED, time.time()
+        with conn:
+            conn.execute(
+                "UPDATE outbox SET status = ?, attempts = ?, next_attempt_at = ?, error = ?, updated_at = ? "
+                "WHERE id = ?",
+                (status, attempts, next_at, error, time.time(), row['id'])
+            )
+
+
+def _heartbeat(owner, stop):
+    """Keep this worker's leases alive, also while a send is blocked"""
+    conn = _connect()
+    while not stop.wait(LEASE_SECONDS / 3):
+        try:
+            _renew_leases(conn, owner)
+        except sqlite3.Error:
+            pass                # tried again on the next beat
+    conn.close()
+
+
+def _run(service_factory, stop):
+    conn = _connect()
+    # Other workers (another process) renew their own rows' leases; only
+    # rows nobody renewed in time were left mid-send and may have gone out
+    owner = uuid.uuid4().hex
+    _reclaim_expired(conn)
+    beating = threading.Event()
+    threading.Thread(target=_heartbeat, args=(owner, beating), name='outbox-lease', daemon=True).start()
+
+    try:
+        # googleapiclient services aren't thread-safe; the worker owns its own
+        service = service_factory()
+        # Interactive reads from UI sessions go ahead of background delivery
+        with priority(SYNC):
+            _drain(conn, service, stop, owner)
+    finally:
+        beating.set()
+        conn.close()
+
+
+def _drain(conn, service, stop, owner):
+    while not stop.is_set():
+        row = _claim_next(conn, owner)
+        if row is None:
+            _reclaim_expired(conn)
+            _wakeup.wait(POLL_INTERVAL)
+            _wakeup.clear()
+            continue
+        _deliver(conn, service, row)
+
+
+def start_worker(service_factory):
+    """
+    Start the delivery worker once per process.
+    service_factory builds a Gmail service for the worker thread's own use.
+    """
+    global _worker
+    with _worker_lock:
+        if _worker is None or not _worker.is_alive():
+            stop = threading.Event()
+            _worker = threading.Thread(
+                target=_run, args=(service_factory, stop), name='outbox-worker', daemon=True
+            )
+            _worker.stop = stop
+            _worker.start()
+    return _worker
@@ -0,0 +1,198 @@
+import json
+
+# ────────────────────────────────────────────────
+# Incremental JSON for streamed model output
+# ────────────────────────────────────────────────
+# parse_partial() reads a JSON prefix and returns as much of the value as
+# is known so far. A string cut off mid-stream comes back as a
+# PartialStr, so callers can show it while it is still being filled in
+# but wait for a plain str before acting on it. Numbers and literals
+# that are still incomplete, and keys without a value yet, are left out.
+#
+#   parse_partial('{"action": "compose", "params": {"to": "car')
+#   -> {'action': 'compose', 'params': {'to': PartialStr('car')}}
+
+
+class PartialStr(str):
+    """A string value whose closing quote has not arrived yet"""
+
+
+class _Incomplete(Exception):
+    pass
+
+
+_MISSING = object()
+_LITERALS = {'true': True, 'false': False, 'null': None}
+_ESCAPES = {'"': '"', '\\': '\\', '/': '/', 'b': '\b', 'f': '\f', 'n': '\n', 'r': '\r', 't': '\t'}
+
+
+class _Reader:
+    def __init__(self, text):
+        self.text = text
+        self.pos = 0
+
+    def skip_ws(self):
+        while self.pos < len(self.text) and self.text[self.pos] in ' \t\r\n':
+            self.pos += 1
+
+    def at_end(self):
+        self.skip_ws()
+        return self.pos >= len(self.text)
+
+    def value(self):
+        """Next value, or _MISSING if it has not started or cannot be used yet"""
+        if self.at_end():
+            return _MISSING
+        ch = self.text[self.pos]
+        if ch == '{':
+            return self.obj()
+        if ch == '[':
+            return self.array()
+        if ch == '"':
+            return self.string()
+        return self.scalar()
+
+    def obj(self):
+        result = {}
+        self.pos += 1
+        while True:
+            if self.at_end():
+                return result
+            if self.text[self.pos] == '}':
+                self.pos += 1
+                return result
+            if self.text[self.pos] == ',':
+                self.pos += 1
+                continue
+            key = self.string()
+            if isinstance(key, PartialStr) or self.at_end():
+                return result
+            self.pos += 1                  # ':'
+            value = self.value()
+            if value is not _MISSING:
+                result[key] = value
+            if self.pos >= len(self.text):
+                return result
+
+    def array(self):
+        result = []
+        self.pos += 1
+        while True:
+            if self.at_end():
+                return result
+            if self.text[self.pos] == ']':
+                self.pos += 1
+                return result
+            if self.text[self.pos] == ',':
+                self.pos += 1
+                continue
+            start = self.pos
+            value = self.value()
+            if self.pos == start:
+                # Nothing readable here (a stray '}'): end the array so the
+                # reader always moves forward
+                return result
+            if value is not _MISSING:
+                result.append(value)
+            if self.pos >= len(self.text):
+                return result
+
+    def string(self):
+        chars = []
+        self.pos += 1
+        text = self.text
+        while self.pos < len(text):
+            ch = text[self.pos]
+            if ch == '"':
+                self.pos += 1
+                return ''.join(chars)
+            if ch == '\\':
+                if self.pos + 1 >= len(text):
+                    break
+                code = text[self.pos + 1]
+                if code == 'u':
+                    digits = text[self.pos + 2:self.pos + 6]
+                    if len(digits) < 4:
+                        break
+                    try:
+                        chars.append(chr(int(digits, 16)))
+                    except ValueError:
+                        # Invalid escape: leave the string partial so the
+                        # command is never acted on; result() reports it
+                        break
+                    self.pos += 6
+                    continue
+                chars.append(_ESCAPES.get(code, code))
+                self.pos += 2
+                continue
+            chars.append(ch)
+            self.pos += 1
+        self.pos = len(text)
+        return PartialStr(''.join(chars))
+
+    def scalar(self):
+        start = self.pos
+        while self.pos < len(self.text) and self.text[self.pos] not in ',}] \t\r\n':
+            self.pos += 1
+        token = self.text[start:self.pos]
+        if self.pos >= len(self.text):
+            # Might still grow ("tr" -> "true", "1" -> "12")
+            return _MISSING
+        if token in _LITERALS:
+            return _LITERALS[token]
+        try:
+            return json.loads(token)
+        except ValueError:
+            return _MISSING
+
+
+def parse_partial(text):
+    """Best-known value of a (possibly truncated) JSON document, or None"""
+    value = _Reader(text).value()
+    return None if value is _MISSING else value
+
+
+def is_complete(value):
+    """True if no string inside `value` is still being streamed"""
+    if isinstance(value, PartialStr):
+        return False
+    if isinstance(value, dict):
+        return all(is_complete(v) for v in value.values())
+    if isinstance(value, list):
+        return all(is_complete(v) for v in value)
+    return True
+
+
+class StreamingCommand:
+    """
+    Feeds streamed parse_command output and reports progress:
+    `on_action(action)` once, as soon as the action string is complete,
+    then `on_params(params)` whenever the known params change.
+    """
+
+    def __init__(self, on_action=None, on_params=None):
+        self.on_action = on_action
+        self.on_params = on_params
+        self.buffer = ''
+        self.action = None
+        self.params = {}
+
+    def feed(self, chunk):
+        self.buffer += chunk
+        value = parse_partial(self.buffer)
+        if not isinstance(value, dict):
+            return
+        action = value.get('action')
+        if self.action is None and isinstance(action, str) and not isinstance(action, PartialStr):
+            self.action = action
+            if self.on_action:
+                self.on_action(action)
+        params = value.get('params')
+        if self.action is not None and isinstance(params, dict) and params != self.params:
+            self.params = params
+            if self.on_params:
+                self.on_params(params)
+
+    def result(self):
+        """The complete command; raises ValueError if the JSON is malformed"""
+        return json.loads(self.buffer)
@@ -0,0 +1,304 @@
+import asyncio
+import contextlib
+import contextvars
+import heapq
+import itertools
+import random
+import threading
+import time
+from collections import Counter
+from googleapiclient.errors import HttpError
+
+import metrics
+from tracing import span
+
+# ────────────────────────────────────────────────
+# Quota-aware request scheduler for the Gmail API
+# ────────────────────────────────────────────────
+# Every mail_service call goes through SCHEDULER.execute(). It:
+#   - budgets Gmail quota units with a token bucket,
+#   - caps in-flight requests with AIMD (additive increase on success,
+#     multiplicative decrease on 429/5xx),
+#   - retries throttled/transient failures with jittered backoff (sends
+#     only when throttled: a 5xx may come after Gmail accepted one),
+#   - admits waiting requests by priority, so interactive fetches
+#     overtake background sync and prefetch.
+
+# Quota units per method, from the Gmail API usage limits page
+QUOTA_UNITS = {
+    'getProfile': 1,
+    'labels.list': 1,
+    'labels.get': 1,
+    'labels.create': 5,
+    'messages.list': 5,
+    'messages.get': 5,
+    'messages.modify': 5,
+    'messages.trash': 5,
+    'messages.batchModify': 50,
+    'messages.send': 100,
+    'messages.attachments.get': 5,
+    'threads.list': 10,
+    'threads.get': 10,
+    'history.list': 2,
+    'watch': 100,
+}
+DEFAULT_UNITS = 5
+
+# Per-user limit is 250 units/second (moving average)
+QUOTA_PER_SECOND = 250
+QUOTA_BURST = 250
+
+# Priorities; lower runs first
+INTERACTIVE = 0
+SYNC = 1
+PREFETCH = 2
+
+MAX_RETRIES = 5
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 32.0
+
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+# A 5xx from these may come after the request took effect; only throttling
+# (which rejects the request) is retried, the caller decides the rest
+NOT_IDEMPOTENT = {'messages.send'}
+RATE_LIMIT_REASONS = ('rateLimitExceeded', 'userRateLimitExceeded')
+
+_priority = contextvars.ContextVar('gmail_request_priority', default=INTERACTIVE)
+
+
+@contextlib.contextmanager
+def priority(level):
+    """Run the enclosed mail_service calls at the given priority"""
+    token = _priority.set(level)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def method_name(request):
+    """'gmail.users.messages.get' -> 'messages.get'"""
+    method_id = getattr(request, 'methodId', None) or ''
+    return method_id.replace('gmail.users.', '', 1)
+
+
+def is_retryable(error, method=None):
+    """True for throttling and, unless `method` is NOT_IDEMPOTENT, transient server errors"""
+    if not isinstance(error, HttpError):
+        return False
+    status = error.resp.status
+    if status in RETRYABLE_STATUS:
+        return status == 429 or method not in NOT_IDEMPOTENT
+    # Gmail reports per-user rate limiting as 403 with a reason
+    return status == 403 and any(reason in str(error.content) for reason in RATE_LIMIT_REASONS)
+
+
+class RequestScheduler:
+    """Token bucket + AIMD concurrency limiter with priority admission"""
+
+    def __init__(self, rate=QUOTA_PER_SECOND, burst=QUOTA_BURST,
+                 initial_concurrency=4, min_concurrency=1, max_concurrency=16):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.refilled_at = time.monotonic()
+
+        self.limit = float(initial_concurrency)
+        self.min_concurrency = min_concurrency
+        self.max_concurrency = max_concurrency
+        self.in_flight = 0
+
+        self._cond = threading.Condition()
+        self._waiting = []              # heap of (priority, seq)
+        self._seq = itertools.count()
+
+        self.calls = Counter()          # method -> requests sent
+        self.units = Counter()          # method -> quota units spent
+        self.throttled = Counter()      # method -> retryable failures
+
+    # ── token bucket ─────────────────────────────
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.refilled_at) * self.rate)
+        self.refilled_at = now
+
+    # ── admission ────────────────────────────────
+    def _acquire(self, cost, level):
+        ticket = (level, next(self._seq))
+        cost = min(cost, self.burst)
+        with self._cond:
+            heapq.heappush(self._waiting, ticket)
+            try:
+                while True:
+                    timeout = None
+                    if self._waiting[0] == ticket and self.in_flight < int(self.limit):
+                        self._refill()
+                        if self.tokens >= cost:
+                            break
+                        timeout = (cost - self.tokens) / self.rate
+                    self._cond.wait(timeout)
+            except BaseException:
+                self._waiting.remove(ticket)
+                heapq.heapify(self._waiting)
+                self._cond.notify_all()
+                raise
+            heapq.heappop(self._waiting)
+            self.tokens -= cost
+            self.in_flight += 1
+            self._cond.notify_all()
+
+    def _release(self, congested):
+        with self._cond:
+            self.in_flight -= 1
+            if congested:
+                self.limit = max(self.min_concurrency, self.limit / 2)
+            else:
+                self.limit = min(self.max_concurrency, self.limit + 1 / self.limit)
+            self._cond.notify_all()
+
+    def _abandon(self):
+        """Give back a slot whose request never ran to an outcome (cancelled or interrupted)"""
+        with self._cond:
+            self.in_flight -= 1
+            self._cond.notify_all()
+
+    def _abandon_when_admitted(self, acquiring):
+        """Done-callback for an admission whose waiter was cancelled"""
+        if not acquiring.cancelled() and acquiring.exception() is None:
+            self._abandon()
+
+    def _try_acquire(self, cost):
+        """Admit at once if nobody is queued and the budget allows; never blocks"""
+        cost = min(cost, self.burst)
+        with self._cond:
+            if self._waiting or self.in_flight >= int(self.limit):
+                return False
+            self._refill()
+            if self.tokens < cost:
+                return False
+            self.tokens -= cost
+            self.in_flight += 1
+            return True
+
+    # ── bookkeeping ──────────────────────────────
+    def _sent(self, method, cost):
+        with self._cond:
+            self.calls[method] += 1
+            self.units[method] += cost
+        metrics.QUOTA_UNITS.inc(cost, method=method)
+
+    def _throttled(self, method):
+        with self._cond:
+            self.throttled[method] += 1
+
+    def _finished(self, method, started, outcome):
+        metrics.API_LATENCY.observe(time.perf_counter() - started, method=method)
+        metrics.API_CALLS.inc(method=method, outcome=outcome)
+
+    # ── public API ───────────────────────────────
+    def execute(self, request, method=None, level=None):
+        """
+        Execute a googleapiclient request under the quota budget.
+        Retries throttled/transient errors and re-raises everything else.
+        """
+        method = method or method_name(request)
+        level = _priority.get() if level is None else level
+        cost = QUOTA_UNITS.get(method, DEFAULT_UNITS)
+
+        with span(f'gmail.{method}', units=cost, priority=level) as s:
+            for attempt in range(MAX_RETRIES + 1):
+                queued_at = time.perf_counter()
+                self._acquire(cost, level)
+                if s:
+                    s.set(attempts=attempt + 1, queue_ms=round((time.perf_counter() - queued_at) * 1000, 2))
+                self._sent(method, cost)
+                started = time.perf_counter()
+                try:
+                    result = request.execute()
+                except Exception as e:
+                    retry = is_retryable(e, method)
+                    self._release(congested=retry)
+                    self._finished(method, started, 'throttled' if retry else 'error')
+                    if not retry or attempt == MAX_RETRIES:
+                        raise
+                    self._throttled(method)
+                    time.sleep(random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt)))
+                    continue
+                except BaseException:
+                    # Streamlit's StopException/RerunException on a click mid-call
+                    self._abandon()
+                    raise
+                self._release(congested=False)
+                self._finished(method, started, 'ok')
+                return result
+
+    async def aexecute(self, send, method, level=None):
+        """
+        Async counterpart of execute() sharing the same budget.
+        `send` is a zero-argument coroutine function performing the request;
+        it should raise HttpError so retries are classified the same way.
+        """
+        level = _priority.get() if level is None else level
+        cost = QUOTA_UNITS.get(method, DEFAULT_UNITS)
+
+        with span(f'gmail.{method}', units=cost, priority=level) as s:
+            for attempt in range(MAX_RETRIES + 1):
+                queued_at = time.perf_counter()
+                if not self._try_acquire(cost):
+                    # Wait for admission off the event loop. The thread can't be
+                    # interrupted: if this task is cancelled (a superseded
+                    # prefetch), the slot it is eventually given goes back.
+                    acquiring = asyncio.ensure_future(asyncio.to_thread(self._acquire, cost, level))
+                    try:
+                        await asyncio.shield(acquiring)
+                    except asyncio.CancelledError:
+                        acquiring.add_done_callback(self._abandon_when_admitted)
+                        raise
+                if s:
+                    s.set(attempts=attempt + 1, queue_ms=round((time.perf_counter() - queued_at) * 1000, 2))
+                self._sent(method, cost)
+                started = time.perf_counter()
+                try:
+                    result = await send()
+                except asyncio.CancelledError:
+                    self._abandon()
+                    raise
+                except Exception as e:
+                    retry = is_retryable(e, method)
+                    self._release(congested=retry)
+                    self._finished(method, started, 'throttled' if retry else 'error')
+                    if not retry or attempt == MAX_RETRIES:
+                        raise
+                    self._throttled(method)
+                    await asyncio.sleep(random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt)))
+                    continue
+                self._release(congested=False)
+                self._finished(method, started, 'ok')
+                return result
+
+    def snapshot(self):
+        """Counters for dashboards and benchmarks"""
+        with self._cond:
+            return {
+                'concurrency_limit': self.limit,
+                'in_flight': self.in_flight,
+                'waiting': len(self._waiting),
+                'tokens': self.tokens,
+                'calls': dict(self.calls),
+                'units': dict(self.units),
+                'throttled': dict(self.throttled),
+            }
+
+
+# One budget per process: quota is per user, not per session
+SCHEDULER = RequestScheduler()
+
+
+def execute(request, method=None, level=None):
+    """Shorthand for SCHEDULER.execute"""
+    return SCHEDULER.execute(request, method, level)
+
+
+async def aexecute(send, method, level=None):
+    """Shorthand for SCHEDULER.aexecute"""
+    return await SCHEDULER.aexecute(send, method, level)
@@ -0,0 +1,129 @@
+import concurrent.futures
+import os
+import time
+
+import async_core
+import contacts
+from local_parser import parse_locally
+from mail_cache import canonical_query
+from mail_service import filter_query
+from mail_store import STORE
+import metrics
+from scheduler import PREFETCH, priority
+
+# ────────────────────────────────────────────────
+# Speculative prefetch on partial transcripts
+# ────────────────────────────────────────────────
+# While the user is still speaking, every new partial transcript gets a
+# cheap local guess (local_parser) of the data the command will need: the
+# listing for "show unread..." or "open email from bob", the open email
+# for "reply". That fetch starts at prefetch priority right away.
+#
+# When the real command runs, the executor asks for what it actually
+# needs with take(): if it is what was guessed and the prefetch is done
+# (or finishes within TAKE_WAIT_SECONDS), the prefetched result is used;
+# otherwise the normal path runs at interactive priority. A guess still
+# queued behind sync traffic never delays the command, it just finishes
+# into the cache. Listings the local mail store can answer are never
+# speculated, they are cheap already.
+#
+# Outcomes go to speculation_outcomes_total (hit / miss / late / unused / error)
+# and the time the command didn't have to wait to speculation_saved_seconds.
+
+SPECULATE = os.getenv('SPECULATE', '1') == '1'
+# How long a command waits for an unfinished prefetch before fetching itself
+TAKE_WAIT_SECONDS = 0.1
+
+
+def key_for(parsed, current_email_id=None):
+    """What executing a parsed command fetches: ('list', query), ('detail', id) or None"""
+    action, params = parsed.get('action'), parsed.get('params') or {}
+    if action == 'filter_inbox':
+        return 'list', canonical_query(filter_query(params)[0])
+    if action == 'open_email' and params.get('sender'):
+        # Resolved locally from the contact index, nothing to fetch
+        if contacts.index().latest_from(params['sender']):
+            return None
+        return 'list', canonical_query(f"from:{params['sender']}")
+    if action == 'reply' and current_email_id:
+        return 'detail', current_email_id
+    return None
+
+
+def guess(partial, current_email_id=None):
+    """key_for() the local grammar's reading of a partial transcript"""
+    return key_for(parse_locally(partial), current_email_id)
+
+
+async def _fetch(key):
+    kind, arg = key
+    started = time.perf_counter()
+    gmail = async_core.gmail_client()
+    with priority(PREFETCH):
+        if kind == 'list':
+            result = await async_core.list_emails(gmail, query=arg)
+        else:
+            result = await async_core.get_email_detail(gmail, arg)
+    return result, time.perf_counter() - started
+
+
+class Speculator:
+    """One session's speculation: at most one guess, replaced as the partial changes"""
+
+    def __init__(self, enabled=SPECULATE):
+        self.enabled = enabled
+        self.key = None
+        self.future = None
+
+    def update(self, partial, current_email_id=None):
+        """Guess from a new partial transcript; starts a fetch if the guess changed"""
+        if not self.enabled:
+            return
+        key = guess(partial, current_email_id)
+        if key is None or key == self.key:
+            return
+        if key[0] == 'list' and STORE.list_emails('INBOX', key[1]) is not None:
+            return
+        # An earlier guess still in flight just finishes into the cache
+        self.key, self.future = key, async_core.submit(_fetch(key))
+
+    def take(self, key):
+        """
+        (True, result) if `key` was guessed and its fetch succeeded, else
+        (False, None) and the caller fetches it itself, also when the fetch
+        hasn't finished within TAKE_WAIT_SECONDS. Settles the guess.
+        """
+        guessed, future = self.key, self.future
+        self.key = self.future = None
+        if guessed is None:
+            return False, None
+        if guessed != key:
+            metrics.SPECULATION_OUTCOMES.inc(outcome='miss')
+            return False, None
+
+        started = time.perf_counter()
+        try:
+            result, fetch_seconds = future.result(TAKE_WAIT_SECONDS)
+        except concurrent.futures.TimeoutError:
+            metrics.SPECULATION_OUTCOMES.inc(outcome='late')
+            return False, None
+        except Exception:
+            metrics.SPECULATION_OUTCOMES.inc(outcome='error')
+            return False, None
+        waited = time.perf_counter() - started
+        metrics.SPECULATION_OUTCOMES.inc(outcome='hit')
+        metrics.SPECULATION_SAVED_SECONDS.observe(max(0.0, fetch_seconds - waited))
+        return True, result
+
+    def settle(self):
+        """End of a command: a guess nobody took was for nothing"""
+        if self.key is not None:
+            metrics.SPECULATION_OUTCOMES.inc(outcome='unused')
+        self.key = self.future = None
+
+
+def hit_rate():
+    """Hits / settled guesses since start, or None"""
+    outcomes = {o: metrics.SPECULATION_OUTCOMES.value(outcome=o) for o in ('hit', 'miss', 'late', 'unused', 'error')}
+    total = sum(outcomes.values())
+    return outcomes['hit'] / total if total else None
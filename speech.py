@@ -0,0 +1,309 @@
+import base64
+import json
+import math
+import os
+import re
+import threading
+import time
+from array import array
+
+from local_parser import parse_locally
+
+# ────────────────────────────────────────────────
+# Server-side speech-to-text
+# ────────────────────────────────────────────────
+# Optional alternative to the browser's Web Speech API. The voice
+# component streams 16 kHz mono 16-bit PCM chunks; a recognizer stream
+# turns them into partial transcripts and, once the speaker has been
+# silent for STT_ENDPOINT_SILENCE_MS, a final one that goes through
+# parse_command like a typed command.
+#
+# Fast path: if after a short pause (STT_FAST_PATH_SILENCE_MS) the partial
+# already spells out one of the common commands below, it runs straight
+# away from the local grammar, without waiting for the endpoint, the final
+# decode or the model. Only commands that change nothing qualify; bulk
+# actions wait for the final transcript and a confirmation. Commands that
+# a longer one could continue ("compose email" ... "to bob") wait for the
+# endpoint, then still skip the final decode and the model.
+#
+# STT_BACKEND picks the recognizer: "browser" (default, no server STT),
+# "vosk" (offline CPU model at VOSK_MODEL_PATH) or "fake" for tests and
+# benchmarks.
+
+SAMPLE_RATE = 16000
+STT_BACKEND = os.getenv('STT_BACKEND', 'browser').lower()
+ENDPOINT_SILENCE_MS = float(os.getenv('STT_ENDPOINT_SILENCE_MS', '700'))
+FAST_PATH_SILENCE_MS = float(os.getenv('STT_FAST_PATH_SILENCE_MS', '200'))
+STT_FAST_PATH = os.getenv('STT_FAST_PATH', '1') == '1'
+SILENCE_RMS = 500               # int16 RMS below this counts as silence
+MAX_UTTERANCE_MS = 15000
+
+# Complete, read-only commands with nothing left to dictate; anything
+# else (senders, subjects, labels, bulk actions) waits for the final
+# transcript and the model. No longer command starts with one of these,
+# so they run after the short pause.
+FAST_PHRASES = {
+    'open inbox', 'show inbox', 'go to inbox',
+    'how many unread do i have', 'how many unread emails do i have',
+    'summarize this email', 'summarize this thread', 'summarize the thread',
+}
+
+# Complete commands that also begin longer ones ("show unread" ... "emails
+# from alice"): a pause may be the speaker thinking, so these only skip the
+# final decode and the model once the endpoint silence has passed.
+ENDPOINT_PHRASES = {
+    'show unread emails', 'show unread', 'show my unread emails', 'show unread messages',
+    'show all emails', 'show emails from last week',
+    'compose email', 'compose an email', 'new email', 'write an email',
+    'reply', 'reply to this',
+    'how many unread', 'how many unread emails',
+    'summarize', 'summarize this',
+}
+
+
+def normalize(text):
+    return ' '.join(re.sub(r"[^\w\s@.']", ' ', (text or '').lower()).split())
+
+
+def fast_intent(partial, ended=False):
+    """
+    The command a partial transcript already states in full, or None.
+    ENDPOINT_PHRASES only count once the speaker has `ended`.
+    """
+    text = normalize(partial)
+    if text not in FAST_PHRASES and not (ended and text in ENDPOINT_PHRASES):
+        return None
+    return parse_locally(text)
+
+
+def rms(pcm):
+    samples = array('h', pcm[:len(pcm) // 2 * 2])
+    if not samples:
+        return 0.0
+    return math.sqrt(sum(s * s for s in samples) / len(samples))
+
+
+def duration_ms(pcm):
+    return len(pcm) / 2 / SAMPLE_RATE * 1000
+
+
+# ── recognizer streams ──────────────────────────
+class RecognizerStream:
+    """
+    One utterance. Subclasses implement _accept(pcm) -> partial text and
+    _finish() -> final text; silence tracking is shared.
+    """
+
+    def __init__(self):
+        self.partial = ''
+        self.audio_ms = 0.0
+        self.silence_ms = 0.0       # trailing silence
+        self.heard_speech = False
+
+    def accept(self, pcm):
+        """Feed a chunk of PCM; returns the partial transcript so far"""
+        ms = duration_ms(pcm)
+        self.audio_ms += ms
+        if rms(pcm) < SILENCE_RMS:
+            self.silence_ms += ms
+        else:
+            self.silence_ms = 0.0
+            self.heard_speech = True
+        self.partial = self._accept(pcm)
+        return self.partial
+
+    def ended(self):
+        """The speaker has stopped (or the utterance ran too long)"""
+        return (self.heard_speech and self.silence_ms >= ENDPOINT_SILENCE_MS) or self.audio_ms >= MAX_UTTERANCE_MS
+
+    def paused(self):
+        return self.heard_speech and self.silence_ms >= FAST_PATH_SILENCE_MS
+
+    def finish(self):
+        return self._finish()
+
+    def _accept(self, pcm):
+        raise NotImplementedError
+
+    def _finish(self):
+        raise NotImplementedError
+
+
+class FakeStream(RecognizerStream):
+    """Decodes fake_utterance() audio: each speech chunk carries one word"""
+
+    def __init__(self, ms_per_chunk=0.0, final_ms=0.0):
+        super().__init__()
+        self.words = []
+        self.ms_per_chunk = ms_per_chunk
+        self.final_ms = final_ms
+
+    def _accept(self, pcm):
+        if self.ms_per_chunk:
+            time.sleep(self.ms_per_chunk / 1000)
+        if pcm.startswith(_FAKE_MAGIC):
+            end = pcm.index(b'\x00', len(_FAKE_MAGIC))
+            self.words.append(pcm[len(_FAKE_MAGIC):end].decode())
+        return ' '.join(self.words)
+
+    def _finish(self):
+        if self.final_ms:
+            time.sleep(self.final_ms / 1000)
+        return ' '.join(self.words)
+
+
+class VoskStream(RecognizerStream):
+    def __init__(self, model):
+        from vosk import KaldiRecognizer
+
+        super().__init__()
+        self.recognizer = KaldiRecognizer(model, SAMPLE_RATE)
+        self.segments = []
+
+    def _accept(self, pcm):
+        if self.recognizer.AcceptWaveform(pcm):
+            # Vosk's own endpointer closed a segment
+            self.segments.append(json.loads(self.recognizer.Result()).get('text', ''))
+            return ' '.join(filter(None, self.segments))
+        partial = json.loads(self.recognizer.PartialResult()).get('partial', '')
+        return ' '.join(filter(None, self.segments + [partial]))
+
+    def _finish(self):
+        self.segments.append(json.loads(self.recognizer.FinalResult()).get('text', ''))
+        return ' '.join(filter(None, self.segments))
+
+
+# ── fake audio ──────────────────────────────────
+_FAKE_MAGIC = b'FAKESTT:'
+
+
+def fake_utterance(text, chunk_ms=100, chunks_per_word=3, trailing_silence_ms=1000):
+    """
+    PCM chunks FakeStream understands: a few loud chunks per word (the
+    first one carries the word), then trailing silence.
+    """
+    size = int(SAMPLE_RATE * chunk_ms / 1000) * 2
+    chunks = []
+    for word in text.split():
+        head = _FAKE_MAGIC + word.encode() + b'\x00'
+        chunks.append(head + b'\x7f' * (size - len(head)) if len(head) < size else head)
+        chunks.extend([b'\x7f' * size] * (chunks_per_word - 1))
+    chunks.extend([b'\x00' * size] * math.ceil(trailing_silence_ms / chunk_ms))
+    return chunks
+
+
+# ── backends ────────────────────────────────────
+class FakeRecognizer:
+    def __init__(self, ms_per_chunk=0.0, final_ms=0.0):
+        self.ms_per_chunk = ms_per_chunk
+        self.final_ms = final_ms
+
+    def stream(self):
+        return FakeStream(self.ms_per_chunk, self.final_ms)
+
+
+class VoskRecognizer:
+    def __init__(self, model_path):
+        from vosk import Model
+
+        self.model = Model(model_path)
+
+    def stream(self):
+        return VoskStream(self.model)
+
+
+def fake_recognizer():
+    return FakeRecognizer(
+        ms_per_chunk=float(os.getenv('FAKE_STT_MS_PER_CHUNK', '0')),
+        final_ms=float(os.getenv('FAKE_STT_FINAL_MS', '0')),
+    )
+
+
+def vosk_recognizer():
+    model_path = os.getenv('VOSK_MODEL_PATH')
+    if not model_path:
+        raise ValueError("VOSK_MODEL_PATH not set. Download a model from https://alphacephei.com/vosk/models")
+    return VoskRecognizer(model_path)
+
+
+BACKENDS = {
+    'fake': fake_recognizer,
+    'vosk': vosk_recognizer,
+}
+
+_recognizer = None
+_recognizer_lock = threading.Lock()
+
+
+def get_recognizer():
+    """The process-wide recognizer for STT_BACKEND, or None for browser STT"""
+    global _recognizer
+    if STT_BACKEND == 'browser':
+        return None
+    if STT_BACKEND not in BACKENDS:
+        raise ValueError(f"Unknown STT_BACKEND '{STT_BACKEND}'. Choose from: browser, {', '.join(BACKENDS)}")
+    with _recognizer_lock:
+        # Models are large; load once and share between sessions
+        if _recognizer is None:
+            _recognizer = BACKENDS[STT_BACKEND]()
+    return _recognizer
+
+
+# ── utterances ──────────────────────────────────
+class Utterance:
+    """
+    Server-side state for one spoken command. The component resends
+    unacknowledged chunks, so feed() skips any sequence number already seen.
+    Once done, either `command` (fast path, already parsed) or `text`
+    (final transcript) is set.
+    """
+
+    def __init__(self, utterance_id, recognizer, fast_path=STT_FAST_PATH):
+        self.id = utterance_id
+        self.stream = recognizer.stream()
+        self.fast_path = fast_path
+        self.acked = -1
+        self.done = False
+        self.command = None
+        self.text = None
+        self.path = None
+        self.wait_ms = 0.0      # speech end -> command, in audio time plus decode time
+
+    @property
+    def partial(self):
+        return self.stream.partial
+
+    def feed(self, chunks, stopped=False):
+        """
+        chunks: [(seq, pcm bytes or base64 str)]; stopped: the user ended
+        recording. Returns True once the utterance is done.
+        """
+        for seq, pcm in sorted(chunks, key=lambda c: c[0]):
+            if self.done or seq <= self.acked:
+                continue
+            if isinstance(pcm, str):
+                pcm = base64.b64decode(pcm)
+            self.stream.accept(pcm)
+            self.acked = seq
+
+            if self.fast_path and self.stream.paused():
+                if command := fast_intent(self.stream.partial, ended=self.stream.ended()):
+                    self._close('fast', command=command, text=self.stream.partial)
+            if not self.done and self.stream.ended():
+                self._finish()
+
+        if stopped and not self.done:
+            self._finish()
+        return self.done
+
+    def _finish(self):
+        started = time.perf_counter()
+        text = self.stream.finish()
+        self._close('final', text=text, decode_ms=(time.perf_counter() - started) * 1000)
+
+    def _close(self, path, command=None, text=None, decode_ms=0.0):
+        self.done = True
+        self.path = path
+        self.command = command
+        self.text = text
+        self.wait_ms = self.stream.silence_ms + decode_ms
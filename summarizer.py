@@ -0,0 +1,309 @@
+import asyncio
+import hashlib
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+import async_core
+import mail_service
+import metrics
+from ai_assistant import model, usage_of
+from model_backend import estimate_tokens, with_thinking_cap
+from model_guard import ModelGuard
+from tracing import span, traced
+
+# ────────────────────────────────────────────────
+# Thread summaries
+# ────────────────────────────────────────────────
+# summarize_thread() turns a thread (oldest message first) into a few
+# bullet points with the model handle parse_command uses, behind a guard
+# of its own: a longer deadline, no hedging, and a separate circuit
+# breaker, so slow or failing summaries never push commands onto the
+# local parser.
+#
+# Messages, with quoted lines dropped, are packed in order into chunks of
+# about SUMMARY_CHUNK_TOKENS (a longer message is split). A thread that
+# fits one chunk takes one call; longer threads are mapped chunk by chunk,
+# SUMMARY_CONCURRENCY calls at a time, and the partial summaries merged.
+# Chunk boundaries only depend on the messages before them, so a reply
+# leaves the earlier chunks as they were.
+#
+# Summaries are cached under a hash chain over (message id, content hash),
+# which gives the key of every prefix of a thread in one pass. Asking
+# again is a cache hit; when a reply arrives, the newest cached prefix
+# summary is updated with just the new messages (if they fit one chunk),
+# and otherwise only the changed chunks are summarized again.
+
+SUMMARY_CHUNK_TOKENS = int(os.getenv('SUMMARY_CHUNK_TOKENS', '8000'))
+SUMMARY_CONCURRENCY = int(os.getenv('SUMMARY_CONCURRENCY', '4'))
+SUMMARY_DEADLINE_S = float(os.getenv('SUMMARY_DEADLINE_S', '30'))
+SUMMARY_CACHE_SIZE = 512
+
+# Thinking tokens count against max_output_tokens; see with_thinking_cap()
+GENERATION_CONFIG = with_thinking_cap({'temperature': 0.2, 'max_output_tokens': 300})
+
+SINGLE_PROMPT = """Summarize this email thread in at most five short bullet points: what is asked or decided, by whom, open questions and dates. Plain text, no preamble.
+
+{messages}"""
+
+MAP_PROMPT = """Summarize part {part} of {parts} of an email thread in at most five short bullet points: requests, decisions, open questions and dates. Plain text, no preamble.
+
+{messages}"""
+
+REDUCE_PROMPT = """Summarize an email thread from these summaries of its consecutive parts, in at most five short bullet points. Keep who asked or decided what and anything still open. Plain text, no preamble.
+
+{summaries}"""
+
+UPDATE_PROMPT = """Summarize an email thread in at most five short bullet points, given a summary of its earlier messages and the messages that followed. Keep what still matters from the summary; where they disagree, the newer messages win. Plain text, no preamble.
+
+Summary so far:
+{summary}
+
+New messages:
+{messages}"""
+
+# Paths, cheapest first
+CACHED, INCREMENTAL, SINGLE, MAP_REDUCE = 'cached', 'incremental', 'single', 'map_reduce'
+
+_QUOTE_INTRO = re.compile(r'^On .+ wrote:\s*$')
+_BLANK_LINES = re.compile(r'\n{3,}')
+
+summary_guard = ModelGuard(model, deadline=SUMMARY_DEADLINE_S, hedge=False)
+
+
+class EmptySummaryError(ValueError):
+    """The model answered with no summary text"""
+
+
+class Summary:
+    __slots__ = ('text', 'messages', 'chunks', 'path', 'model_calls', 'prompt_tokens', 'output_tokens',
+                 'reused', 'elapsed')
+
+    def __init__(self, text, messages, chunks, path):
+        self.text = text
+        self.messages = messages
+        self.chunks = chunks
+        self.path = path
+        self.model_calls = 0
+        self.prompt_tokens = 0
+        self.output_tokens = 0
+        # Chunk summaries taken from the cache
+        self.reused = 0
+        self.elapsed = 0.0
+
+    def __repr__(self):
+        return (f'Summary(messages={self.messages}, path={self.path!r}, calls={self.model_calls}, '
+                f'tokens={self.prompt_tokens}+{self.output_tokens})')
+
+
+class _Piece:
+    """A message, or part of one too long for a chunk, with the chain digest up to it"""
+    __slots__ = ('text', 'tokens', 'digest', 'last')
+
+    def __init__(self, text, digest, last):
+        self.text = text
+        self.tokens = estimate_tokens(text)
+        self.digest = digest
+        # Whether the piece ends its message (a place a prefix summary can end)
+        self.last = last
+
+
+def clean_body(body):
+    """Body without quoted lines ("> ...") and the "On ... wrote:" above them"""
+    lines = [line for line in body.splitlines() if not line.startswith('>')]
+    while lines and (not lines[-1].strip() or _QUOTE_INTRO.match(lines[-1])):
+        lines.pop()
+    return _BLANK_LINES.sub('\n\n', '\n'.join(lines)).strip()
+
+
+def _split(text, limit):
+    """`text` in parts of at most `limit` characters, cut at line or word breaks"""
+    parts = []
+    while len(text) > limit:
+        cut = text.rfind('\n', 0, limit)
+        if cut < limit // 2:
+            cut = text.rfind(' ', 0, limit)
+        if cut < limit // 2:
+            cut = limit
+        parts.append(text[:cut].strip())
+        text = text[cut:].strip()
+    return parts + [text]
+
+
+def pieces(messages):
+    """_Pieces of a thread, each with the digest of everything up to and including it"""
+    result, digest = [], b''
+    for message in messages:
+        text = f"From: {message.get('sender', 'Unknown')}\n{clean_body(message.get('body', ''))}"
+        content = hashlib.blake2b(text.encode(), digest_size=16).digest()
+        parts = _split(text, SUMMARY_CHUNK_TOKENS * 4)
+        for i, part in enumerate(parts):
+            digest = hashlib.blake2b(digest + f"{message['id']}#{i}".encode() + content, digest_size=16).digest()
+            result.append(_Piece(part, digest, i == len(parts) - 1))
+    return result
+
+
+def chunked(items, size=lambda item: item.tokens):
+    """Consecutive runs of `items` of at most SUMMARY_CHUNK_TOKENS (one item if it alone is larger)"""
+    chunks, current, tokens = [], [], 0
+    for item in items:
+        if current and tokens + size(item) > SUMMARY_CHUNK_TOKENS:
+            chunks.append(current)
+            current, tokens = [], 0
+        current.append(item)
+        tokens += size(item)
+    return chunks + [current] if current else chunks
+
+
+# ── cache ───────────────────────────────────────
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+_usage_lock = threading.Lock()
+
+
+def _cached(key):
+    with _cache_lock:
+        text = _cache.get(key)
+        if text is not None:
+            _cache.move_to_end(key)
+    return text
+
+
+def _store(key, text):
+    with _cache_lock:
+        _cache[key] = text
+        _cache.move_to_end(key)
+        while len(_cache) > SUMMARY_CACHE_SIZE:
+            _cache.popitem(last=False)
+
+
+def clear_cache():
+    with _cache_lock:
+        _cache.clear()
+
+
+# ── model calls ─────────────────────────────────
+def _summary_text(response):
+    # Raising keeps an empty answer out of the cache
+    text = response.text.strip()
+    if not text:
+        raise EmptySummaryError('model returned an empty summary')
+    return text
+
+
+def _generate(prompt, summary):
+    """One guarded summary call; adds its usage to `summary`"""
+    with span('model.summarize', prompt_chars=len(prompt)) as s:
+        response, text = summary_guard.generate(prompt, GENERATION_CONFIG, parse=_summary_text)
+        prompt_tokens, output_tokens = usage_of(response)
+        if s:
+            s.set(prompt_tokens=prompt_tokens, output_tokens=output_tokens)
+    metrics.MODEL_TOKENS.inc(prompt_tokens, kind='prompt')
+    metrics.MODEL_TOKENS.inc(output_tokens, kind='output')
+    # Map calls run on worker threads
+    with _usage_lock:
+        summary.model_calls += 1
+        summary.prompt_tokens += prompt_tokens
+        summary.output_tokens += output_tokens
+    return text
+
+
+async def _generate_all(prompts, summary):
+    """Summaries for `prompts`, at most SUMMARY_CONCURRENCY calls at a time"""
+    limit = asyncio.Semaphore(SUMMARY_CONCURRENCY)
+
+    async def one(prompt):
+        async with limit:
+            return await asyncio.to_thread(_generate, prompt, summary)
+    return await asyncio.gather(*(one(prompt) for prompt in prompts))
+
+
+def _join(texts):
+    return '\n\n'.join(texts)
+
+
+def _map(chunks, summary):
+    """Summary per chunk, from the cache or generated in parallel"""
+    keys = [('chunk', chunk[-1].digest) for chunk in chunks]
+    texts = [_cached(key) for key in keys]
+    summary.reused = sum(text is not None for text in texts)
+    missing = [i for i, text in enumerate(texts) if text is None]
+    prompts = [MAP_PROMPT.format(part=i + 1, parts=len(chunks), messages=_join(p.text for p in chunks[i]))
+               for i in missing]
+    for i, text in zip(missing, async_core.run(_generate_all(prompts, summary))):
+        texts[i] = text
+        _store(keys[i], text)
+    return texts
+
+
+def _reduce(texts, summary):
+    """Merge partial summaries, in rounds while they don't fit one prompt"""
+    while len(texts) > 1:
+        # Summaries are capped at max_output_tokens, so a group holds many of them
+        groups = chunked(texts, size=estimate_tokens)
+        if len(groups) == 1:
+            return _generate(REDUCE_PROMPT.format(summaries=_join(texts)), summary)
+        prompts = [REDUCE_PROMPT.format(summaries=_join(group)) for group in groups]
+        texts = async_core.run(_generate_all(prompts, summary))
+    return texts[0]
+
+
+@traced('summarize_thread')
+def summarize_thread(messages):
+    """
+    Summary of `messages` ({'id', 'sender', 'body'} dicts, oldest first).
+    Raises the model guard's errors (CircuitOpenError, ModelTimeoutError, ...).
+    """
+    started = time.perf_counter()
+    all_pieces = pieces(messages)
+    if not all_pieces:
+        return Summary('', 0, 0, CACHED)
+    key = ('thread', all_pieces[-1].digest)
+
+    if (text := _cached(key)) is not None:
+        metrics.CACHE_LOOKUPS.inc(cache='summaries', result='hit')
+        summary = Summary(text, len(messages), 0, CACHED)
+    else:
+        metrics.CACHE_LOOKUPS.inc(cache='summaries', result='miss')
+        summary = _summarize(all_pieces, len(messages))
+        _store(key, summary.text)
+    summary.elapsed = time.perf_counter() - started
+    metrics.SUMMARY_SECONDS.observe(summary.elapsed, path=summary.path)
+    return summary
+
+
+def _summarize(all_pieces, message_count):
+    # The newest cached summary of an earlier prefix, if the rest fits one update
+    new_tokens = 0
+    for i in range(len(all_pieces) - 1, 0, -1):
+        new_tokens += all_pieces[i].tokens
+        if new_tokens > SUMMARY_CHUNK_TOKENS:
+            break
+        previous = all_pieces[i - 1]
+        if previous.last and (earlier := _cached(('thread', previous.digest))) is not None:
+            summary = Summary('', message_count, 1, INCREMENTAL)
+            summary.text = _generate(UPDATE_PROMPT.format(
+                summary=earlier, messages=_join(p.text for p in all_pieces[i:])), summary)
+            return summary
+
+    chunks = chunked(all_pieces)
+    if len(chunks) == 1:
+        summary = Summary('', message_count, 1, SINGLE)
+        summary.text = _generate(SINGLE_PROMPT.format(messages=_join(p.text for p in chunks[0])), summary)
+        return summary
+
+    summary = Summary('', message_count, len(chunks), MAP_REDUCE)
+    summary.text = _reduce(_map(chunks, summary), summary)
+    return summary
+
+
+def summarize_email(service, msg_id):
+    """Summary of the thread an email belongs to (just the email if it has no thread), or None"""
+    detail = mail_service.get_email_detail(service, msg_id)
+    if detail is None:
+        return None
+    thread_id = detail.get('thread_id')
+    messages = mail_service.get_thread(service, thread_id) if thread_id else None
+    return summarize_thread(messages or [dict(detail, id=msg_id)])
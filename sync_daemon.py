@@ -0,0 +1,228 @@
+import argparse
+import asyncio
+import os
+import threading
+import time
+
+from googleapiclient.errors import HttpError
+
+import async_core
+import mail_service
+from mail_headers import HeaderIndex
+from mail_store import STORE, MailStore
+from scheduler import SYNC, priority
+
+# ────────────────────────────────────────────────
+# Background mailbox sync
+# ────────────────────────────────────────────────
+# One long-lived worker owns a Gmail connection and keeps mail_store up to
+# date, independent of Streamlit reruns:
+#   1. backfill the newest SYNC_BACKFILL messages of each SYNC_LABELS label,
+#   2. then every SYNC_INTERVAL seconds (or when woken by a UI write or a
+#      Pub/Sub push) replay history deltas since the stored historyId,
+#   3. keep bodies of the newest inbox messages so opening them is local.
+# SYNC_DAEMON=thread (default) runs it inside the Streamlit process;
+# SYNC_DAEMON=external expects `python sync_daemon.py` running as a
+# sidecar against the same MAILSTORE_PATH; SYNC_DAEMON=off disables it.
+
+SYNC_DAEMON = os.getenv('SYNC_DAEMON', 'thread')
+SYNC_INTERVAL = float(os.getenv('SYNC_INTERVAL', '15'))
+SYNC_BACKFILL = int(os.getenv('SYNC_BACKFILL', '500'))
+SYNC_LABELS = ('INBOX', 'SENT')
+PREFETCH_BODIES = 20
+HISTORY_MAX_PAGES = 20
+LIST_PAGE_SIZE = 100
+
+# Optional Pub/Sub pull subscription fed by setup_push_notifications()
+PUBSUB_SUBSCRIPTION = os.getenv('PUBSUB_SUBSCRIPTION')
+
+
+class SyncDaemon:
+    def __init__(self, store, gmail):
+        self.store = store
+        self.gmail = gmail
+
+    # ── fetching ─────────────────────────────────
+    async def _entry(self, msg_id):
+        msg_data = await self.gmail.call('messages.get', 'GET', f'/messages/{msg_id}', {'format': 'metadata'})
+        summary, label_ids = mail_service.summarize_metadata(msg_id, msg_data)
+        recipients = HeaderIndex(msg_data.get('payload', {}).get('headers', [])).recipients()
+        return summary, label_ids, int(msg_data.get('internalDate', 0)), msg_data.get('threadId'), recipients
+
+    async def _fetch(self, msg_ids):
+        """Metadata for messages, concurrently; ids that vanished are skipped"""
+        results = await asyncio.gather(*(self._entry(i) for i in msg_ids), return_exceptions=True)
+        entries = []
+        for result in results:
+            if isinstance(result, HttpError) and result.resp.status == 404:
+                continue
+            if isinstance(result, BaseException):
+                raise result
+            entries.append(result)
+        return entries
+
+    # ── sync phases ──────────────────────────────
+    async def backfill(self):
+        """Store the newest SYNC_BACKFILL messages of every synced label"""
+        history_id = await async_core.get_history_id(self.gmail)
+        for label in SYNC_LABELS:
+            page_token, seen = None, 0
+            while seen < SYNC_BACKFILL:
+                listing = await self.gmail.call('messages.list', 'GET', '/messages', {
+                    'labelIds': [label],
+                    'maxResults': min(LIST_PAGE_SIZE, SYNC_BACKFILL - seen),
+                    'pageToken': page_token,
+                })
+                ids = [m['id'] for m in listing.get('messages', [])]
+                seen += len(ids)
+                known = self.store.known_ids(ids)
+                missing = [i for i in ids if i not in known]
+                self.store.upsert(await self._fetch(missing))
+                page_token = listing.get('nextPageToken')
+                if not page_token:
+                    self.store.set_state(**{f'complete:{label}': 1})
+                    break
+        # Changes made while backfilling are replayed from here
+        self.store.set_state(history_id=history_id, email_address=mail_service.CACHE.email_address)
+
+    async def catch_up(self):
+        """Apply history since the stored historyId; backfill if there is none"""
+        start = self.store.get_state('history_id')
+        if start is None:
+            await self.backfill()
+            return
+        current = await async_core.get_history_id(self.gmail)
+        if current == start:
+            return
+
+        records, page_token = [], None
+        try:
+            for _ in range(HISTORY_MAX_PAGES):
+                response = await async_core.list_history(self.gmail, start, page_token)
+                records.extend(response.get('history', []))
+                page_token = response.get('nextPageToken')
+                if not page_token:
+                    break
+            else:
+                raise LookupError('too far behind')
+        except (HttpError, LookupError) as e:
+            # Expired startHistoryId (404) or a huge backlog: start over
+            if isinstance(e, HttpError) and e.resp.status != 404:
+                raise
+            self.store.clear()
+            await self.backfill()
+            return
+
+        await self.apply(records)
+        self.store.set_state(history_id=current)
+
+    async def apply(self, records):
+        added, deleted = [], set()
+        for record in records:
+            for item in record.get('messagesDeleted', []):
+                deleted.add(item['message']['id'])
+            for item in record.get('messagesAdded', []):
+                added.append(item['message']['id'])
+            for item in record.get('labelsAdded', []):
+                unknown = self.store.apply_labels([item['message']['id']], add_labels=item.get('labelIds', []))
+                # e.g. an old message moved back to the inbox
+                if set(item.get('labelIds', [])) & set(SYNC_LABELS):
+                    added.extend(unknown)
+            for item in record.get('labelsRemoved', []):
+                self.store.apply_labels([item['message']['id']], remove_labels=item.get('labelIds', []))
+
+        added = [i for i in dict.fromkeys(added) if i not in deleted]
+        if added:
+            self.store.upsert(await self._fetch(added))
+        if deleted:
+            self.store.delete(deleted)
+
+    async def prefetch_bodies(self):
+        for msg_id in self.store.ids_without_body('INBOX', PREFETCH_BODIES):
+            try:
+                detail = await async_core.get_email_detail(self.gmail, msg_id)
+            except HttpError as e:
+                if e.resp.status == 404:
+                    continue
+                raise
+            self.store.put_body(msg_id, detail['body'])
+
+    async def sync_once(self):
+        with priority(SYNC):
+            await self.catch_up()
+            await self.prefetch_bodies()
+        self.store.set_state(synced_at=time.time(), error=None)
+
+    async def run(self, wakeup, stop):
+        while not stop.is_set():
+            try:
+                await self.sync_once()
+            except Exception as e:
+                self.store.set_state(error=f'{type(e).__name__}: {e}')
+            await asyncio.to_thread(wakeup.wait, SYNC_INTERVAL)
+            wakeup.clear()
+
+
+# ── process-wide worker ─────────────────────────
+_worker = None
+_worker_lock = threading.Lock()
+_wakeup = threading.Event()
+
+
+def wake():
+    """Ask the daemon to sync now (after a UI write or a push notification)"""
+    _wakeup.set()
+
+
+def _subscribe_push():
+    from google.cloud import pubsub_v1
+
+    subscriber = pubsub_v1.SubscriberClient()
+
+    def on_message(message):
+        message.ack()
+        wake()
+    return subscriber.subscribe(PUBSUB_SUBSCRIPTION, callback=on_message)
+
+
+def _run(store, stop):
+    # The daemon's loop gets its own client; httpx clients are bound to one loop
+    gmail = async_core.new_gmail_client()
+    push = _subscribe_push() if PUBSUB_SUBSCRIPTION else None
+    try:
+        asyncio.run(SyncDaemon(store, gmail).run(_wakeup, stop))
+    finally:
+        if push:
+            push.cancel()
+
+
+def start(store=STORE):
+    """Start the in-process daemon once per process (unless SYNC_DAEMON says otherwise)"""
+    global _worker
+    if SYNC_DAEMON != 'thread':
+        return None
+    with _worker_lock:
+        if _worker is None or not _worker.is_alive():
+            stop = threading.Event()
+            _worker = threading.Thread(target=_run, args=(store, stop), name='sync-daemon', daemon=True)
+            _worker.stop = stop
+            _worker.start()
+    return _worker
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Keep the local mail store in sync with Gmail')
+    parser.add_argument('--store', default=None, help='SQLite path (default: MAILSTORE_PATH or mailstore.db)')
+    parser.add_argument('--once', action='store_true', help='sync once and exit')
+    args = parser.parse_args(argv)
+
+    store = MailStore(args.store) if args.store else STORE
+    if args.once:
+        asyncio.run(SyncDaemon(store, async_core.new_gmail_client()).sync_once())
+        print(store.status())
+        return
+    _run(store, threading.Event())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,26 @@
+import contacts
+
+
+def make_contact(address, name, score):
+    contact = contacts.Contact(address)
+    contact.name = name
+    contact.score = score
+    return contact
+
+
+def test_names_with_commas_are_quoted(monkeypatch):
+    index = contacts.ContactIndex([
+        make_contact('john.smith@corp.example', 'Smith, John', 2.0),
+        make_contact('alice.jones@corp.example', 'Alice Jones', 1.0),
+    ])
+    monkeypatch.setattr(contacts, 'index', lambda store=None: index)
+
+    value = contacts.expand_recipients('john, alice')
+    assert value == '"Smith, John" <john.smith@corp.example>, Alice Jones <alice.jones@corp.example>'
+    # Expanding again leaves the quoted name in one piece
+    assert contacts.expand_recipients(value) == value
+
+    completions = contacts.complete('"Smith, John" <john.smith@corp.example>, ali')
+    assert [text for _, text in completions] == [
+        '"Smith, John" <john.smith@corp.example>, Alice Jones <alice.jones@corp.example>']
+    assert contacts.complete(value) == []
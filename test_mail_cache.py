@@ -0,0 +1,115 @@
+import pytest
+
+from email_summary import EmailSummary
+from mail_cache import MailCache, canonical_query, query_labels
+
+
+def summary(msg_id, unread=False):
+    return EmailSummary(msg_id, f'Sender {msg_id} <{msg_id}@example.com>', f'Subject {msg_id}', '', 1_700_000_000, unread)
+
+
+def cache_with(listings, messages):
+    """A cache holding `listings` {(label, query): ids} over `messages` {id: labels}"""
+    cache = MailCache()
+    cache.clear(history_id='100')
+    for msg_id, labels in messages.items():
+        cache.put_message(summary(msg_id, 'UNREAD' in labels), labels)
+    for (label, query), (ids, limit) in listings.items():
+        cache.put_listing(label, query, None, ids, limit)
+    return cache
+
+
+def ids(cache, label, query, limit=20):
+    listing = cache.get_listing(label, query, None, limit)
+    return None if listing is None else [s.id for s in listing]
+
+
+@pytest.mark.parametrize('query, expected', [
+    ('', ''),
+    ('  is:unread   from:bob ', 'from:bob is:unread'),
+    ('from:bob is:unread', 'from:bob is:unread'),
+    ('IS:unread FROM:Bob', 'from:Bob is:unread'),
+    ('is:unread is:unread', 'is:unread'),
+    # Grouping, OR and negation keep their order
+    ('b OR a', 'b OR a'),
+    ('-from:bob is:unread', '-from:bob is:unread'),
+    ('{a b}', '{a b}'),
+])
+def test_canonical_query(query, expected):
+    assert canonical_query(query) == expected
+
+
+def test_query_labels():
+    assert query_labels('INBOX', 'is:unread from:bob') == {'INBOX', 'UNREAD'}
+    assert query_labels('INBOX', '') == {'INBOX'}
+    assert query_labels('INBOX', 'label:work') is None
+    assert query_labels('INBOX', 'a OR b') is None
+    assert query_labels('INBOX', 'is:snoozed') is None
+
+
+def test_listing_miss_when_asked_for_more_than_was_listed():
+    cache = cache_with({('INBOX', ''): (['a', 'b'], 2)}, {'a': {'INBOX'}, 'b': {'INBOX'}})
+    assert ids(cache, 'INBOX', '', 2) == ['a', 'b']
+    assert ids(cache, 'INBOX', '', 20) is None
+
+
+def test_read_flip_updates_summaries_in_place():
+    cache = cache_with({('INBOX', ''): (['a', 'b'], 20)}, {'a': {'INBOX', 'UNREAD'}, 'b': {'INBOX'}})
+    cache.apply_history([{'labelsRemoved': [{'message': {'id': 'a'}, 'labelIds': ['UNREAD']}]}], '101')
+    assert cache.history_id == '101'
+    assert ids(cache, 'INBOX', '') == ['a', 'b']
+    assert cache.get_message('a').unread is False
+
+
+def test_losing_a_label_removes_the_message_from_listings_that_need_it():
+    cache = cache_with({('INBOX', 'is:unread'): (['a', 'b'], 20), ('INBOX', ''): (['a', 'b'], 20)},
+                       {'a': {'INBOX', 'UNREAD'}, 'b': {'INBOX', 'UNREAD'}})
+    cache.apply_history([{'labelsRemoved': [{'message': {'id': 'a'}, 'labelIds': ['UNREAD']}]}], '101')
+    assert ids(cache, 'INBOX', 'is:unread') == ['b']
+    assert ids(cache, 'INBOX', '') == ['a', 'b']
+
+
+def test_full_listing_losing_a_message_is_dropped():
+    # The message after the last one listed is unknown, so it can't be shortened
+    cache = cache_with({('INBOX', ''): (['a', 'b'], 2)}, {'a': {'INBOX'}, 'b': {'INBOX'}})
+    cache.apply_history([{'messagesDeleted': [{'message': {'id': 'a'}}]}], '101')
+    assert ids(cache, 'INBOX', '', 2) is None
+
+
+def test_added_message_invalidates_only_listings_it_could_join():
+    cache = cache_with({('INBOX', ''): (['a'], 20), ('SENT', ''): (['s'], 20)}, {'a': {'INBOX'}, 's': {'SENT'}})
+    cache.apply_history([{'messagesAdded': [{'message': {'id': 'n', 'labelIds': ['INBOX', 'UNREAD']}}]}], '101')
+    assert ids(cache, 'INBOX', '') is None
+    assert ids(cache, 'SENT', '') == ['s']
+
+
+def test_added_label_invalidates_listings_depending_on_it():
+    cache = cache_with({('INBOX', 'is:starred'): (['a'], 20), ('SENT', ''): (['s'], 20)},
+                       {'a': {'INBOX', 'STARRED'}, 'b': {'INBOX'}, 's': {'SENT'}})
+    cache.apply_history([{'labelsAdded': [{'message': {'id': 'b'}, 'labelIds': ['STARRED']}]}], '101')
+    assert ids(cache, 'INBOX', 'is:starred') is None
+    assert ids(cache, 'SENT', '') == ['s']
+
+
+def test_opaque_queries_are_dropped_on_any_label_change():
+    cache = cache_with({('INBOX', 'label:work'): (['a'], 20)}, {'a': {'INBOX'}})
+    cache.apply_history([{'labelsRemoved': [{'message': {'id': 'a'}, 'labelIds': ['UNREAD']}]}], '101')
+    assert ids(cache, 'INBOX', 'label:work') is None
+
+
+def test_locally_inserted_message_survives_its_own_history_record():
+    cache = cache_with({('SENT', ''): (['s'], 20)}, {'s': {'SENT'}})
+    cache.insert_into_listing('SENT', summary('new'), ['SENT'])
+    assert ids(cache, 'SENT', '') == ['new', 's']
+    cache.apply_history([{'messagesAdded': [{'message': {'id': 'new', 'labelIds': ['SENT']}}]}], '101')
+    assert ids(cache, 'SENT', '') == ['new', 's']
+
+
+def test_label_stats_dropped_for_labels_a_change_touches():
+    cache = cache_with({}, {'a': {'INBOX', 'UNREAD'}})
+    cache.put_label_stats('INBOX', {'name': 'INBOX', 'total': 1, 'unread': 1})
+    cache.put_label_stats('SENT', {'name': 'SENT', 'total': 3, 'unread': 0})
+    cache.apply_history([{'labelsRemoved': [{'message': {'id': 'a', 'labelIds': ['INBOX']},
+                                             'labelIds': ['UNREAD']}]}], '101')
+    assert cache.get_label_stats('INBOX') is None
+    assert cache.get_label_stats('SENT') is not None
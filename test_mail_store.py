@@ -0,0 +1,121 @@
+import sqlite3
+import time
+from datetime import datetime
+
+import pytest
+
+from email_summary import EmailSummary
+from mail_headers import Sender
+from mail_store import MailStore, local_filter
+
+DAY_MS = 86_400_000
+JAN_10 = int(datetime(2026, 1, 10).timestamp() * 1000)
+
+
+@pytest.fixture
+def store(tmp_path):
+    return MailStore(str(tmp_path / 'mailstore.db'), max_age=60, enabled=True)
+
+
+def add(store, msg_id, internal_date, labels=('INBOX',), recipients=()):
+    summary = EmailSummary(msg_id, f'Sender {msg_id} <{msg_id}@example.com>', f'Subject {msg_id}', '',
+                           internal_date // 1000, 'UNREAD' in labels)
+    store.upsert([(summary, list(labels), internal_date, f't-{msg_id}', list(recipients))])
+
+
+def synced(store, complete=(), age=0.0):
+    store.set_state(history_id='100', synced_at=time.time() - age,
+                    **{f'complete:{label}': '1' for label in complete})
+
+
+@pytest.mark.parametrize('query, params', [
+    ('', []),
+    ('is:unread', [1]),
+    ('IS:READ', [0]),
+    ('is:unread after:2026/01/10', [1, JAN_10]),
+    ('before:2026/01/10', [JAN_10]),
+])
+def test_local_filter_translates_structural_queries(query, params):
+    assert local_filter(query)[1] == params
+
+
+@pytest.mark.parametrize('query', ['from:bob', 'invoice', 'subject:hi', 'is:starred', 'after:yesterday',
+                                   'is:unread from:bob'])
+def test_local_filter_leaves_everything_else_to_gmail(query):
+    assert local_filter(query) is None
+
+
+def test_unsynced_store_does_not_answer(store):
+    add(store, 'a', JAN_10)
+    assert store.list_emails() is None
+    store.set_state(history_id='100', **{'complete:INBOX': '1'})
+    # Backfilled but never stamped synced_at
+    assert store.list_emails() is None
+
+
+def test_complete_label_answers_short_results(store):
+    add(store, 'a', JAN_10, ('INBOX', 'UNREAD'))
+    add(store, 'b', JAN_10 + DAY_MS)
+    synced(store, complete=('INBOX',))
+    assert [s.id for s in store.list_emails()] == ['b', 'a']
+    assert [s.id for s in store.list_emails('INBOX', 'is:unread')] == ['a']
+    assert [s.id for s in store.list_emails('INBOX', 'after:2026/01/11')] == ['b']
+    assert store.list_emails('SENT') is None
+
+
+def test_partly_backfilled_label_answers_only_full_pages(store):
+    for i in range(3):
+        add(store, f'm{i}', JAN_10 + i * DAY_MS)
+    synced(store)
+    assert [s.id for s in store.list_emails(max_results=2)] == ['m2', 'm1']
+    # Fewer matches than asked for: older ones may be outside the backfill window
+    assert store.list_emails(max_results=5) is None
+    assert store.list_emails('INBOX', 'is:unread', max_results=1) is None
+
+
+def test_stale_store_does_not_answer(store):
+    add(store, 'a', JAN_10)
+    synced(store, complete=('INBOX',), age=120)
+    assert store.list_emails() is None
+    synced(store, complete=('INBOX',))
+    assert store.list_emails() is not None
+
+
+def test_store_with_sync_disabled_does_not_answer(tmp_path):
+    store = MailStore(str(tmp_path / 'mailstore.db'), max_age=60, enabled=False)
+    add(store, 'a', JAN_10)
+    synced(store, complete=('INBOX',))
+    assert store.list_emails() is None
+
+
+def test_label_changes_and_deletes(store):
+    add(store, 'a', JAN_10, ('INBOX', 'UNREAD'))
+    synced(store, complete=('INBOX', 'UNREAD'))
+    assert store.apply_labels(['a', 'missing'], remove_labels=['UNREAD', 'INBOX']) == ['missing']
+    assert store.list_emails() == []
+    store.delete(['a'])
+    assert store.known_ids(['a']) == set()
+
+
+def test_recipients_and_senders_for_contacts(store):
+    add(store, 'a', JAN_10, recipients=[Sender('Carol', 'carol@example.com')])
+    add(store, 's', JAN_10, ('SENT',), recipients=[Sender('Dan', 'dan@example.com')])
+    assert [row['id'] for row in store.inbox_senders()] == ['a']
+    sent = {row['address']: row['sent'] for row in store.recipients()}
+    assert sent == {'carol@example.com': 0, 'dan@example.com': 1}
+
+
+def test_old_schema_is_rebuilt(tmp_path):
+    path = str(tmp_path / 'mailstore.db')
+    conn = sqlite3.connect(path)
+    conn.execute('CREATE TABLE messages (id TEXT PRIMARY KEY, date TEXT NOT NULL)')
+    conn.execute("CREATE TABLE state (key TEXT PRIMARY KEY, value TEXT)")
+    conn.execute("INSERT INTO state VALUES ('history_id', '5')")
+    conn.commit()
+    conn.close()
+
+    store = MailStore(path, max_age=60, enabled=True)
+    # The old sync state goes too, so the daemon backfills from scratch
+    assert store.get_state('history_id') is None
+    add(store, 'a', JAN_10)
+    assert store.known_ids(['a']) == {'a'}
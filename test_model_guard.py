@@ -0,0 +1,136 @@
+import time
+
+import pytest
+
+from model_backend import FakeModel, FakeModelError
+from model_guard import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpenError, ModelGuard, ModelTimeoutError
+
+PROMPT = 'Command: "show unread emails"'
+
+
+class SlowFirstModel(FakeModel):
+    """The first call stalls for `stall_s`; later ones answer at once"""
+
+    def __init__(self, stall_s, **kwargs):
+        super().__init__(**kwargs)
+        self.stall_s = stall_s
+        self.stalled = False
+
+    def generate_content(self, prompt, generation_config=None, stream=False, **kwargs):
+        if not self.stalled:
+            self.stalled = True
+            time.sleep(self.stall_s)
+        return super().generate_content(prompt, generation_config, stream, **kwargs)
+
+
+def guard_for(model, threshold=2, cooldown=60.0, **kwargs):
+    return ModelGuard(model, breaker=CircuitBreaker(threshold, cooldown), **kwargs)
+
+
+def test_answer_is_parsed_and_counted():
+    guard = guard_for(FakeModel())
+    response, parsed = guard.generate(PROMPT, parse=lambda r: r.text)
+    assert '"filter_inbox"' in parsed
+    stats = guard.stats()
+    assert stats['ok'] == 1 and stats['calls'] == 1 and stats['circuit'] == CLOSED
+
+
+def test_deadline_raises_without_waiting_for_the_model():
+    guard = guard_for(FakeModel(latency_ms=2000), deadline=0.1, hedge=False)
+    started = time.monotonic()
+    with pytest.raises(ModelTimeoutError):
+        guard.generate(PROMPT)
+    assert time.monotonic() - started < 1.0
+    assert guard.stats()['timeouts'] == 1
+
+
+def test_slow_attempt_is_hedged_and_the_hedge_wins():
+    guard = guard_for(SlowFirstModel(stall_s=2.0), deadline=5.0)
+    # Enough history for a p95 (hedging starts after max(0.25 s, p95))
+    guard.latencies.extend([0.01] * 10)
+    started = time.monotonic()
+    guard.generate(PROMPT, parse=lambda r: r.text)
+    assert time.monotonic() - started < 1.5
+    stats = guard.stats()
+    assert stats['hedged'] == 1 and stats['hedge_wins'] == 1
+
+
+def test_no_hedge_without_enough_history_or_when_disabled():
+    assert guard_for(FakeModel()).hedge_delay() is None
+    guard = guard_for(FakeModel(), hedge=False)
+    guard.latencies.extend([0.01] * 10)
+    assert guard.hedge_delay() is None
+
+
+def test_circuit_opens_after_consecutive_failures_and_fails_fast():
+    model = FakeModel(error_rate=1.0)
+    guard = guard_for(model, threshold=2)
+    for _ in range(2):
+        with pytest.raises(FakeModelError):
+            guard.generate(PROMPT)
+    assert guard.breaker.state == OPEN
+    with pytest.raises(CircuitOpenError):
+        guard.generate(PROMPT)
+    assert model.calls == 2
+    assert guard.stats()['rejected'] == 1
+
+
+def test_probe_after_cooldown_closes_or_reopens_the_circuit():
+    model = FakeModel(error_rate=1.0)
+    guard = guard_for(model, threshold=1, cooldown=0.05)
+    with pytest.raises(FakeModelError):
+        guard.generate(PROMPT)
+    time.sleep(0.06)
+    # Failed probe: open again for another cooldown
+    with pytest.raises(FakeModelError):
+        guard.generate(PROMPT)
+    assert guard.breaker.state == OPEN
+    with pytest.raises(CircuitOpenError):
+        guard.generate(PROMPT)
+
+    time.sleep(0.06)
+    model.error_rate = 0.0
+    guard.generate(PROMPT)
+    assert guard.breaker.state == CLOSED
+
+
+def test_only_one_probe_while_half_open():
+    breaker = CircuitBreaker(failure_threshold=1, cooldown=0.0)
+    breaker.record_failure()
+    assert breaker.allow()
+    assert breaker.state == HALF_OPEN
+    assert not breaker.allow()
+
+
+def test_garbled_answer_does_not_open_the_circuit():
+    guard = guard_for(FakeModel(), threshold=1)
+
+    def parse(response):
+        raise ValueError('not a command')
+
+    with pytest.raises(ValueError):
+        guard.generate(PROMPT, parse=parse)
+    assert guard.breaker.state == CLOSED
+    assert guard.stats()['errors'] == 1
+
+
+def test_probe_ending_in_an_on_chunk_error_still_settles_the_breaker():
+    guard = guard_for(FakeModel(), threshold=1, cooldown=0.0)
+    guard.breaker.record_failure()
+
+    def on_chunk(chunk):
+        raise RuntimeError('callback failed')
+
+    with pytest.raises(RuntimeError):
+        guard.generate(PROMPT, stream=True, on_chunk=on_chunk)
+    assert guard.breaker.state == OPEN
+    # Not stuck half-open: the next probe goes out
+    guard.generate(PROMPT)
+    assert guard.breaker.state == CLOSED
+
+
+def test_streamed_chunks_reach_on_chunk_in_order():
+    guard = guard_for(FakeModel())
+    chunks = []
+    response, _ = guard.generate(PROMPT, stream=True, on_chunk=lambda c: chunks.append(c.text))
+    assert ''.join(chunks) == response.text
@@ -0,0 +1,169 @@
+import http.client
+import socket
+import time
+
+import httplib2
+import pytest
+from google.auth.exceptions import RefreshError
+from googleapiclient.errors import HttpError
+
+import mail_service
+import outbox
+from benchmarks.common import FakeGmailProcess
+from mail_store import STORE
+
+
+@pytest.fixture(autouse=True)
+def outbox_db(tmp_path, monkeypatch):
+    monkeypatch.setattr(outbox, 'OUTBOX_PATH', str(tmp_path / 'outbox.db'))
+    conn = outbox._connect()
+    yield conn
+    conn.close()
+
+
+@pytest.fixture(scope='module')
+def gmail_service():
+    with FakeGmailProcess(size=50) as server:
+        with pytest.MonkeyPatch.context() as mp:
+            mp.setenv('GMAIL_API_ENDPOINT', server.url)
+            yield mail_service.get_gmail_service()
+
+
+def http_error(status):
+    return HttpError(httplib2.Response({'status': status}), b'{}')
+
+
+def status(outbox_id):
+    return outbox.statuses([outbox_id])[outbox_id]
+
+
+def deliver_next(conn, service=None, owner='me'):
+    row = outbox._claim_next(conn, owner)
+    assert row is not None
+    outbox._deliver(conn, service, row)
+    return row
+
+
+def failing_with(error):
+    def deliver(service, to, subject, body, on_sent=None):
+        raise error
+    return deliver
+
+
+def test_queued_message_is_sent(outbox_db, gmail_service, monkeypatch, tmp_path):
+    monkeypatch.setattr(STORE, 'path', str(tmp_path / 'mailstore.db'))
+    outbox_id = outbox.enqueue('carol@example.com', 'Hello', 'Hi Carol')
+    assert status(outbox_id)['status'] == outbox.QUEUED
+    assert outbox.queue_depth() == 1
+
+    deliver_next(outbox_db, gmail_service)
+    row = status(outbox_id)
+    assert row['status'] == outbox.SENT
+    assert row['attempts'] == 1 and row['message_id']
+    assert outbox.queue_depth() == 0
+
+
+def test_claimed_row_is_sending_and_leased(outbox_db):
+    outbox_id = outbox.enqueue('a@example.com', 's', 'b')
+    outbox._claim_next(outbox_db, 'me')
+    row = outbox_db.execute('SELECT * FROM outbox WHERE id = ?', (outbox_id,)).fetchone()
+    assert row['status'] == outbox.SENDING
+    assert row['owner'] == 'me' and row['lease_until'] > time.time()
+    assert outbox._claim_next(outbox_db, 'me') is None
+
+
+@pytest.mark.parametrize('error', [
+    http_error(429),
+    RefreshError('token expired'),
+    socket.gaierror('name resolution failed'),
+    ConnectionRefusedError(),
+])
+def test_errors_before_sending_are_retried(outbox_db, monkeypatch, error):
+    monkeypatch.setattr(outbox, 'deliver_email', failing_with(error))
+    outbox_id = outbox.enqueue('a@example.com', 's', 'b')
+    deliver_next(outbox_db)
+    row = status(outbox_id)
+    assert row['status'] == outbox.QUEUED and row['attempts'] == 1
+
+
+@pytest.mark.parametrize('error', [
+    http_error(503),
+    TimeoutError('timed out'),
+    ConnectionResetError(),
+    http.client.RemoteDisconnected('closed'),
+    httplib2.HttpLib2Error('bad response'),
+])
+def test_errors_after_the_request_may_have_gone_out_go_to_review(outbox_db, monkeypatch, error):
+    monkeypatch.setattr(outbox, 'deliver_email', failing_with(error))
+    outbox_id = outbox.enqueue('a@example.com', 's', 'b')
+    deliver_next(outbox_db)
+    row = status(outbox_id)
+    assert row['status'] == outbox.REVIEW
+    assert 'check Sent' in row['error']
+
+
+@pytest.mark.parametrize('error', [http_error(400), ValueError('bad address')])
+def test_other_errors_fail(outbox_db, monkeypatch, error):
+    monkeypatch.setattr(outbox, 'deliver_email', failing_with(error))
+    outbox_id = outbox.enqueue('a@example.com', 's', 'b')
+    deliver_next(outbox_db)
+    assert status(outbox_id)['status'] == outbox.FAILED
+
+
+def test_retries_stop_after_max_attempts(outbox_db, monkeypatch):
+    monkeypatch.setattr(outbox, 'deliver_email', failing_with(http_error(429)))
+    outbox_id = outbox.enqueue('a@example.com', 's', 'b')
+    for _ in range(outbox.MAX_ATTEMPTS):
+        # Due now, whatever backoff was picked
+        outbox_db.execute('UPDATE outbox SET next_attempt_at = 0')
+        outbox_db.commit()
+        deliver_next(outbox_db)
+    row = status(outbox_id)
+    assert row['status'] == outbox.FAILED and row['attempts'] == outbox.MAX_ATTEMPTS
+
+
+def test_accepted_message_stays_sent_when_recording_it_fails(outbox_db, monkeypatch):
+    def deliver(service, to, subject, body, on_sent=None):
+        on_sent('msg-1')
+        raise RuntimeError('after Gmail accepted it')
+
+    monkeypatch.setattr(outbox, 'deliver_email', deliver)
+    outbox_id = outbox.enqueue('a@example.com', 's', 'b')
+    deliver_next(outbox_db)
+    row = status(outbox_id)
+    assert row['status'] == outbox.SENT and row['message_id'] == 'msg-1'
+
+
+def test_only_rows_with_an_expired_lease_are_reclaimed(outbox_db):
+    live = outbox.enqueue('a@example.com', 's', 'b')
+    outbox._claim_next(outbox_db, 'other-worker')
+    stale = outbox.enqueue('b@example.com', 's', 'b')
+    outbox._claim_next(outbox_db, 'dead-worker')
+    outbox_db.execute('UPDATE outbox SET lease_until = ? WHERE id = ?', (time.time() - 1, stale))
+    outbox_db.commit()
+
+    outbox._reclaim_expired(outbox_db)
+    assert status(live)['status'] == outbox.SENDING
+    assert status(stale)['status'] == outbox.REVIEW
+
+
+def test_renewing_keeps_a_lease_alive(outbox_db):
+    outbox_id = outbox.enqueue('a@example.com', 's', 'b')
+    outbox._claim_next(outbox_db, 'me')
+    outbox_db.execute('UPDATE outbox SET lease_until = ?', (time.time() - 1,))
+    outbox_db.commit()
+    outbox._renew_leases(outbox_db, 'me')
+    outbox._reclaim_expired(outbox_db)
+    assert status(outbox_id)['status'] == outbox.SENDING
+
+
+def test_old_outbox_files_get_the_lease_columns(tmp_path):
+    path = str(tmp_path / 'old.db')
+    conn = outbox._connect(path)
+    conn.execute('DROP TABLE outbox')
+    conn.execute(outbox._SCHEMA.replace('    owner TEXT,\n    lease_until REAL,\n', ''))
+    conn.close()
+    conn = outbox._connect(path)
+    columns = {row['name'] for row in conn.execute('PRAGMA table_info(outbox)')}
+    assert {'owner', 'lease_until'} <= columns
+    conn.close()
@@ -0,0 +1,71 @@
+import pytest
+
+from partial_json import PartialStr, StreamingCommand, is_complete, parse_partial
+
+COMMAND = '{"action": "compose", "params": {"to": "carol@example.com", "subject": "Hi \\"there\\"", "cc": [1, 2]}}'
+
+
+def test_every_prefix_of_a_command_parses():
+    for end in range(len(COMMAND) + 1):
+        value = parse_partial(COMMAND[:end])
+        assert value is None or isinstance(value, dict)
+    assert parse_partial(COMMAND) == {'action': 'compose', 'params': {
+        'to': 'carol@example.com', 'subject': 'Hi "there"', 'cc': [1, 2]}}
+
+
+def test_truncated_values():
+    value = parse_partial('{"action": "compose", "params": {"to": "car')
+    assert value == {'action': 'compose', 'params': {'to': 'car'}}
+    assert isinstance(value['params']['to'], PartialStr)
+    assert not is_complete(value)
+    # Numbers and literals that may still grow are left out
+    assert parse_partial('{"a": 1, "b": tr') == {'a': 1}
+    assert parse_partial('{"a": 12') == {}
+    assert parse_partial('{"a": "\\u00') == {'a': ''}
+
+
+@pytest.mark.parametrize('text', [
+    '[}',
+    '[[}]]',
+    '{"action":"x","params":{"a":[1,2}',
+    '{"a": [}, "b": 1}',
+    '{"a": ]}',
+    '}{][',
+    '{"a": "\\uzzzz"}',
+    '{:}',
+    '[,,,]',
+])
+def test_garbled_and_mismatched_input_returns(text):
+    # Must return (not hang or raise) whatever the model streamed
+    parse_partial(text)
+
+
+def test_mismatched_bracket_keeps_what_was_read():
+    assert parse_partial('{"action":"x","params":{"a":[1,2}') == {'action': 'x', 'params': {'a': [1, 2]}}
+    assert parse_partial('[}') == []
+
+
+def test_invalid_unicode_escape_stays_partial():
+    value = parse_partial('{"action": "a\\uzz12b"}')
+    assert value == {'action': 'a'}
+    assert not is_complete(value)
+    assert parse_partial('"a\\uzz12b"') == 'a'
+    assert isinstance(parse_partial('"a\\uzz12b"'), PartialStr)
+
+
+def test_streaming_command_reports_action_then_params():
+    seen = []
+    command = StreamingCommand(on_action=lambda a: seen.append(('action', a)),
+                               on_params=lambda p: seen.append(('params', dict(p))))
+    for i in range(0, len(COMMAND), 7):
+        command.feed(COMMAND[i:i + 7])
+    assert seen[0] == ('action', 'compose')
+    assert seen[-1][1]['cc'] == [1, 2]
+    assert command.result()['params']['to'] == 'carol@example.com'
+
+
+def test_streaming_command_result_rejects_garbled_json():
+    command = StreamingCommand()
+    command.feed('{"action": "x", "params": {"a": [1, 2}')
+    with pytest.raises(ValueError):
+        command.result()
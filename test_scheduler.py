@@ -0,0 +1,178 @@
+import asyncio
+import threading
+import time
+
+import httplib2
+import pytest
+from googleapiclient.errors import HttpError
+
+import scheduler
+from scheduler import INTERACTIVE, PREFETCH, RequestScheduler
+
+
+class FakeRequest:
+    """Stands in for a googleapiclient HttpRequest"""
+
+    def __init__(self, method='messages.get', results=(), gate=None, on_execute=None):
+        self.methodId = f'gmail.users.{method}'
+        self.results = list(results)
+        self.gate = gate
+        self.on_execute = on_execute
+        self.executed = 0
+
+    def execute(self):
+        self.executed += 1
+        if self.on_execute:
+            self.on_execute()
+        if self.gate:
+            self.gate.wait(5)
+        result = self.results.pop(0) if self.results else 'ok'
+        if isinstance(result, BaseException):
+            raise result
+        return result
+
+
+def http_error(status):
+    return HttpError(httplib2.Response({'status': status}), b'{}')
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, 'timed out'
+        time.sleep(0.005)
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(scheduler, 'BACKOFF_BASE', 0.0)
+
+
+def test_interactive_requests_overtake_queued_prefetch():
+    sched = RequestScheduler(initial_concurrency=1, max_concurrency=1)
+    gate, order = threading.Event(), []
+    holder = threading.Thread(target=sched.execute, args=(FakeRequest(gate=gate),))
+    holder.start()
+    wait_for(lambda: sched.in_flight == 1)
+
+    def run(name, level):
+        sched.execute(FakeRequest(on_execute=lambda: order.append(name)), level=level)
+
+    waiters = [threading.Thread(target=run, args=('prefetch', PREFETCH))]
+    waiters[0].start()
+    wait_for(lambda: len(sched._waiting) == 1)
+    waiters.append(threading.Thread(target=run, args=('interactive', INTERACTIVE)))
+    waiters[1].start()
+    wait_for(lambda: len(sched._waiting) == 2)
+
+    gate.set()
+    for thread in [holder] + waiters:
+        thread.join(5)
+    assert order == ['interactive', 'prefetch']
+    assert sched.in_flight == 0
+
+
+def test_token_bucket_delays_requests_over_budget():
+    sched = RequestScheduler(rate=1000, burst=100)
+    sched.execute(FakeRequest('messages.send'))
+    started = time.monotonic()
+    sched.execute(FakeRequest('messages.send'))
+    # 100 units at 1000/s
+    assert time.monotonic() - started >= 0.08
+    assert sched.units['messages.send'] == 200
+
+
+def test_throttling_halves_concurrency_and_success_adds_back():
+    sched = RequestScheduler(initial_concurrency=4)
+    request = FakeRequest(results=[http_error(429), 'done'])
+    assert sched.execute(request) == 'done'
+    assert request.executed == 2
+    assert sched.throttled['messages.get'] == 1
+    # 4 / 2, then + 1 / 2
+    assert sched.limit == pytest.approx(2.5)
+    assert sched.in_flight == 0
+
+
+def test_concurrency_never_drops_below_minimum():
+    sched = RequestScheduler(initial_concurrency=1, min_concurrency=1)
+    with pytest.raises(HttpError):
+        sched.execute(FakeRequest(results=[http_error(503)] * (scheduler.MAX_RETRIES + 1)))
+    assert sched.limit == 1
+    assert sched.in_flight == 0
+
+
+def test_send_is_not_retried_on_server_error():
+    sched = RequestScheduler()
+    request = FakeRequest('messages.send', results=[http_error(503), 'sent'])
+    with pytest.raises(HttpError):
+        sched.execute(request)
+    assert request.executed == 1
+    assert sched.in_flight == 0
+
+
+def test_client_errors_are_not_retried():
+    sched = RequestScheduler()
+    request = FakeRequest(results=[http_error(404)])
+    with pytest.raises(HttpError):
+        sched.execute(request)
+    assert request.executed == 1
+
+
+def test_slot_returned_when_a_base_exception_interrupts_the_request():
+    # Streamlit's StopException / RerunException are BaseExceptions
+    class Rerun(BaseException):
+        pass
+
+    sched = RequestScheduler(initial_concurrency=1, max_concurrency=1)
+    with pytest.raises(Rerun):
+        sched.execute(FakeRequest(results=[Rerun()]))
+    assert sched.in_flight == 0
+    assert sched.limit == 1
+    assert sched.execute(FakeRequest()) == 'ok'
+
+
+def test_cancelled_async_request_returns_its_slot():
+    sched = RequestScheduler()
+
+    async def main():
+        started = asyncio.Event()
+
+        async def send():
+            started.set()
+            await asyncio.sleep(10)
+
+        task = asyncio.create_task(sched.aexecute(send, 'messages.get'))
+        await started.wait()
+        assert sched.in_flight == 1
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(main())
+    assert sched.in_flight == 0
+
+
+def test_request_cancelled_while_waiting_for_admission_returns_the_slot_it_gets():
+    sched = RequestScheduler(initial_concurrency=1, max_concurrency=1)
+    gate = threading.Event()
+    holder = threading.Thread(target=sched.execute, args=(FakeRequest(gate=gate),))
+    holder.start()
+    wait_for(lambda: sched.in_flight == 1)
+
+    async def main():
+        async def send():
+            return 'never'
+
+        task = asyncio.create_task(sched.aexecute(send, 'messages.get'))
+        await asyncio.sleep(0.05)
+        assert len(sched._waiting) == 1
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        gate.set()
+        # The admission thread is given the slot after the holder finishes, then hands it back
+        await asyncio.to_thread(holder.join, 5)
+        await asyncio.to_thread(wait_for, lambda: sched.in_flight == 0 and not sched._waiting)
+
+    asyncio.run(main())
+    assert sched.in_flight == 0
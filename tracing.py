@@ -0,0 +1,200 @@
+import contextlib
+import contextvars
+import functools
+import json
+import os
+import secrets
+import threading
+import time
+
+# ────────────────────────────────────────────────
+# Lightweight tracing spans
+# ────────────────────────────────────────────────
+# A trace is one user command: parse, every Gmail call, MIME decoding and
+# the view render that follows. Spans nest through a context variable and
+# are exported in the OpenTelemetry JSON shape (one span per line) to
+# TRACE_FILE when it is set.
+#
+#   with tracing.trace('command', text=cmd) as t:
+#       with tracing.span('parse_command'):
+#           ...
+
+TRACE_FILE = os.getenv('TRACE_FILE')
+
+_current_trace = contextvars.ContextVar('current_trace', default=None)
+_current_span = contextvars.ContextVar('current_span', default=None)
+_export_lock = threading.Lock()
+
+
+class Span:
+    __slots__ = ('trace_id', 'span_id', 'parent_id', 'name', 'start_ns', 'end_ns',
+                 'attributes', 'error', '_start_perf')
+
+    def __init__(self, trace_id, parent_id, name, attributes):
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.name = name
+        self.attributes = attributes
+        self.error = None
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self._start_perf = time.perf_counter_ns()
+
+    def end(self):
+        self.end_ns = self.start_ns + (time.perf_counter_ns() - self._start_perf)
+
+    @property
+    def duration_ms(self):
+        return ((self.end_ns or time.time_ns()) - self.start_ns) / 1e6
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def to_otel(self):
+        """OpenTelemetry (OTLP/JSON) span representation"""
+        return {
+            'traceId': self.trace_id,
+            'spanId': self.span_id,
+            'parentSpanId': self.parent_id or '',
+            'name': self.name,
+            'startTimeUnixNano': str(self.start_ns),
+            'endTimeUnixNano': str(self.end_ns or self.start_ns),
+            'attributes': [{'key': k, 'value': _otel_value(v)} for k, v in self.attributes.items()],
+            'status': {'code': 2, 'message': self.error} if self.error else {'code': 1},
+        }
+
+
+def _otel_value(value):
+    if isinstance(value, bool):
+        return {'boolValue': value}
+    if isinstance(value, int):
+        return {'intValue': str(value)}
+    if isinstance(value, float):
+        return {'doubleValue': value}
+    return {'stringValue': str(value)}
+
+
+class Trace:
+    """All spans recorded for one command, possibly across reruns"""
+
+    def __init__(self, name, **attributes):
+        self.trace_id = secrets.token_hex(16)
+        self.spans = []
+        self.lock = threading.Lock()
+        self.root = self._new_span(name, None, attributes)
+
+    def _new_span(self, name, parent_id, attributes):
+        span = Span(self.trace_id, parent_id, name, attributes)
+        with self.lock:
+            self.spans.append(span)
+        return span
+
+    def finish(self):
+        """Stretch the root span over everything recorded and export the trace"""
+        if self.root.end_ns is None:
+            self.root.end()
+        with self.lock:
+            self.root.end_ns = max(s.end_ns or s.start_ns for s in self.spans)
+        export(self.spans)
+
+    def waterfall(self):
+        """[(depth, offset ms, duration ms, span)] in start order"""
+        depth = {self.root.span_id: 0}
+        rows = []
+        for span in sorted(self.spans, key=lambda s: s.start_ns):
+            level = depth.get(span.parent_id, -1) + 1 if span.parent_id else 0
+            depth[span.span_id] = level
+            rows.append((level, (span.start_ns - self.root.start_ns) / 1e6, span.duration_ms, span))
+        return rows
+
+
+def export(spans):
+    if not TRACE_FILE:
+        return
+    lines = ''.join(json.dumps(span.to_otel()) + '\n' for span in spans if span.end_ns)
+    with _export_lock, open(TRACE_FILE, 'a', encoding='utf-8') as f:
+        f.write(lines)
+
+
+@contextlib.contextmanager
+def trace(name, **attributes):
+    """Start a new trace whose root span covers the block"""
+    t = Trace(name, **attributes)
+    trace_token = _current_trace.set(t)
+    span_token = _current_span.set(t.root)
+    try:
+        yield t
+    except BaseException as e:
+        t.root.error = t.root.error or _error_text(e)
+        raise
+    finally:
+        t.root.end()
+        _current_span.reset(span_token)
+        _current_trace.reset(trace_token)
+
+
+@contextlib.contextmanager
+def resume(t):
+    """Continue an earlier trace (e.g. to add the render after a rerun)"""
+    trace_token = _current_trace.set(t)
+    span_token = _current_span.set(t.root)
+    try:
+        yield t
+    finally:
+        _current_span.reset(span_token)
+        _current_trace.reset(trace_token)
+
+
+@contextlib.contextmanager
+def span(name, **attributes):
+    """Record a child span of the current span; a no-op outside a trace"""
+    t = _current_trace.get()
+    if t is None:
+        yield None
+        return
+    parent = _current_span.get()
+    s = t._new_span(name, parent.span_id if parent else None, attributes)
+    token = _current_span.set(s)
+    try:
+        yield s
+    except BaseException as e:
+        s.error = _error_text(e)
+        raise
+    finally:
+        s.end()
+        _current_span.reset(token)
+
+
+def _error_text(error):
+    # Streamlit's rerun/stop are control flow, not failures
+    if type(error).__name__ in ('RerunException', 'StopException'):
+        return None
+    return f'{type(error).__name__}: {error}'
+
+
+def traced(name=None):
+    """Decorator form of span()"""
+    def decorate(fn):
+        span_name = name or fn.__name__
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(span_name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def format_waterfall(t, width=24):
+    """Text waterfall for the sidebar: one line per span"""
+    total = max(t.root.duration_ms, 0.001)
+    lines = []
+    for depth, offset, duration, s in t.waterfall():
+        start = int(offset / total * width)
+        length = max(1, int(duration / total * width))
+        bar = ' ' * start + '█' * min(length, width - start)
+        label = ('  ' * depth + s.name)[:28]
+        flag = ' ⚠' if s.error else ''
+        lines.append(f'{label:28} |{bar:{width}}| {duration:8.1f} ms{flag}')
+    return '\n'.join(lines)
@@ -0,0 +1,42 @@
+import os
+
+import streamlit.components.v1 as components
+
+# ────────────────────────────────────────────────
+# Voice input component
+# ────────────────────────────────────────────────
+# Browser speech recognition in a bidirectional custom component
+# (voice_component/index.html). Each recognized utterance comes back as
+# the component value on the running session instead of reloading the
+# page with a query param; Python sends the outcome of the last command
+# back as `status`.
+#
+# With a server recognizer (speech.py, STT_BACKEND) the component runs in
+# "server" mode instead: it streams 16 kHz PCM chunks as the value and
+# Python acknowledges them through `ack`; unacknowledged chunks are sent
+# again with the next value, so a dropped rerun loses no audio.
+#
+# With `interim` the browser also sends {'id', 'partial'} while the user is
+# still speaking, for speculation.py to start fetching early.
+
+_component = components.declare_component(
+    'voice_input',
+    path=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'voice_component'),
+)
+
+
+def voice_input(status=None, handled=None, lang='en-US', mode='browser', ack=None, interim=False,
+                key='voice', height=100):
+    """
+    Render the voice button; returns {'text', 'id', 'heard_at'} for the
+    latest utterance (or None). The value persists across reruns, so
+    callers handle each `id` once and pass it back as `handled`, which
+    re-arms the button and shows `status`.
+
+    In server mode the value is {'id', 'chunks': [[seq, base64 PCM]],
+    'stopped'}; pass {'id', 'seq', 'done', 'partial'} back as `ack`.
+    Browser mode with `interim` also returns {'id', 'partial'} values
+    before the final one.
+    """
+    return _component(status=status, handled=handled, lang=lang, mode=mode, ack=ack, interim=interim,
+                      key=key, default=None, height=height)